@@ -1,13 +1,29 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Text, DateTime
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, Float, Text, DateTime, LargeBinary
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import datetime
+import os
+import time
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./resume_polisher.db"
+# 容器中通过 DATABASE_URL 指向挂载的数据目录（WAL 模式会在同目录生成 -wal/-shm 文件）
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./resume_polisher.db")
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    # 多 worker 共享同一个 SQLite 文件：WAL 允许读写并发，busy_timeout 让写锁冲突时等待而不是直接报错
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    # 删除数据后空闲页可以分批归还（新建的数据库立即生效，已有数据库由维护任务 VACUUM 一次后生效）
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -19,10 +35,150 @@ class AnalysisRecord(Base):
     filename = Column(String, index=True)
     job_description_snippet = Column(String)
     match_score = Column(Integer)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class AnalysisDailyStats(Base):
+    """analysis_records 的按天汇总；原始记录过了保留期被清理后，历史统计仍然可查"""
+    __tablename__ = "analysis_daily_stats"
+
+    day = Column(String, primary_key=True)  # YYYY-MM-DD（UTC）
+    total = Column(Integer, default=0)
+    scored = Column(Integer, default=0)     # 有匹配度评分的记录数
+    score_sum = Column(Integer, default=0)
+    score_min = Column(Integer)
+    score_max = Column(Integer)
+    score_histogram = Column(Text)          # JSON: 10 个区间（0-9, 10-19, ..., 90-100）的记录数
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class SharedStateEntry(Base):
+    """跨 worker 共享的缓存条目（分析结果、OCR 能力探测等）"""
+    __tablename__ = "shared_state"
+
+    key = Column(String, primary_key=True)
+    value = Column(Text)
+    expires_at = Column(Float, index=True)  # Unix 时间戳，NULL 表示不过期
+
+class RateLimitCounter(Base):
+    """跨 worker 共享的固定窗口限流计数"""
+    __tablename__ = "rate_limit_counters"
+
+    key = Column(String, primary_key=True)
+    window_start = Column(Integer, primary_key=True)
+    count = Column(Integer, default=0)
+
+class JobDescriptionEntry(Base):
+    """
+    JD 近似去重索引中的一条 JD
+
+    canonical_id 为空的是规范 JD，带有 MinHash 签名；近似重复的变体记录文本哈希并指向规范 JD，
+    再次出现时无需重新计算签名。每条记录都保存从自身文本提取的 JD 产物（要求、关键词、精简版）。
+    """
+    __tablename__ = "job_descriptions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    text_hash = Column(String, unique=True, index=True)  # 规范化文本的 sha256
+    canonical_id = Column(Integer, index=True)
+    signature = Column(LargeBinary)
+    artifacts = Column(Text)  # JSON
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
+class JobDescriptionBucket(Base):
+    """MinHash LSH 分桶：band 编号 + 该 band 的哈希 -> 规范 JD"""
+    __tablename__ = "jd_lsh_buckets"
+
+    bucket = Column(String, primary_key=True)
+    jd_id = Column(Integer, primary_key=True)
+
+class ContractAnalysisRecord(Base):
+    """合同分析记录；保存条款和分析结果，修订版可据此只重新分析改动的条款"""
+    __tablename__ = "contract_analyses"
+
+    id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String)
+    contract_type = Column(String, index=True)
+    text_hash = Column(String, index=True)  # 合同文本的 sha256，按上一版本文件查找记录
+    clauses = Column(Text)                  # JSON: [{clause_id, title, text}]
+    analysis = Column(Text)                 # JSON
+    previous_id = Column(Integer)           # 增量分析时的上一版本记录
+    revision_token = Column(String)         # 随机令牌，只有持有者才能以本记录为上一版本做修订对比
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class ContractTemplate(Base):
+    """
+    合同模板指纹：同一类型合同中反复出现的一组条款
+
+    条款哈希存放在 contract_template_clauses 中；summary 保存模板的合同概况和整体性条目，
+    合同的全部条款都已知时直接使用。
+    """
+    __tablename__ = "contract_templates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    contract_type = Column(String, index=True)
+    name = Column(String)
+    clause_count = Column(Integer, default=0)
+    summary = Column(Text)  # JSON: {contract_summary, risks, plain_explanations, suggestions}（只含整体性条目）
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class ContractTemplateClause(Base):
+    """模板包含的条款：模板编号 + 条款内容哈希"""
+    __tablename__ = "contract_template_clauses"
+
+    template_id = Column(Integer, primary_key=True)
+    clause_hash = Column(String, primary_key=True, index=True)
+
+class ContractClauseEntry(Base):
+    """预先算好的单个条款的分析条目，按合同类型 + 条款内容哈希索引"""
+    __tablename__ = "contract_clause_library"
+
+    contract_type = Column(String, primary_key=True)
+    clause_hash = Column(String, primary_key=True)
+    title = Column(String)
+    items = Column(Text)  # JSON: {risks, plain_explanations, suggestions}，clause_id 留空
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class ContractClauseSighting(Base):
+    """
+    条款出现在哪些合同中（合同文本的 sha256），用于按不同合同计数
+
+    只在条款达到 TEMPLATE_MIN_SIGHTINGS 之前记录；达到后这些记录不再需要，随即删除。
+    """
+    __tablename__ = "contract_clause_sightings"
+
+    contract_type = Column(String, primary_key=True)
+    clause_hash = Column(String, primary_key=True)
+    text_hash = Column(String, primary_key=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+def _add_missing_columns():
+    """create_all 不会修改已存在的表：给旧数据库补上后来新增的列（均可为空）"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    """建表；多个 worker 同时启动时，后到者可能遇到表已存在或数据库锁，短暂重试即可"""
+    for attempt in range(5):
+        try:
+            Base.metadata.create_all(bind=engine)
+            _add_missing_columns()
+            # create_all 不会给已存在的表补建后来新增的索引
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(bind=engine, checkfirst=True)
+            return
+        except OperationalError as e:
+            if attempt == 4:
+                raise
+            print(f"init_db 重试 ({attempt + 1}): {e}")
+            time.sleep(0.2 * (attempt + 1))
 
 def get_db():
     db = SessionLocal()
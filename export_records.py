@@ -0,0 +1,73 @@
+"""
+导出分析记录（analysis_records），供数据仓库同步
+
+用法：
+    python export_records.py --format csv --gzip -o records.csv.gz
+    python export_records.py --state-file data/export.cursor -o new.ndjson   # 增量：从上次的游标之后继续
+    python export_records.py --since 2024-06-01 --until 2024-07-01 > june.ndjson
+
+直接读取 DATABASE_URL 指向的数据库，分批流式写出，内存占用与表大小无关。
+"""
+
+import argparse
+import datetime
+import os
+import sys
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from services.record_export import EXPORT_FORMATS, ExportRange, export_cursor, export_records
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="流式导出 analysis_records")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--gzip", action="store_true", help="输出 gzip 压缩")
+    parser.add_argument("-o", "--output", help="输出文件，默认写到标准输出")
+    parser.add_argument("--since-id", type=int, default=0, help="只导出 id 大于该值的记录")
+    parser.add_argument("--state-file", help="游标文件：读取上次导出的游标，导出成功后写入本次的游标")
+    parser.add_argument("--since", type=datetime.datetime.fromisoformat, help="created_at 起始时间（含）")
+    parser.add_argument("--until", type=datetime.datetime.fromisoformat, help="created_at 截止时间（不含）")
+    return parser.parse_args()
+
+
+def read_state(path: str) -> int:
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_state(path: str, cursor: int):
+    # 先写临时文件再替换，导出中断时不会留下半截游标
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(cursor))
+    os.replace(tmp_path, path)
+
+
+def main():
+    args = parse_args()
+    since_id = max(args.since_id, read_state(args.state_file)) if args.state_file else args.since_id
+    cursor = export_cursor(since_id)
+    export_range = ExportRange(since_id=since_id, until_id=cursor, since=args.since, until=args.until)
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    written = 0
+    try:
+        for chunk in export_records(export_range, args.format, args.gzip):
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+    if args.state_file:
+        write_state(args.state_file, cursor)
+    print(f"导出完成: id ({since_id}, {cursor}]，{written} 字节，游标 {cursor}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,116 @@
+import asyncio
+import datetime
+import hashlib
+import hmac
+import json
 import os
+import re
+import secrets
+import sys
+import time
+_MAIN_IMPORT_STARTED = time.perf_counter()
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Request, Header
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from sqlalchemy.orm import Session
+from starlette.datastructures import UploadFile as StarletteUploadFile
 import shutil
 import uuid
 
-from services.pdf_parser import extract_text_from_pdf
-from services.image_parser import extract_text_from_image, is_tesseract_available
-from services.cloud_ocr import extract_text_from_image_cloud, is_cloud_ocr_available, get_ocr_status
-from services.ai_advisor import analyze_resume
-from services.contract_analyzer import analyze_contract
-from database import init_db, get_db, AnalysisRecord
+from services.cpu_limits import get_worker_count
+from services.startup import LazyModule, record_timing, mark_ready, warm_up, startup_report
+from services.single_flight import analysis_flight, credentials_scope, make_flight_key
+from services.shared_state import cache_get, cache_set, hit_rate_limit
+from services.static_assets import PrecompressedAssets
+from services.jd_index import resolve_jd
+from services.contract_clauses import clauses_from_dicts, diff_clauses, revision_report, split_clauses
+from services.contract_templates import (
+    MIN_TEMPLATE_CLAUSES, TemplateMatch, learn_from_analysis, list_templates, match_template
+)
+from services.docx_parser import DocxError
+from services.deadline import DeadlineExceeded, request_deadline, run_stage
+from services.disconnect import ClientDisconnected, DisconnectGuard, wasted_work
+from services.json_response import FastJSONResponse
+from services.schemas import AnalyzeContractResponse, AnalyzeResumeResponse
+from services.llm_pool import llm_pool
+from services.record_export import EXPORT_FORMATS, ExportRange, export_cursor, export_records
+from services.maintenance import MAINTENANCE_INTERVAL, last_report, maintenance_loop, run_maintenance
+from services.memory_budget import (
+    MemoryBudgetExceeded, MemoryReservation, estimate_memory, memory_accountant, memory_snapshot, trace_allocations
+)
+from database import init_db, get_db, engine, AnalysisRecord, ContractAnalysisRecord
+
+# 重量级服务模块（pypdf、PIL、pytesseract、openai、aiohttp）在第一次使用时才加载
+text_extractor = LazyModule("services.text_extractor")
+cloud_ocr = LazyModule("services.cloud_ocr")
+ai_advisor = LazyModule("services.ai_advisor")
+contract_analyzer = LazyModule("services.contract_analyzer")
+
+# main 模块自身的导入耗时（fastapi、sqlalchemy 等轻量依赖）
+record_timing("main", (time.perf_counter() - _MAIN_IMPORT_STARTED) * 1000)
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.webp']
+
+# 启动时预热：预加载服务模块并建立连接池（适合对首个请求延迟敏感的部署）
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "0") == "1"
 
 app = FastAPI(title="Resume Polisher AI")
 
-# 添加安全响应头
-@app.middleware("http")
-async def add_security_headers(request, call_next):
-    response = await call_next(request)
+# 每个客户端 IP 每分钟允许的分析请求数，0 表示不限流（多 worker 共享计数）
+RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "0"))
+# 分析结果在所有 worker 之间共享缓存的时间（秒），0 表示不缓存
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", "3600"))
+# 管理/调试接口的访问令牌（请求头 X-Admin-Token），未配置时这些接口不开放
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# 安全响应头：模块加载时构建一次，每个响应直接追加编码好的头部
+SECURITY_HEADERS = {
     # 防止点击劫持
-    response.headers["X-Frame-Options"] = "DENY"
+    "X-Frame-Options": "DENY",
     # 防止 MIME 类型嗅探
-    response.headers["X-Content-Type-Options"] = "nosniff"
+    "X-Content-Type-Options": "nosniff",
     # XSS 防护
-    response.headers["X-XSS-Protection"] = "1; mode=block"
+    "X-XSS-Protection": "1; mode=block",
     # 强制 HTTPS (生产环境启用)
-    # response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+    # "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
     # 内容安全策略
-    response.headers["Content-Security-Policy"] = "default-src 'self'; script-src 'self' 'unsafe-inline' https://cdn.tailwindcss.com https://unpkg.com; style-src 'self' 'unsafe-inline' https://fonts.googleapis.com https://cdn.tailwindcss.com; font-src 'self' https://fonts.gstatic.com; img-src 'self' data:; connect-src 'self' https://dashscope.aliyuncs.com"
+    "Content-Security-Policy": "default-src 'self'; script-src 'self' 'unsafe-inline' https://cdn.tailwindcss.com https://unpkg.com; style-src 'self' 'unsafe-inline' https://fonts.googleapis.com https://cdn.tailwindcss.com; font-src 'self' https://fonts.gstatic.com; img-src 'self' data:; connect-src 'self' https://dashscope.aliyuncs.com",
     # 引用策略
-    response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+    "Referrer-Policy": "strict-origin-when-cross-origin",
     # 权限策略
-    response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
-    return response
+    "Permissions-Policy": "geolocation=(), microphone=(), camera=()",
+}
+SECURITY_RAW_HEADERS = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in SECURITY_HEADERS.items()]
+
+class SecurityHeadersMiddleware:
+    """添加安全响应头（纯 ASGI 中间件，不缓冲响应体）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-# Initialize DB
-init_db()
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + SECURITY_RAW_HEADERS
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+app.add_middleware(SecurityHeadersMiddleware)
+
+# 压缩较大的 JSON 分析结果；已预压缩的页面带有 Content-Encoding，会被跳过
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
 
 # CORS - 生产环境应该限制具体域名
 app.add_middleware(
@@ -60,48 +128,184 @@ if not os.path.exists("static"):
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# 页面预压缩为 gzip / brotli，带强 ETag
+static_assets = PrecompressedAssets("static")
+
+@app.on_event("startup")
+async def on_startup():
+    # Initialize DB（放在启动阶段而不是导入时，导入 main 不再触发数据库写操作）
+    start = time.perf_counter()
+    init_db()
+    record_timing("init_db", (time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    static_assets.preload()
+    record_timing("static_assets.preload", (time.perf_counter() - start) * 1000)
+
+    if WARMUP_ON_STARTUP:
+        await warm_up()
+
+    # 后台数据库维护（按天汇总、清理过期记录、VACUUM/ANALYZE），多个 worker 通过租约只执行一份
+    if MAINTENANCE_INTERVAL > 0:
+        app.state.maintenance_task = asyncio.create_task(maintenance_loop())
+
+    mark_ready(_MAIN_IMPORT_STARTED)
+
+@app.on_event("shutdown")
+async def close_shared_resources():
+    # uvicorn 已等待在途请求完成（见 GRACEFUL_TIMEOUT），这里停止后台维护并释放数据库连接池
+    maintenance_task = getattr(app.state, "maintenance_task", None)
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+    engine.dispose()
+    if "services.cloud_ocr" in sys.modules:
+        await cloud_ocr.cloud_ocr.close()
+    if "services.pdf_parser" in sys.modules:
+        sys.modules["services.pdf_parser"].shutdown_executor()
+
+def enforce_rate_limit(request: Request):
+    """分析接口限流，计数存放在共享数据库中，所有 worker 共用"""
+    if RATE_LIMIT_PER_MINUTE <= 0:
+        return
+    client_ip = request.client.host if request.client else "unknown"
+    if hit_rate_limit(f"analyze:{client_ip}", RATE_LIMIT_PER_MINUTE, 60):
+        raise HTTPException(status_code=429, detail="请求过于频繁，请稍后再试")
+
+async def with_request_deadline():
+    """为分析请求设置整体截止时间（REQUEST_TIMEOUT），传递到文本提取、OCR 和大模型调用"""
+    with request_deadline():
+        yield
+
+async def reserve_upload_memory(request: Request):
+    """
+    按上传文件的大小和类型预估处理期间的峰值内存并预留（在读取文件内容之前）
+    预算不足时排队等待，等待超时返回 503；端点可在文字提取完成后提前归还
+    """
+    form = await request.form()
+    uploads = [
+        (value.size or 0, os.path.splitext(value.filename or "")[1])
+        for _, value in form.multi_items()
+        if isinstance(value, StarletteUploadFile)
+    ]
+    try:
+        reservation = await memory_accountant.reserve(estimate_memory(uploads))
+    except MemoryBudgetExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    try:
+        yield reservation
+    finally:
+        reservation.release()
+
+async def watch_disconnect(request: Request):
+    """
+    监听客户端断开（关闭页面、负载均衡超时）：断开后取消进行中的文字提取和 AI 分析，不再写数据库
+    请求体此时已读取完毕，receive 通道上只剩断开消息
+    """
+    guard = DisconnectGuard(request.receive)
+    guard.start()
+    try:
+        yield guard
+    finally:
+        guard.close()
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """管理/调试接口鉴权；未配置 ADMIN_TOKEN 时接口视为不存在"""
+    if not ADMIN_TOKEN or not hmac.compare_digest((x_admin_token or "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+def analysis_failed(result) -> bool:
+    """分析结果是否失败：结果本身或其中的 analysis（增量/模板分析的返回格式）带 error 字段"""
+    if not isinstance(result, dict):
+        return False
+    nested = result.get("analysis")
+    return bool(result.get("error") or (isinstance(nested, dict) and nested.get("error")))
+
+async def run_shared_analysis(flight_key: str, fn, on_result=None):
+    """
+    执行分析：先查跨 worker 的结果缓存，再合并同一进程内的在途请求
+    失败的结果（带 error 字段）不缓存，以便用户重试
+
+    Args:
+        on_result: 本次实际执行了分析（不是缓存命中或合并到其他请求）且成功时，在线程中以结果调用，
+            用于写回模板库；同一份结果不会因为重复提交被学习多次
+    """
+    cache_key = f"analysis:{flight_key}"
+    if ANALYSIS_CACHE_TTL > 0:
+        # 共享缓存是 SQLite 读写，遇到其他 worker 的写锁可能等待，放到线程中执行，不阻塞事件循环
+        cached = await asyncio.to_thread(cache_get, cache_key)
+        if cached is not None:
+            return cached
+
+    async def analyze_and_cache():
+        result = await fn()
+        if not analysis_failed(result):
+            if ANALYSIS_CACHE_TTL > 0:
+                await asyncio.to_thread(cache_set, cache_key, result, ANALYSIS_CACHE_TTL)
+            if on_result is not None:
+                await asyncio.to_thread(on_result, result)
+        return result
+
+    # 共享调用在发起者的截止时间内执行；后加入的请求只按自己的剩余时间等待
+    return await run_stage(analysis_flight.do(flight_key, analyze_and_cache), "AI分析")
+
 @app.get("/")
-async def root():
-    return FileResponse('static/index.html')
+async def root(request: Request):
+    return static_assets.response(request, 'index.html')
 
 @app.get("/contract")
-async def contract_analyzer():
-    return FileResponse('static/contract.html')
+async def contract_page(request: Request):
+    return static_assets.response(request, 'contract.html')
 
-@app.post("/analyze")
-async def analyze_resume_endpoint(
-    resume: UploadFile = File(...),
-    jd_text: str = Form(...),
-    api_key: Optional[str] = Form(None),
-    db: Session = Depends(get_db)
-):
+# 单次请求最多上传的文件数（多张截图 / PDF + 图片）及总大小
+MAX_UPLOAD_FILES = int(os.getenv("MAX_UPLOAD_FILES", "10"))
+MAX_TOTAL_UPLOAD_SIZE = int(os.getenv("MAX_TOTAL_UPLOAD_SIZE", str(30 * 1024 * 1024)))  # 30MB
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_JD_LENGTH = 50000  # 50KB
+
+# 上传校验用到的正则和文件头在模块加载时准备好，每个请求直接复用
+SAFE_FILENAME_RE = re.compile(r'^[\w\-. ]+$')
+
+def detect_image_type(content: bytes) -> Optional[str]:
+    """按文件头（magic number）识别图片类型：jpeg / png / webp，无法识别时返回 None"""
+    if content.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if content.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+async def read_validated_upload(upload: UploadFile, allowed_extensions: list, extension_error: str):
+    """
+    对单个上传文件做安全检查并读取内容
+
+    Returns:
+        (扩展名, 文件内容)
+    """
     # ========== 安全检查 1: 文件名验证 ==========
-    if not resume.filename:
+    if not upload.filename:
         raise HTTPException(status_code=400, detail="文件名不能为空")
     
     # 防止路径遍历攻击 (../../../etc/passwd)
-    safe_filename = os.path.basename(resume.filename)
-    if safe_filename != resume.filename:
+    safe_filename = os.path.basename(upload.filename)
+    if safe_filename != upload.filename:
         raise HTTPException(status_code=400, detail="文件名包含非法字符")
     
     # 防止特殊字符和脚本注入
-    import re
-    if not re.match(r'^[\w\-. ]+$', safe_filename):
+    if not SAFE_FILENAME_RE.match(safe_filename):
         raise HTTPException(status_code=400, detail="文件名只能包含字母、数字、下划线、连字符和点")
     
     # ========== 安全检查 2: 文件扩展名验证 ==========
-    allowed_extensions = ['.pdf', '.jpg', '.jpeg', '.png', '.webp']
     file_ext = os.path.splitext(safe_filename.lower())[1]
     
     if not file_ext:
         raise HTTPException(status_code=400, detail="文件必须有扩展名")
     
     if file_ext not in allowed_extensions:
-        raise HTTPException(status_code=400, detail="只支持 PDF、JPG、PNG、WebP 格式")
+        raise HTTPException(status_code=400, detail=extension_error)
     
     # ========== 安全检查 3: 文件大小限制 ==========
-    MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-    content = await resume.read()
+    content = await upload.read()
     
     if len(content) == 0:
         raise HTTPException(status_code=400, detail="文件不能为空")
@@ -110,30 +314,97 @@ async def analyze_resume_endpoint(
         raise HTTPException(status_code=400, detail="文件大小不能超过 10MB")
     
     # ========== 安全检查 4: 文件内容类型验证 (Magic Number) ==========
-    import imghdr
-    
     # 验证文件真实类型，防止伪造扩展名
     if file_ext == '.pdf':
         # PDF 文件应该以 %PDF- 开头
         if not content.startswith(b'%PDF-'):
             raise HTTPException(status_code=400, detail="文件内容与 PDF 格式不符，可能是伪造的文件")
-    else:
+    elif file_ext == '.docx':
+        # DOCX 是 zip 包，应该以 PK 开头
+        if not content.startswith(b'PK\x03\x04'):
+            raise HTTPException(status_code=400, detail="文件内容与 Word 格式不符，可能是伪造的文件")
+    elif file_ext in IMAGE_EXTENSIONS:
         # 验证图片文件的真实类型
-        try:
-            image_type = imghdr.what(None, h=content)
-            valid_image_types = ['jpeg', 'png', 'webp']
-            
-            if image_type not in valid_image_types:
-                raise HTTPException(status_code=400, detail=f"文件内容与声明的图片格式不符，检测到的类型: {image_type}")
-        except Exception as e:
-            raise HTTPException(status_code=400, detail="无法验证图片文件类型，文件可能已损坏")
+        if detect_image_type(content) is None:
+            raise HTTPException(status_code=400, detail="文件内容与声明的图片格式不符（只支持 JPEG、PNG、WebP），文件可能已损坏或是伪造的")
+
+    return file_ext, content
+
+async def read_validated_uploads(uploads: List[UploadFile], allowed_extensions: list, extension_error: str):
+    """
+    检查并读取一组有序上传文件：多张图片，或一个文档（PDF/文本等）加若干图片
+
+    Returns:
+        [(文件内容, 扩展名), ...]，顺序与上传顺序一致
+    """
+    if not uploads:
+        raise HTTPException(status_code=400, detail="请上传文件")
+    
+    if len(uploads) > MAX_UPLOAD_FILES:
+        raise HTTPException(status_code=400, detail=f"一次最多上传 {MAX_UPLOAD_FILES} 个文件")
+    
+    files = []
+    total_size = 0
+    for upload in uploads:
+        file_ext, content = await read_validated_upload(upload, allowed_extensions, extension_error)
+        total_size += len(content)
+        if total_size > MAX_TOTAL_UPLOAD_SIZE:
+            raise HTTPException(status_code=400, detail=f"文件总大小不能超过 {MAX_TOTAL_UPLOAD_SIZE // (1024 * 1024)}MB")
+        files.append((content, file_ext))
+    
+    documents = [ext for _, ext in files if ext not in IMAGE_EXTENSIONS]
+    if len(documents) > 1:
+        raise HTTPException(status_code=400, detail="多文件上传时只能包含一个文档，其余须为图片")
+    
+    return files
+
+async def extract_uploaded_text(files, document_name: str) -> str:
+    """并发提取所有文件（页）的文字，并把提取错误转换为 HTTP 错误"""
+    try:
+        return await text_extractor.extract_text_from_files(files)
+    except text_extractor.OCRUnavailableError as e:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"图片文字识别功能不可用。\n\n可用服务: {', '.join(e.available_services) if e.available_services else '无'}\n\n解决方案：\n1. 配置云端OCR服务（推荐）\n2. 安装本地Tesseract OCR\n3. 将{document_name}转换为 PDF 格式\n\n详细说明请查看项目文档。"
+        )
+    except DocxError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except text_extractor.ImageOCRError as e:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"图片文字识别失败：{str(e)}。\n\n建议：\n1. 确保图片清晰可读\n2. 使用 PDF 格式（推荐）\n3. 检查OCR服务配置"
+        )
+
+def describe_filenames(uploads: List[UploadFile]) -> str:
+    """多文件上传时用于记录和展示的文件名"""
+    return ", ".join(upload.filename for upload in uploads)
+
+@app.post(
+    "/analyze",
+    response_model=AnalyzeResumeResponse,
+    dependencies=[Depends(enforce_rate_limit), Depends(with_request_deadline)],
+)
+async def analyze_resume_endpoint(
+    resume: List[UploadFile] = File(...),
+    jd_text: str = Form(...),
+    api_key: Optional[str] = Form(None),
+    db: Session = Depends(get_db),
+    memory: MemoryReservation = Depends(reserve_upload_memory),
+    guard: DisconnectGuard = Depends(watch_disconnect),
+):
+    # ========== 安全检查 1-4: 文件名、扩展名、大小、内容类型 ==========
+    files = await read_validated_uploads(
+        resume,
+        ['.pdf', '.jpg', '.jpeg', '.png', '.webp'],
+        "只支持 PDF、JPG、PNG、WebP 格式",
+    )
+    filename = describe_filenames(resume)
 
     # ========== 安全检查 5: JD 文本验证 ==========
     if not jd_text or not jd_text.strip():
         raise HTTPException(status_code=400, detail="职位描述不能为空")
     
     # 限制 JD 文本长度，防止 DoS 攻击
-    MAX_JD_LENGTH = 50000  # 50KB
     if len(jd_text) > MAX_JD_LENGTH:
         raise HTTPException(status_code=400, detail="职位描述过长，请精简到 50000 字符以内")
     
@@ -152,160 +423,144 @@ async def analyze_resume_endpoint(
 
     try:
         
-        # 1. Extract text based on file type
-        if file_ext == '.pdf':
-            resume_text = await extract_text_from_pdf(content)
-        else:
-            # For image files, use cloud OCR first, then fallback to local
-            try:
-                if is_cloud_ocr_available():
-                    # 使用云端OCR（更准确）
-                    resume_text = await extract_text_from_image_cloud(content)
-                elif is_tesseract_available():
-                    # 降级到本地Tesseract
-                    resume_text = await extract_text_from_image(content)
-                else:
-                    # 没有任何OCR可用
-                    ocr_status = get_ocr_status()
-                    raise HTTPException(
-                        status_code=400, 
-                        detail=f"图片文字识别功能不可用。\n\n可用服务: {', '.join(ocr_status['available_services']) if ocr_status['available_services'] else '无'}\n\n解决方案：\n1. 配置云端OCR服务（推荐）\n2. 安装本地Tesseract OCR\n3. 将简历转换为 PDF 格式\n\n详细说明请查看项目文档。"
-                    )
-                
-            except HTTPException:
-                raise  # 重新抛出HTTP异常
-            except Exception as e:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"图片文字识别失败：{str(e)}。\n\n建议：\n1. 确保图片清晰可读\n2. 使用 PDF 格式（推荐）\n3. 检查OCR服务配置"
-                )
+        # 1. Extract text (each file/page concurrently, reassembled in upload order)
+        resume_text = await guard.run(extract_uploaded_text(files, "简历"), "文字提取")
+        # 文字已提取，上传文件的字节不再需要，立即归还内存预算
+        del files
+        memory.release()
         
         if not resume_text.strip():
              raise HTTPException(status_code=400, detail="无法从文件中提取文字内容。如果是图片格式，请确保图片清晰可读。")
 
-        # 2. AI Analysis
-        analysis_result = await analyze_resume(resume_text, jd_text, api_key)
+        # 2. JD 去重并提取精简 JD / 要求 / 关键词；缓存键按用户 JD 的规范化文本，近似重复的 JD 不共用分析结果
+        jd_profile = await asyncio.to_thread(resolve_jd, jd_text)
+
+        # 3. AI Analysis（相同内容的在途请求合并为一次调用）
+        flight_key = make_flight_key(
+            "resume", resume_text, jd_profile.text_key, ai_advisor.RESUME_MODEL, credentials_scope(api_key)
+        )
+        analysis_result = await guard.run(run_shared_analysis(
+            flight_key, lambda: ai_advisor.analyze_resume(resume_text, jd_text, api_key, jd_profile=jd_profile)
+        ), "AI分析")
         
-        # 3. Save to DB
+        # 4. Save to DB（客户端已断开时结果无人接收，不再写入）
+        guard.check("保存结果")
         try:
             score = int(analysis_result.get("match_score", 0))
         except:
             score = 0
             
         db_record = AnalysisRecord(
-            filename=resume.filename,
+            filename=filename,
             job_description_snippet=jd_text[:100], # Save first 100 chars
             match_score=score
         )
         db.add(db_record)
         db.commit()
         
-        return {
-            "filename": resume.filename,
+        # 分析结果已在 ai_advisor 中校验过，直接序列化，跳过 jsonable_encoder
+        return FastJSONResponse({
+            "filename": filename,
             "analysis": analysis_result,
             "db_record_id": db_record.id
-        }
+        })
 
+    except HTTPException:
+        raise
+    except ClientDisconnected as e:
+        # 499: 客户端已关闭连接（响应不会被接收，只用于访问日志）
+        raise HTTPException(status_code=499, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"分析超时，请稍后重试（{e}）")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/analyze-contract")
+CONTRACT_EXTENSIONS = ['.pdf', '.doc', '.docx', '.txt', '.jpg', '.jpeg', '.png', '.webp']
+
+def new_revision_token() -> str:
+    """分析记录的修订令牌（不可猜测），与记录编号一起返回给客户端"""
+    return secrets.token_urlsafe(24)
+
+def find_previous_contract(db: Session, previous_token: Optional[str], previous_text: Optional[str], contract_type: str):
+    """
+    查找修订对比的上一版本
+
+    按记录引用时必须提供上一次分析返回的 revision_token（"记录编号.随机令牌"），
+    不接受单独的记录编号：编号是自增的，可以被猜到，不能用来读取别人的合同分析。
+
+    Returns:
+        (上一版本的条款, 上一版本的分析记录)；只上传了上一版本文件、但没有对应分析记录时，记录为 None
+        分析失败的记录不作为基准（未改动的条款会一直得不到分析），同样返回 None，改为完整分析
+    """
+    if previous_token:
+        record_id, _, secret = previous_token.partition(".")
+        record = db.get(ContractAnalysisRecord, int(record_id)) if record_id.isdigit() and secret else None
+        # 记录不存在和令牌不符返回同样的错误，不暴露记录是否存在
+        if record is None or not record.revision_token or not hmac.compare_digest(
+            record.revision_token.encode("utf-8"), secret.encode("utf-8")
+        ):
+            raise HTTPException(status_code=400, detail="找不到上一版本的分析记录，请重新上传上一版本文件")
+        previous_clauses = clauses_from_dicts(json.loads(record.clauses))
+    elif previous_text:
+        text_hash = hashlib.sha256(previous_text.encode("utf-8")).hexdigest()
+        record = (
+            db.query(ContractAnalysisRecord)
+            .filter(ContractAnalysisRecord.text_hash == text_hash)
+            .order_by(ContractAnalysisRecord.id.desc())
+            .first()
+        )
+        previous_clauses = split_clauses(previous_text)
+    else:
+        return [], None
+
+    # 不同合同类型的分析重点不同，不能沿用旧结果，只做条款对比
+    if record is not None and (record.contract_type != contract_type or analysis_failed(json.loads(record.analysis))):
+        record = None
+    return previous_clauses, record
+
+@app.post(
+    "/analyze-contract",
+    response_model=AnalyzeContractResponse,
+    dependencies=[Depends(enforce_rate_limit), Depends(with_request_deadline)],
+)
 async def analyze_contract_endpoint(
-    contract: UploadFile = File(...),
+    contract: List[UploadFile] = File(...),
     contract_type: str = Form(...),
     context: str = Form(""),
     api_key: Optional[str] = Form(None),
-    db: Session = Depends(get_db)
+    previous_revision_token: Optional[str] = Form(None),
+    previous_contract: Optional[List[UploadFile]] = File(None),
+    db: Session = Depends(get_db),
+    memory: MemoryReservation = Depends(reserve_upload_memory),
+    guard: DisconnectGuard = Depends(watch_disconnect),
 ):
-    """合同分析端点"""
-    
-    # ========== 安全检查 1: 文件名验证 ==========
-    if not contract.filename:
-        raise HTTPException(status_code=400, detail="文件名不能为空")
-    
-    # 防止路径遍历攻击
-    safe_filename = os.path.basename(contract.filename)
-    if safe_filename != contract.filename:
-        raise HTTPException(status_code=400, detail="文件名包含非法字符")
-    
-    # 防止特殊字符和脚本注入
-    import re
-    if not re.match(r'^[\w\-. ]+$', safe_filename):
-        raise HTTPException(status_code=400, detail="文件名只能包含字母、数字、下划线、连字符和点")
-    
-    # ========== 安全检查 2: 文件扩展名验证 ==========
-    allowed_extensions = ['.pdf', '.doc', '.docx', '.txt', '.jpg', '.jpeg', '.png', '.webp']
-    file_ext = os.path.splitext(safe_filename.lower())[1]
-    
-    if not file_ext:
-        raise HTTPException(status_code=400, detail="文件必须有扩展名")
-    
-    if file_ext not in allowed_extensions:
-        raise HTTPException(status_code=400, detail="只支持 PDF、Word、图片、文本格式")
-    
-    # ========== 安全检查 3: 文件大小限制 ==========
-    MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-    content = await contract.read()
-    
-    if len(content) == 0:
-        raise HTTPException(status_code=400, detail="文件不能为空")
-    
-    if len(content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="文件大小不能超过 10MB")
-    
-    # ========== 安全检查 4: 文件内容类型验证 ==========
-    import imghdr
+    """
+    合同分析端点
+
+    修订对比：提供 previous_revision_token（上一次分析返回的 revision_token）或上一版本文件 previous_contract 时，
+    按条款对齐两个版本，只重新分析新增和修改的条款，并返回条款差异
+    """
     
-    # 验证文件真实类型，防止伪造扩展名
-    if file_ext == '.pdf':
-        # PDF 文件应该以 %PDF- 开头
-        if not content.startswith(b'%PDF-'):
-            raise HTTPException(status_code=400, detail="文件内容与 PDF 格式不符")
-    elif file_ext in ['.jpg', '.jpeg', '.png', '.webp']:
-        # 验证图片文件的真实类型
-        try:
-            image_type = imghdr.what(None, h=content)
-            valid_image_types = ['jpeg', 'png', 'webp']
-            
-            if image_type not in valid_image_types:
-                raise HTTPException(status_code=400, detail=f"文件内容与声明的图片格式不符，检测到的类型: {image_type}")
-        except Exception as e:
-            raise HTTPException(status_code=400, detail="无法验证图片文件类型，文件可能已损坏")
+    # ========== 安全检查 1-4: 文件名、扩展名、大小、内容类型 ==========
+    files = await read_validated_uploads(contract, CONTRACT_EXTENSIONS, "只支持 PDF、Word、图片、文本格式")
+    filename = describe_filenames(contract)
+    previous_files = None
+    if previous_contract and not previous_revision_token:
+        previous_files = await read_validated_uploads(previous_contract, CONTRACT_EXTENSIONS, "只支持 PDF、Word、图片、文本格式")
 
     try:
-        # 1. Extract text based on file type
-        if file_ext == '.pdf':
-            contract_text = await extract_text_from_pdf(content)
-        elif file_ext in ['.jpg', '.jpeg', '.png', '.webp']:
-            # For image files, use cloud OCR first, then fallback to local
-            try:
-                if is_cloud_ocr_available():
-                    # 使用云端OCR（更准确）
-                    contract_text = await extract_text_from_image_cloud(content)
-                elif is_tesseract_available():
-                    # 降级到本地Tesseract
-                    contract_text = await extract_text_from_image(content)
-                else:
-                    # 没有任何OCR可用
-                    ocr_status = get_ocr_status()
-                    raise HTTPException(
-                        status_code=400, 
-                        detail=f"图片文字识别功能不可用。\n\n可用服务: {', '.join(ocr_status['available_services']) if ocr_status['available_services'] else '无'}\n\n解决方案：\n1. 配置云端OCR服务（推荐）\n2. 安装本地Tesseract OCR\n3. 将合同转换为 PDF 格式\n\n详细说明请查看项目文档。"
-                    )
-                
-            except HTTPException:
-                raise  # 重新抛出HTTP异常
-            except Exception as e:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"图片文字识别失败：{str(e)}。\n\n建议：\n1. 确保图片清晰可读\n2. 使用 PDF 格式（推荐）\n3. 检查OCR服务配置"
-                )
-        elif file_ext == '.txt':
-            # 纯文本文件
-            contract_text = content.decode('utf-8')
-        else:
-            # Word文档等其他格式
-            raise HTTPException(status_code=400, detail="暂不支持该文件格式，请转换为PDF或图片格式")
+        # 1. Extract text (each file/page concurrently, reassembled in upload order)
+        if any(ext == '.doc' for _, ext in files + (previous_files or [])):
+            # 旧版二进制 Word 格式
+            raise HTTPException(status_code=400, detail="暂不支持 .doc 格式，请另存为 .docx，或转换为PDF或图片格式")
+        
+        contract_text = await guard.run(extract_uploaded_text(files, "合同"), "文字提取")
+        previous_text = (
+            await guard.run(extract_uploaded_text(previous_files, "上一版本合同"), "文字提取") if previous_files else None
+        )
+        # 文字已提取，上传文件的字节不再需要，立即归还内存预算
+        del files, previous_files
+        memory.release()
         
         if not contract_text.strip():
             raise HTTPException(status_code=400, detail="无法从文件中提取文字内容。如果是图片格式，请确保图片清晰可读。")
@@ -320,35 +575,235 @@ async def analyze_contract_endpoint(
             if len(api_key) > 200:
                 raise HTTPException(status_code=400, detail="API Key 长度异常")
         else:
-            # 使用环境变量中的API Key
-            api_key = os.getenv("DASHSCOPE_API_KEY")
-            if not api_key or api_key == "sk-your-dashscope-api-key-here":
+            # 使用服务器端配置的 Key（服务池：DASHSCOPE_API_KEY / DASHSCOPE_API_KEYS / LLM_PROVIDERS）
+            api_key = None
+            if not llm_pool.configured:
                 raise HTTPException(
                     status_code=400, 
                     detail="请提供有效的 DashScope API Key。\n\n解决方案：\n1. 在表单中填写您的 API Key\n2. 或在服务器 .env 文件中配置 DASHSCOPE_API_KEY\n\n获取 API Key：https://dashscope.aliyun.com/"
                 )
         
-        # 3. AI Contract Analysis
-        analysis_result = await analyze_contract(contract_text, contract_type, context, api_key)
+        # 3. 修订对比：找到上一版本的条款和分析结果；模板库：查找已知条款
+        clauses = split_clauses(contract_text)
+        previous_clauses, previous_record = find_previous_contract(db, previous_revision_token, previous_text, contract_type)
+        template_match = await asyncio.to_thread(match_template, contract_type, clauses)
+        text_hash = hashlib.sha256(contract_text.encode("utf-8")).hexdigest()
+
+        # 写回模板库：只学习本次实际完成的完整分析和模板分析；缓存命中、合并到其他请求和修订增量分析
+        # （结果大多沿用自上一版本）不学习，带用户补充说明的分析有针对性，也不作为通用结果
+        learn = None
+        if not context.strip():
+            learn = lambda analysis: learn_from_analysis(contract_type, clauses, analysis, template_match, text_hash)
+
+        # 4. AI Contract Analysis（相同内容的在途请求合并为一次调用）
+        revision = None
+        template = None
+        if previous_record is not None:
+            # 增量分析：只有新增和修改的条款交给模型
+            flight_key = make_flight_key(
+                "contract-revision", str(previous_record.id), contract_text, contract_type, context,
+                contract_analyzer.CONTRACT_MODEL, credentials_scope(api_key),
+            )
+            result = await guard.run(run_shared_analysis(
+                flight_key, lambda: contract_analyzer.analyze_contract_revision(
+                    clauses, previous_clauses, json.loads(previous_record.analysis), contract_type, context, api_key,
+                    known=template_match.known,
+                )
+            ), "AI分析")
+            analysis_result = result["analysis"]
+            revision = {**result["revision"], "previous_analysis_id": previous_record.id}
+        elif template_match.matched:
+            # 与已知模板匹配：只分析可变条款和新条款
+            flight_key = make_flight_key(
+                "contract-template", str(template_match.template_id), contract_text, contract_type, context,
+                contract_analyzer.CONTRACT_MODEL, credentials_scope(api_key),
+            )
+            result = await guard.run(run_shared_analysis(
+                flight_key, lambda: contract_analyzer.analyze_contract_from_template(
+                    clauses, template_match, contract_type, context, api_key
+                ),
+                on_result=learn and (lambda result: learn(result["analysis"])),
+            ), "AI分析")
+            analysis_result = result["analysis"]
+            template = result["template"]
+        else:
+            flight_key = make_flight_key(
+                "contract", contract_text, contract_type, context, contract_analyzer.CONTRACT_MODEL,
+                credentials_scope(api_key),
+            )
+            analysis_result = await guard.run(run_shared_analysis(
+                flight_key,
+                lambda: contract_analyzer.analyze_contract(contract_text, contract_type, context, api_key, clauses=clauses),
+                on_result=learn,
+            ), "AI分析")
+            if previous_clauses:
+                # 上一版本没有分析记录：完整分析，同时给出条款差异
+                revision = {**revision_report(diff_clauses(previous_clauses, clauses), len(clauses)), "previous_analysis_id": None}
+
+        # 5. Save to DB（保存条款和结果，下一个修订版可据此增量分析；客户端已断开时不再写入）
+        # 分析失败的记录不发放修订令牌，不能作为下一个修订版的基准
+        guard.check("保存结果")
+        failed = analysis_failed(analysis_result)
+        record = ContractAnalysisRecord(
+            filename=filename,
+            contract_type=contract_type,
+            text_hash=text_hash,
+            clauses=json.dumps([clause.to_dict() for clause in clauses], ensure_ascii=False),
+            analysis=json.dumps(analysis_result, ensure_ascii=False),
+            previous_id=previous_record.id if previous_record is not None else None,
+            revision_token=None if failed else new_revision_token(),
+        )
+        db.add(record)
+        db.commit()
         
-        return {
-            "filename": contract.filename,
+        return FastJSONResponse({
+            "filename": filename,
             "contract_type": contract_type,
-            "analysis": analysis_result
-        }
+            "analysis": analysis_result,
+            "analysis_id": record.id,
+            "revision_token": None if failed else f"{record.id}.{record.revision_token}",
+            "revision": revision,
+            "template": template,
+        })
         
+    except HTTPException:
+        raise
+    except ClientDisconnected as e:
+        # 499: 客户端已关闭连接（响应不会被接收，只用于访问日志）
+        raise HTTPException(status_code=499, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"分析超时，请稍后重试（{e}）")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/admin/contract-templates", dependencies=[Depends(require_admin), Depends(with_request_deadline)])
+async def register_contract_template(
+    contract: List[UploadFile] = File(...),
+    contract_type: str = Form(...),
+    name: str = Form(""),
+    memory: MemoryReservation = Depends(reserve_upload_memory),
+):
+    """
+    登记标准合同模板：完整分析一次并写入模板库，之后基于该模板修改的合同只需分析改动的条款
+    """
+    files = await read_validated_uploads(contract, CONTRACT_EXTENSIONS, "只支持 PDF、Word、图片、文本格式")
+    if any(ext == '.doc' for _, ext in files):
+        raise HTTPException(status_code=400, detail="暂不支持 .doc 格式，请另存为 .docx，或转换为PDF或图片格式")
+
+    try:
+        contract_text = await extract_uploaded_text(files, "合同")
+        del files
+        memory.release()
+
+        clauses = split_clauses(contract_text)
+        if len(clauses) < MIN_TEMPLATE_CLAUSES:
+            raise HTTPException(status_code=400, detail="无法识别合同条款，模板至少需要包含 3 个条款")
+
+        if not llm_pool.configured:
+            raise HTTPException(status_code=400, detail="服务器未配置 DASHSCOPE_API_KEY")
+
+        analysis_result = await contract_analyzer.analyze_contract(
+            contract_text, contract_type, "", None, clauses=clauses
+        )
+        template_id = await asyncio.to_thread(
+            learn_from_analysis, contract_type, clauses, analysis_result, TemplateMatch(),
+            hashlib.sha256(contract_text.encode("utf-8")).hexdigest(), name, register=True,
+        )
+        if template_id is None:
+            raise HTTPException(status_code=500, detail="模板写入失败，请检查分析结果后重试")
+
+        return {"template_id": template_id, "contract_type": contract_type, "clauses": len(clauses)}
+
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"分析超时，请稍后重试（{e}）")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/admin/contract-templates", dependencies=[Depends(require_admin)])
+async def get_contract_templates(contract_type: Optional[str] = None):
+    """模板库中的模板及命中次数"""
+    return await asyncio.to_thread(list_templates, contract_type)
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/startup-report")
+async def get_startup_report():
+    """启动耗时报告（各模块导入耗时）"""
+    return startup_report()
+
+@app.get("/debug/memory", dependencies=[Depends(require_admin)])
+async def debug_memory(limit: int = 20, trace_seconds: float = 0):
+    """内存预算使用情况；trace_seconds>0 时临时开启 tracemalloc 采样这段时间，返回分配排行后关闭"""
+    result = memory_snapshot()
+    if trace_seconds > 0:
+        result.update(await trace_allocations(trace_seconds, limit=max(1, min(limit, 100))))
+    return result
+
+@app.get("/debug/llm-pool", dependencies=[Depends(require_admin)])
+async def debug_llm_pool():
+    """大模型服务池中各 Key / 端点的在途请求、限流次数、剩余配额和冷却状态（当前 worker）"""
+    return llm_pool.stats()
+
+@app.get("/debug/disconnects", dependencies=[Depends(require_admin)])
+async def debug_disconnects():
+    """客户端断开后被放弃的请求及其已耗费的时间，以及合并调用因仍有其他等待者而继续执行的次数（当前 worker）"""
+    return {"wasted_work": wasted_work.stats(), "analysis_flight": analysis_flight.stats()}
+
+@app.get("/admin/export/analysis-records", dependencies=[Depends(require_admin)])
+async def export_analysis_records(
+    format: str = "ndjson",
+    since_id: int = 0,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    compress: bool = False,
+):
+    """
+    流式导出 analysis_records（NDJSON 或 CSV，compress=true 时以 Content-Encoding: gzip 压缩传输），供数据仓库同步
+
+    导出 id 大于 since_id 的记录；响应头 X-Export-Cursor 是本次的游标，下一次增量导出把它作为 since_id
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format 只支持 {', '.join(EXPORT_FORMATS)}")
+
+    cursor = await asyncio.to_thread(export_cursor, since_id)
+    export_range = ExportRange(since_id=since_id, until_id=cursor, since=since, until=until)
+    headers = {
+        "Content-Disposition": f'attachment; filename="analysis_records_{since_id}_{cursor}.{format}"',
+        "X-Export-Cursor": str(cursor),
+    }
+    if compress:
+        # 已经压缩过的响应带上 Content-Encoding，GZipMiddleware 不会再压缩一次
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(export_records(export_range, format, compress), media_type=EXPORT_FORMATS[format], headers=headers)
+
+@app.get("/debug/maintenance", dependencies=[Depends(require_admin)])
+async def debug_maintenance():
+    """最近一轮数据库维护的报告（任意 worker 执行的）"""
+    return await asyncio.to_thread(last_report) or {}
+
+@app.post("/admin/maintenance", dependencies=[Depends(require_admin)])
+async def trigger_maintenance(full_vacuum: bool = False):
+    """立即执行一轮数据库维护；full_vacuum=true 时允许执行一次完整 VACUUM（早期数据库切换到增量模式，期间独占数据库）"""
+    return await run_maintenance(full_vacuum=full_vacuum)
+
 @app.get("/ocr-status")
 async def ocr_status():
     """获取OCR服务状态"""
-    return get_ocr_status()
+    return await asyncio.to_thread(cloud_ocr.get_ocr_status)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    workers = get_worker_count()
+    # 多 worker 时 uvicorn 需要以导入字符串的方式加载应用
+    uvicorn.run(
+        "main:app" if workers > 1 else app,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=workers,
+        # 收到 SIGTERM 后停止接收新连接，最多等待这么久让在途分析完成
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_TIMEOUT", "60")),
+    )
@@ -1,32 +1,169 @@
 import os
 import json
-from openai import OpenAI
-from pydantic import BaseModel, Field
+import asyncio
+import time
+from .deadline import DeadlineExceeded
+from .llm_client import create_chat_completion, open_llm_client
+from .jd_index import JDProfile
+from .resume_sections import ResumeSection, segment_resume
+from .shared_state import cache_get, cache_set
+from .schemas import HRInsights, ResumeAnalysis
+from pydantic import TypeAdapter
 from typing import List, Optional
 
-# Define output structure using Pydantic
-class ProjectRewrite(BaseModel):
-    original: str = Field(description="The original project description or work experience text.")
-    rewritten: str = Field(description="The rewritten version optimized for the JD.")
+# 简历分析使用的模型（也参与在途请求合并的内容哈希）
+RESUME_MODEL = "qwen-max"
 
-class ResumeAnalysis(BaseModel):
-    match_score: int = Field(description="A score from 0 to 100 indicating how well the resume matches the job description.")
-    missing_keywords: List[str] = Field(description="A list of important keywords or skills found in the JD but missing from the resume.")
-    improvement_suggestions: List[str] = Field(description="A list of specific actionable suggestions to improve the resume.")
-    rewritten_projects: List[ProjectRewrite] = Field(description="A list of project descriptions or work experiences that could be better tailored to the JD.")
+# 单个经历段落改写结果的缓存时间（秒），0 表示不缓存
+REWRITE_CACHE_TTL = int(os.getenv("REWRITE_CACHE_TTL", str(7 * 24 * 3600)))
 
-async def analyze_resume(resume_text: str, jd_text: str, api_key: str = None):
-    if not api_key:
-        api_key = os.environ.get("DASHSCOPE_API_KEY")
-    
-    if not api_key:
-        raise ValueError("DashScope API Key is required")
+# 每次调用最多改写的经历段落数；更多的段落分批交给额外的改写调用并发执行，避免单次输出过长被截断
+REWRITE_BATCH_SIZE = max(1, int(os.getenv("REWRITE_BATCH_SIZE", "3")))
+# 单独的改写调用（额外批次、并行模式的改写子调用）的 max_tokens
+REWRITE_MAX_TOKENS = 2000
+
+# 执行方式：single 一次调用返回全部内容；parallel 拆成评分/建议/改写/HR洞察四个子调用并发执行，
+# 总耗时取决于最慢的子调用而不是全部输出长度之和（输入 token 会多消耗几份）
+RESUME_ANALYSIS_MODE = os.getenv("RESUME_ANALYSIS_MODE", "single").strip().lower()
+
+RESUME_SYSTEM_PROMPT = "你是一位拥有15年经验的资深HR总监兼简历优化大师，具有丰富的人才招聘、评估和简历优化经验。请以HR总监+简历优化大师的双重专业视角进行分析，严格按照要求的JSON格式返回结果，确保评估标准符合行业实际情况，同时提供专业的简历优化建议。"
+
+DEFAULT_HR_INSIGHTS = HRInsights().model_dump()
+
+# 输出结构 ResumeAnalysis 定义在 schemas 中（端点的响应模型也引用它）；校验器在模块加载时构建一次，每个请求直接复用
+RESUME_ANALYSIS_ADAPTER = TypeAdapter(ResumeAnalysis)
+
+def _validated(result: dict) -> dict:
+    """按 ResumeAnalysis 校验并补齐缺省字段，返回可直接 JSON 序列化的字典（也用于共享缓存）"""
+    return RESUME_ANALYSIS_ADAPTER.dump_python(RESUME_ANALYSIS_ADAPTER.validate_python(result), exclude_none=True)
+
+def _rewrite_cache_key(section: ResumeSection, jd_key: str) -> str:
+    # 改写结果针对具体 JD，键中包含段落内容、JD（用户 JD 规范化文本的哈希）和模型
+    return f"rewrite:{section.content_hash(jd_key, RESUME_MODEL)}"
+
+def _build_jd_block(jd_text: str, jd_profile: Optional[JDProfile]) -> str:
+    """提示词中的 JD 部分：有 JD 产物时使用精简版 JD 和提取好的要求、关键词（均来自用户提交的 JD）"""
+    if jd_profile is None or not jd_profile.condensed:
+        return jd_text
+    block = jd_profile.condensed
+    if jd_profile.requirements:
+        block += "\n\n【JD核心要求】\n" + "\n".join(f"- {item}" for item in jd_profile.requirements)
+    if jd_profile.keywords:
+        block += "\n\n【JD关键词】\n" + "、".join(jd_profile.keywords)
+    return block
 
-    client = OpenAI(
-        api_key=api_key,
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+def _build_rewrite_task(sections: List[ResumeSection], batch: List[ResumeSection]) -> str:
+    """生成项目改写部分的提示词：只列出本次需要改写的段落"""
+    if not sections:
+        # 无法识别经历段落时由模型自行挑选
+        return "请从简历中挑选与目标职位最相关的项目/工作经历进行改写。"
+    if not batch:
+        return "本次无需改写经历段落，rewritten_projects 请返回空数组 []。"
+    blocks = "\n\n".join(f"[{section.section_id}]\n{section.text}" for section in batch)
+    return (
+        "请只改写以下经历段落（其余段落无需返回），每个段落返回一项，"
+        "并在 section_id 中原样填写方括号中的段落编号：\n\n" + blocks
     )
 
+def _rewrite_item_format(sections: List[ResumeSection]) -> str:
+    """rewritten_projects 中每一项的格式；按段落改写时原文由服务端补上，模型不必重复输出"""
+    if not sections:
+        return '{"original": "原始项目/工作经历描述", "rewritten": "HR更青睐的优化描述（突出成果、数据、影响力）"}'
+    return '{"section_id": "段落编号（如 project-1）", "rewritten": "HR更青睐的优化描述（突出成果、数据、影响力）"}'
+
+def _rewrite_batches(pending: List[ResumeSection]) -> List[List[ResumeSection]]:
+    return [pending[i:i + REWRITE_BATCH_SIZE] for i in range(0, len(pending), REWRITE_BATCH_SIZE)]
+
+def _parse_json_response(response_content: str) -> dict:
+    """从模型回复中取出 JSON（兼容 ```json 代码块和前后多余文字）"""
+    if "```json" in response_content:
+        json_start = response_content.find("```json") + 7
+        json_end = response_content.find("```", json_start)
+        json_content = response_content[json_start:json_end].strip()
+    elif "{" in response_content and "}" in response_content:
+        json_start = response_content.find("{")
+        json_end = response_content.rfind("}") + 1
+        json_content = response_content[json_start:json_end]
+    else:
+        json_content = response_content
+    return json.loads(json_content)
+
+def _load_cached_rewrites(sections: List[ResumeSection], jd_key: str) -> dict:
+    """读取段落改写缓存（阻塞调用，应放到线程中执行）"""
+    cached_rewrites = {}
+    for section in sections:
+        cached = cache_get(_rewrite_cache_key(section, jd_key))
+        if cached is not None:
+            cached_rewrites[section.section_id] = {**cached, "section_id": section.section_id}
+    return cached_rewrites
+
+def _store_rewrites(items: list):
+    """写入段落改写缓存（阻塞调用，应放到线程中执行）"""
+    for key, item in items:
+        cache_set(key, item, ttl=REWRITE_CACHE_TTL)
+
+async def _merge_rewrites(sections: List[ResumeSection], cached: dict, new_items: list, jd_key: str) -> list:
+    """把本次改写结果写入段落缓存，并与缓存结果按简历中的段落顺序合并"""
+    if not sections:
+        return new_items
+
+    known_ids = {section.section_id for section in sections}
+    by_id = {}
+    extra = []
+    for item in new_items:
+        if not isinstance(item, dict):
+            continue
+        section_id = item.get("section_id")
+        if section_id in by_id or section_id in cached or section_id not in known_ids:
+            extra.append(item)
+        else:
+            by_id[section_id] = item
+
+    merged = []
+    to_cache = []
+    for section in sections:
+        item = cached.get(section.section_id)
+        if item is None:
+            item = by_id.get(section.section_id)
+            if item is None:
+                continue
+            item = {**item, "original": item.get("original") or section.text}
+            if REWRITE_CACHE_TTL > 0 and item.get("rewritten"):
+                to_cache.append((_rewrite_cache_key(section, jd_key), item))
+        merged.append(item)
+    if to_cache:
+        await asyncio.to_thread(_store_rewrites, to_cache)
+    return merged + extra
+
+async def analyze_resume(resume_text: str, jd_text: str, api_key: str = None, jd_profile: Optional[JDProfile] = None):
+    # 没有自带 Key 时使用服务器端的服务池（多个 Key / 端点）；自带 Key 的客户端在分析结束后关闭
+    async with open_llm_client(api_key) as client:
+        return await _analyze_resume(client, resume_text, jd_text, jd_profile)
+
+async def _analyze_resume(client, resume_text: str, jd_text: str, jd_profile: Optional[JDProfile]):
+    # 按段落复用改写结果：未修改的经历段落直接取缓存，只有新增或修改过的段落交给模型改写；
+    # 匹配度评分等整体评估仍基于完整简历
+    jd_key = jd_profile.text_key if jd_profile is not None else jd_text
+    sections = [section for section in segment_resume(resume_text) if section.rewritable]
+    cached_rewrites = (
+        await asyncio.to_thread(_load_cached_rewrites, sections, jd_key) if REWRITE_CACHE_TTL > 0 and sections else {}
+    )
+    pending = [section for section in sections if section.section_id not in cached_rewrites]
+    if sections:
+        print(f"Resume rewrite cache: {len(cached_rewrites)} reused, {len(pending)} to rewrite")
+
+    jd_block = _build_jd_block(jd_text, jd_profile)
+    if RESUME_ANALYSIS_MODE == "parallel":
+        return await _analyze_resume_parallel(client, resume_text, jd_block, sections, cached_rewrites, pending, jd_key)
+
+    # 主调用只改写第一批段落，其余批次由单独的改写调用并发完成
+    batches = _rewrite_batches(pending)
+    first_batch = batches[0] if batches else []
+    extra_calls = [
+        _run_part(client, "rewrites", _build_rewrite_part_prompt(resume_text, jd_block, sections, batch), REWRITE_MAX_TOKENS)
+        for batch in batches[1:]
+    ]
+
     # Create the analysis prompt with HR professional perspective
     prompt = f"""
     你是一位拥有15年经验的资深HR总监、人才招聘专家，同时也是业界知名的简历优化大师，曾在多家知名企业担任招聘负责人，具有丰富的候选人评估和简历优化经验。
@@ -56,7 +193,10 @@ async def analyze_resume(resume_text: str, jd_text: str, api_key: str = None):
     {resume_text}
 
     【目标职位JD】
-    {jd_text}
+    {jd_block}
+
+    【项目改写范围】
+    {_build_rewrite_task(sections, first_batch)}
 
     【输出要求】
     请以HR专业视角，按照以下JSON格式返回详细分析结果：
@@ -70,10 +210,7 @@ async def analyze_resume(resume_text: str, jd_text: str, api_key: str = None):
             "从HR视角的具体改进建议4"
         ],
         "rewritten_projects": [
-            {{
-                "original": "原始项目/工作经历描述",
-                "rewritten": "HR更青睐的优化描述（突出成果、数据、影响力）"
-            }}
+            {_rewrite_item_format(sections)}
         ],
         "hr_insights": {{
             "strengths": ["候选人的核心优势1", "核心优势2"],
@@ -95,50 +232,45 @@ async def analyze_resume(resume_text: str, jd_text: str, api_key: str = None):
     """
 
     try:
-        completion = client.chat.completions.create(
-            model="qwen-max",
-            messages=[
-                {"role": "system", "content": "你是一位拥有15年经验的资深HR总监兼简历优化大师，具有丰富的人才招聘、评估和简历优化经验。请以HR总监+简历优化大师的双重专业视角进行分析，严格按照要求的JSON格式返回结果，确保评估标准符合行业实际情况，同时提供专业的简历优化建议。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,  # 降低温度以获得更专业和一致的输出
-            max_tokens=3000   # 增加token数量以支持更详细的HR洞察
+        completion, *extra_outputs = await _gather_cancelling(
+            create_chat_completion(
+                client,
+                model=RESUME_MODEL,
+                messages=[
+                    {"role": "system", "content": RESUME_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.2,  # 降低温度以获得更专业和一致的输出
+                # 增加token数量以支持更详细的HR洞察；没有需要改写的段落时输出短得多
+                max_tokens=3000 if first_batch or not sections else 1500
+            ),
+            *extra_calls,
         )
 
         response_content = completion.choices[0].message.content
         
         # Try to parse JSON response
         try:
-            # Clean up the response to extract JSON
-            if "```json" in response_content:
-                json_start = response_content.find("```json") + 7
-                json_end = response_content.find("```", json_start)
-                json_content = response_content[json_start:json_end].strip()
-            elif "{" in response_content and "}" in response_content:
-                json_start = response_content.find("{")
-                json_end = response_content.rfind("}") + 1
-                json_content = response_content[json_start:json_end]
-            else:
-                json_content = response_content
-
-            parsed_result = json.loads(json_content)
+            parsed_result = _parse_json_response(response_content)
+            new_rewrites, failed_batches = _collect_rewrites(
+                parsed_result.get("rewritten_projects", []), extra_outputs
+            )
             
             # Validate and ensure all required fields exist
             result = {
                 "match_score": int(parsed_result.get("match_score", 0)),
                 "missing_keywords": parsed_result.get("missing_keywords", []),
                 "improvement_suggestions": parsed_result.get("improvement_suggestions", []),
-                "rewritten_projects": parsed_result.get("rewritten_projects", []),
-                "hr_insights": parsed_result.get("hr_insights", {
-                    "strengths": [],
-                    "concerns": [],
-                    "interview_focus": [],
-                    "salary_range_suggestion": "需要更多信息才能给出薪资建议"
-                })
+                "rewritten_projects": await _merge_rewrites(sections, cached_rewrites, new_rewrites, jd_key),
+                "hr_insights": parsed_result.get("hr_insights", DEFAULT_HR_INSIGHTS)
             }
+            if failed_batches:
+                # 缺了部分改写的结果不进入分析缓存，重试时只补改写失败的段落（其余段落已写入段落缓存）
+                result["error"] = f"部分项目改写失败: {failed_batches} 批"
             
-            return result
+            return _validated(result)
             
+        # pydantic 的 ValidationError 也是 ValueError
         except (json.JSONDecodeError, KeyError, ValueError) as e:
             print(f"JSON parsing error: {e}")
             print(f"Raw response: {response_content}")
@@ -152,6 +284,8 @@ async def analyze_resume(resume_text: str, jd_text: str, api_key: str = None):
                 "raw_response": response_content
             }
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"API call error: {e}")
         return {
@@ -161,3 +295,156 @@ async def analyze_resume(resume_text: str, jd_text: str, api_key: str = None):
             "rewritten_projects": [],
             "error": str(e)
         }
+
+# ---------- 并行模式：拆分为独立子调用 ----------
+
+# 各子调用的输出要求和 max_tokens；评分和关键词输出最短，通常最先返回；改写按 REWRITE_BATCH_SIZE 分批，每批一个调用
+RESUME_PART_TASKS = {
+    "score": ("""请评估这份简历与目标职位的匹配度，并找出JD中要求但简历中缺失的核心技能、关键经验和工具/技术。
+    评分标准：严格按照HR行业标准，60分以下为不匹配，60-75为基本匹配，75-85为良好匹配，85+为优秀匹配；关键词重点关注ATS系统会筛选的核心技能和必备经验。
+    只返回以下JSON：
+    {"match_score": 匹配度分数(0-100整数), "missing_keywords": ["缺失的核心技能", "缺失的关键经验", "缺失的工具/技术"]}""", 400),
+    "suggestions": ("""请从HR+简历优化大师的双重视角给出4-6条具体可执行的简历改进建议，避免空泛建议，包括简历包装、关键词优化、数据量化技巧和ATS优化。
+    只返回以下JSON：
+    {"improvement_suggestions": ["具体改进建议1", "具体改进建议2", "具体改进建议3", "具体改进建议4"]}""", 1000),
+    "rewrites": ("""请用HR喜欢的STAR法则（情境-任务-行动-结果）+简历优化大师的文案技巧重新包装经历描述，突出成果、数据和影响力。
+    {rewrite_task}
+    只返回以下JSON：
+    {"rewritten_projects": [{rewrite_item}]}""", REWRITE_MAX_TOKENS),
+    "insights": ("""请提供只有资深HR才能给出的深度见解：候选人的核心优势、HR关注的潜在问题、面试时应重点考察的方面，以及基于经验和技能的薪资建议区间。
+    只返回以下JSON：
+    {"hr_insights": {"strengths": ["核心优势1", "核心优势2"], "concerns": ["潜在问题1", "潜在问题2"], "interview_focus": ["重点考察方面1", "重点考察方面2"], "salary_range_suggestion": "薪资建议区间"}}""", 1000),
+}
+
+def _build_part_prompt(resume_text: str, jd_block: str, task: str) -> str:
+    # 简历和 JD 放在前面，各子调用的提示词前缀完全相同，便于服务端复用前缀缓存
+    return f"""
+    你是一位拥有15年经验的资深HR总监、人才招聘专家，同时也是业界知名的简历优化大师，深谙招聘官的心理和偏好，深度了解各行业的人才需求和ATS简历筛选系统。
+
+    【候选人简历】
+    {resume_text}
+
+    【目标职位JD】
+    {jd_block}
+
+    【本次任务】
+    {task}
+
+    所有内容用中文，语言专业且具有说服力。
+    """
+
+def _build_rewrite_part_prompt(resume_text: str, jd_block: str, sections: List[ResumeSection],
+                               batch: List[ResumeSection]) -> str:
+    """单独的改写调用（一批段落）的提示词"""
+    task = RESUME_PART_TASKS["rewrites"][0]
+    task = task.replace("{rewrite_task}", _build_rewrite_task(sections, batch))
+    return _build_part_prompt(resume_text, jd_block, task.replace("{rewrite_item}", _rewrite_item_format(sections)))
+
+async def _gather_cancelling(*aws):
+    """并发执行，任一失败（或自身被取消）时取消其余调用"""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def _collect_rewrites(items: list, outputs: list):
+    """合并主调用和各改写批次返回的改写项，返回 (改写项, 失败的批次数)"""
+    items = list(items) if isinstance(items, list) else []
+    failed = 0
+    for name, output, _elapsed_ms in outputs:
+        if isinstance(output, Exception):
+            print(f"Resume rewrite batch failed: {output}")
+            failed += 1
+        elif isinstance(output.get("rewritten_projects"), list):
+            items.extend(output["rewritten_projects"])
+    return items, failed
+
+async def _run_part(client, name: str, prompt: str, max_tokens: int):
+    """执行一个子调用，返回 (名称, 解析后的 JSON 或异常, 耗时毫秒)"""
+    started = time.perf_counter()
+    try:
+        completion = await create_chat_completion(
+            client,
+            model=RESUME_MODEL,
+            messages=[
+                {"role": "system", "content": RESUME_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=max_tokens
+        )
+        result = _parse_json_response(completion.choices[0].message.content)
+        if not isinstance(result, dict):
+            raise ValueError("AI响应不是JSON对象")
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        result = e
+    return name, result, round((time.perf_counter() - started) * 1000)
+
+async def _analyze_resume_parallel(client, resume_text: str, jd_block: str, sections: List[ResumeSection],
+                                   cached_rewrites: dict, pending: List[ResumeSection], jd_key: str):
+    """评分/关键词、改进建议、项目改写、HR洞察四个子调用并发执行，合并为与单次调用相同的结构"""
+    parts = [
+        (name, _build_part_prompt(resume_text, jd_block, task), max_tokens)
+        for name, (task, max_tokens) in RESUME_PART_TASKS.items()
+        if name != "rewrites"
+    ]
+    # 改写按批次拆成多个调用；无法识别段落时由模型自选，只需一个调用；所有段落都有缓存时不需要改写调用
+    batches = _rewrite_batches(pending) if sections else [[]]
+    for index, batch in enumerate(batches, 1):
+        name = "rewrites" if len(batches) == 1 else f"rewrites-{index}"
+        parts.append((name, _build_rewrite_part_prompt(resume_text, jd_block, sections, batch), REWRITE_MAX_TOKENS))
+
+    tasks = [asyncio.create_task(_run_part(client, name, prompt, max_tokens)) for name, prompt, max_tokens in parts]
+    outputs = {}
+    timings = []
+    try:
+        for finished in asyncio.as_completed(tasks):
+            name, output, elapsed_ms = await finished
+            outputs[name] = output
+            timings.append(f"{name} {elapsed_ms}ms")
+    finally:
+        # 截止时间到了或请求被取消时，不再等待其余子调用
+        for task in tasks:
+            task.cancel()
+    print(f"Resume analysis parts (in completion order): {', '.join(timings)}")
+
+    new_rewrites, _ = _collect_rewrites(
+        [], [(name, output, 0) for name, output in outputs.items() if name.startswith("rewrites")]
+    )
+    failed = [name for name, output in outputs.items() if isinstance(output, Exception)]
+    for name in failed:
+        if not name.startswith("rewrites"):
+            print(f"Resume analysis part {name} failed: {outputs[name]}")
+    ok = {name: output for name, output in outputs.items() if name not in failed}
+
+    try:
+        match_score = int(ok.get("score", {}).get("match_score", 0))
+    except (TypeError, ValueError):
+        match_score = 0
+    result = {
+        "match_score": match_score,
+        "missing_keywords": ok.get("score", {}).get("missing_keywords", []),
+        "improvement_suggestions": ok.get("suggestions", {}).get("improvement_suggestions", []),
+        "rewritten_projects": await _merge_rewrites(sections, cached_rewrites, new_rewrites, jd_key),
+        "hr_insights": ok.get("insights", {}).get("hr_insights", DEFAULT_HR_INSIGHTS),
+    }
+    if failed:
+        # 部分结果仍然返回给用户；带 error 字段的结果不进入分析缓存，重试时重新分析
+        result["error"] = f"部分分析失败: {', '.join(failed)}"
+        if "suggestions" in failed:
+            result["improvement_suggestions"] = ["部分AI分析失败，请稍后重试以获得完整建议"]
+    try:
+        return _validated(result)
+    except ValueError as e:
+        print(f"Resume analysis parts validation error: {e}")
+        return {
+            "match_score": 50,
+            "missing_keywords": ["解析错误"],
+            "improvement_suggestions": ["AI响应解析失败，请检查API配置或重试"],
+            "rewritten_projects": [],
+            "error": "Failed to parse AI response"
+        }
@@ -3,14 +3,30 @@
 提供比本地Tesseract更准确的文字识别
 """
 
-import base64
 import json
 import os
-import requests
-from typing import Optional
+from typing import Optional, Tuple
 import asyncio
 import aiohttp
 
+from .deadline import DeadlineExceeded, call_with_retries
+from .image_preprocess import prepare_image
+
+# 单次云端 OCR 请求的超时上限（秒），实际超时不超过请求剩余时间
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "15"))
+# 可重试的 HTTP 状态码（限流、服务端错误）
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class RetryableStatusError(Exception):
+    """OCR 服务返回了可重试的状态码"""
+
+    def __init__(self, status: int):
+        self.status = status
+        super().__init__(f"HTTP {status}")
+
+def _is_retryable_http_error(error: Exception) -> bool:
+    return isinstance(error, (RetryableStatusError, aiohttp.ClientError))
+
 class CloudOCR:
     """云端OCR服务管理器"""
     
@@ -27,55 +43,99 @@ class CloudOCR:
         self.tencent_secret_id = os.getenv('TENCENT_SECRET_ID')
         self.tencent_secret_key = os.getenv('TENCENT_SECRET_KEY')
 
+        # 共享的 HTTP 会话（连接池），首次使用或预热时创建
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def open_session(self) -> aiohttp.ClientSession:
+        """获取共享会话，复用 TCP/TLS 连接"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        """关闭共享会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _post_json(self, stage: str, url: str, **kwargs) -> Tuple[int, Optional[dict]]:
+        """
+        POST 请求并解析 JSON 响应，429/5xx 和连接错误按截止时间退避重试
+
+        Returns:
+            (状态码, 响应 JSON)；非 200 响应的 JSON 为 None
+        """
+        session = await self.open_session()
+
+        async def attempt(timeout: float):
+            async with session.post(url, timeout=aiohttp.ClientTimeout(total=timeout), **kwargs) as response:
+                if response.status in RETRYABLE_STATUS:
+                    raise RetryableStatusError(response.status)
+                if response.status != 200:
+                    return response.status, None
+                return response.status, await response.json()
+
+        return await call_with_retries(attempt, stage=stage, timeout=OCR_TIMEOUT, is_retryable=_is_retryable_http_error)
+
     async def extract_text_from_image(self, image_content: bytes) -> str:
         """
         从图片中提取文字，自动选择最佳的OCR服务
         """
         # 尝试顺序：阿里云 -> 百度 -> 腾讯云 -> 本地Tesseract
         
+        # 0. 预处理一次（缩放、矫正方向、灰度化），所有服务共用同一份紧凑载荷
+        try:
+            prepared = await asyncio.to_thread(prepare_image, image_content)
+        except Exception as e:
+            raise Exception(f"图片解码失败: {e}")
+        
         # 1. 尝试阿里云OCR
         if self.aliyun_access_key and self.aliyun_access_secret:
             try:
-                result = await self._aliyun_ocr(image_content)
+                result = await self._aliyun_ocr(prepared.payload_base64)
                 if result:
                     return result
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 print(f"阿里云OCR失败: {e}")
         
         # 2. 尝试百度OCR
         if self.baidu_api_key and self.baidu_secret_key:
             try:
-                result = await self._baidu_ocr(image_content)
+                result = await self._baidu_ocr(prepared.payload_base64)
                 if result:
                     return result
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 print(f"百度OCR失败: {e}")
         
         # 3. 尝试腾讯云OCR
         if self.tencent_secret_id and self.tencent_secret_key:
             try:
-                result = await self._tencent_ocr(image_content)
+                result = await self._tencent_ocr(prepared.payload_base64)
                 if result:
                     return result
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 print(f"腾讯云OCR失败: {e}")
         
         # 4. 降级到本地Tesseract
         try:
-            from .image_parser import extract_text_from_image
-            return await extract_text_from_image(image_content)
+            from .image_parser import extract_text_from_prepared_image
+            return await extract_text_from_prepared_image(prepared)
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             raise Exception(f"所有OCR服务都不可用: {e}")
 
-    async def _aliyun_ocr(self, image_content: bytes) -> Optional[str]:
+    async def _aliyun_ocr(self, image_base64: str) -> Optional[str]:
         """阿里云OCR识别"""
         try:
             # 简化版实现，使用通用文字识别API
             url = "https://ocr-api.cn-hangzhou.aliyuncs.com/"
             
-            # 将图片转换为base64
-            image_base64 = base64.b64encode(image_content).decode('utf-8')
-            
             # 构建请求（这里简化了签名过程）
             # 实际使用时建议使用阿里云SDK
             headers = {
@@ -91,23 +151,23 @@ class CloudOCR:
                 }
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=data, headers=headers) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        # 提取文字内容
-                        text_lines = []
-                        for item in result.get('data', {}).get('content', []):
-                            text_lines.append(item.get('text', ''))
-                        return '\n'.join(text_lines)
+            status, result = await self._post_json("阿里云OCR", url, json=data, headers=headers)
+            if status == 200:
+                # 提取文字内容
+                text_lines = []
+                for item in result.get('data', {}).get('content', []):
+                    text_lines.append(item.get('text', ''))
+                return '\n'.join(text_lines)
             
             return None
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"阿里云OCR错误: {e}")
             return None
 
-    async def _baidu_ocr(self, image_content: bytes) -> Optional[str]:
+    async def _baidu_ocr(self, image_base64: str) -> Optional[str]:
         """百度OCR识别"""
         try:
             # 1. 获取access_token
@@ -118,47 +178,42 @@ class CloudOCR:
                 "client_secret": self.baidu_secret_key
             }
             
-            async with aiohttp.ClientSession() as session:
-                # 获取token
-                async with session.post(token_url, data=token_params) as response:
-                    token_result = await response.json()
-                    access_token = token_result.get("access_token")
-                
-                if not access_token:
-                    return None
-                
-                # 2. 调用OCR API
-                ocr_url = f"https://aip.baidubce.com/rest/2.0/ocr/v1/general_basic?access_token={access_token}"
-                
-                # 图片转base64
-                image_base64 = base64.b64encode(image_content).decode('utf-8')
-                
-                ocr_data = {
-                    "image": image_base64,
-                    "language_type": "CHN_ENG",  # 中英文混合
-                    "detect_direction": "true",  # 检测图像朝向
-                    "paragraph": "false",       # 是否输出段落信息
-                    "probability": "false"      # 是否返回识别结果中每一行的置信度
-                }
+            # 获取token
+            _, token_result = await self._post_json("百度OCR鉴权", token_url, data=token_params)
+            access_token = (token_result or {}).get("access_token")
+            
+            if not access_token:
+                return None
+            
+            # 2. 调用OCR API
+            ocr_url = f"https://aip.baidubce.com/rest/2.0/ocr/v1/general_basic?access_token={access_token}"
+            
+            ocr_data = {
+                "image": image_base64,
+                "language_type": "CHN_ENG",  # 中英文混合
+                "detect_direction": "true",  # 检测图像朝向
+                "paragraph": "false",       # 是否输出段落信息
+                "probability": "false"      # 是否返回识别结果中每一行的置信度
+            }
+            
+            status, result = await self._post_json("百度OCR", ocr_url, data=ocr_data)
+            if status == 200:
+                # 提取文字
+                text_lines = []
+                for item in result.get('words_result', []):
+                    text_lines.append(item.get('words', ''))
                 
-                async with session.post(ocr_url, data=ocr_data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        
-                        # 提取文字
-                        text_lines = []
-                        for item in result.get('words_result', []):
-                            text_lines.append(item.get('words', ''))
-                        
-                        return '\n'.join(text_lines)
+                return '\n'.join(text_lines)
             
             return None
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"百度OCR错误: {e}")
             return None
 
-    async def _tencent_ocr(self, image_content: bytes) -> Optional[str]:
+    async def _tencent_ocr(self, image_base64: str) -> Optional[str]:
         """腾讯云OCR识别"""
         try:
             # 腾讯云OCR实现（简化版）
@@ -166,9 +221,6 @@ class CloudOCR:
             
             url = "https://ocr.tencentcloudapi.com/"
             
-            # 图片转base64
-            image_base64 = base64.b64encode(image_content).decode('utf-8')
-            
             # 构建请求数据
             data = {
                 "Action": "GeneralBasicOCR",
@@ -4,25 +4,36 @@
 
 import json
 import os
-from typing import Dict, List, Any
-from pydantic import BaseModel
-from openai import OpenAI
+from typing import Dict, List, Any, Optional
+from pydantic import BaseModel, TypeAdapter
+from .contract_clauses import (
+    ANALYSIS_ITEM_KEYS, Clause, carry_over_items, diff_clauses, merge_analyses, revision_report, split_clauses
+)
+from .contract_templates import TemplateMatch, split_known_clauses
+from .deadline import DeadlineExceeded
+from .llm_client import create_chat_completion, open_llm_client
+
+# 合同分析使用的模型（也参与在途请求合并的内容哈希）
+CONTRACT_MODEL = "qwen-plus"
 
 class RiskItem(BaseModel):
     title: str
     description: str
     level: str  # 高风险、中风险、低风险
     clause_reference: str = ""
+    clause_id: str = ""  # 对应的条款编号（如 c3），整体性条目为空
 
 class PlainExplanation(BaseModel):
     clause_title: str
     original_text: str
     plain_explanation: str
+    clause_id: str = ""
 
 class Suggestion(BaseModel):
     title: str
     content: str
     priority: str = "中等"
+    clause_id: str = ""
 
 class ContractSummary(BaseModel):
     contract_type: str
@@ -36,18 +47,10 @@ class ContractAnalysis(BaseModel):
     plain_explanations: List[PlainExplanation]
     suggestions: List[Suggestion]
 
-async def analyze_contract(contract_text: str, contract_type: str, context: str, api_key: str) -> Dict[str, Any]:
-    """
-    分析合同内容，识别风险并提供通俗解释
-    """
-    
-    client = OpenAI(
-        api_key=api_key,
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-    )
-    
-    # 构建专业的合同分析提示词
-    system_message = """你是一位经验丰富的法律顾问和合同专家，专门帮助普通人理解复杂的法律文件。你的任务是：
+# 模块加载时构建一次，每个请求直接复用编译好的校验器
+CONTRACT_ANALYSIS_ADAPTER = TypeAdapter(ContractAnalysis)
+
+CONTRACT_SYSTEM_MESSAGE = """你是一位经验丰富的法律顾问和合同专家，专门帮助普通人理解复杂的法律文件。你的任务是：
 
 1. **专业背景**：
    - 拥有15年法律从业经验
@@ -72,13 +75,41 @@ async def analyze_contract(contract_text: str, contract_type: str, context: str,
    - 提供具体可操作的建议
    - 保持客观中立，但偏向保护普通人权益"""
 
+# 每个条目都要标注条款编号，便于修订版只重新分析改动的条款
+CLAUSE_ID_FIELD = '"clause_id": "对应的条款编号（如 c3），整体性内容留空"'
+
+def format_clauses(clauses: List[Clause]) -> str:
+    """带条款编号的合同正文"""
+    return "\n\n".join(f"[{clause.clause_id}] {clause.text}" for clause in clauses)
+
+def _parse_model_json(ai_response: str) -> Dict[str, Any]:
+    # 清理可能的markdown格式
+    if ai_response.startswith('```json'):
+        ai_response = ai_response.replace('```json', '').replace('```', '').strip()
+    elif ai_response.startswith('```'):
+        ai_response = ai_response.replace('```', '').strip()
+    return json.loads(ai_response)
+
+async def analyze_contract(
+    contract_text: str, contract_type: str, context: str, api_key: str, clauses: Optional[List[Clause]] = None
+) -> Dict[str, Any]:
+    """
+    分析合同内容，识别风险并提供通俗解释
+
+    合同按条款编号后发给模型，返回的每个风险、解释和建议都带有 clause_id。
+    """
+    
+    clauses = clauses or split_clauses(contract_text)
+    
+    # 构建专业的合同分析提示词
+
     # 根据合同类型定制分析重点
     contract_focus = get_contract_focus(contract_type)
     
     user_prompt = f"""请分析以下{get_contract_type_name(contract_type)}，重点关注{contract_focus}。
 
-**合同内容：**
-{contract_text}
+**合同内容（方括号中为条款编号）：**
+{format_clauses(clauses)}
 
 **用户补充说明：**
 {context if context else "无特别说明"}
@@ -88,6 +119,7 @@ async def analyze_contract(contract_text: str, contract_type: str, context: str,
 2. 找出所有潜在风险点，特别是对普通人不利的条款
 3. 用通俗语言解释复杂条款的真实含义
 4. 提供具体的建议和应对策略
+5. 每个风险、解释和建议都在 clause_id 中注明对应的条款编号
 
 请严格按照以下JSON格式输出分析结果：
 
@@ -103,21 +135,24 @@ async def analyze_contract(contract_text: str, contract_type: str, context: str,
             "title": "风险点标题",
             "description": "风险的具体描述和可能后果",
             "level": "风险等级（高风险/中风险/低风险）",
-            "clause_reference": "相关条款内容摘要"
+            "clause_reference": "相关条款内容摘要",
+            {CLAUSE_ID_FIELD}
         }}
     ],
     "plain_explanations": [
         {{
             "clause_title": "条款标题或主题",
             "original_text": "原始条款内容（关键部分）",
-            "plain_explanation": "用大白话解释这个条款的真实含义和影响"
+            "plain_explanation": "用大白话解释这个条款的真实含义和影响",
+            {CLAUSE_ID_FIELD}
         }}
     ],
     "suggestions": [
         {{
             "title": "建议标题",
             "content": "具体的建议内容和应对策略",
-            "priority": "建议优先级（高/中/低）"
+            "priority": "建议优先级（高/中/低）",
+            {CLAUSE_ID_FIELD}
         }}
     ]
 }}
@@ -130,34 +165,30 @@ async def analyze_contract(contract_text: str, contract_type: str, context: str,
 - 严格按照JSON格式输出，确保格式正确"""
 
     try:
-        # 调用AI进行分析
-        response = client.chat.completions.create(
-            model="qwen-plus",
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.3,  # 降低随机性，提高分析的一致性
-            max_tokens=4000
-        )
+        # 调用AI进行分析（没有自带 Key 时使用服务器端的服务池）
+        async with open_llm_client(api_key) as client:
+            response = await create_chat_completion(
+                client,
+                model=CONTRACT_MODEL,
+                messages=[
+                    {"role": "system", "content": CONTRACT_SYSTEM_MESSAGE},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=0.3,  # 降低随机性，提高分析的一致性
+                max_tokens=4000
+            )
         
         # 解析AI响应
         ai_response = response.choices[0].message.content.strip()
         
         # 尝试解析JSON
         try:
-            # 清理可能的markdown格式
-            if ai_response.startswith('```json'):
-                ai_response = ai_response.replace('```json', '').replace('```', '').strip()
-            elif ai_response.startswith('```'):
-                ai_response = ai_response.replace('```', '').strip()
-            
-            analysis_data = json.loads(ai_response)
+            analysis_data = _parse_model_json(ai_response)
             
             # 验证数据结构
-            analysis = ContractAnalysis(**analysis_data)
+            analysis = CONTRACT_ANALYSIS_ADAPTER.validate_python(analysis_data)
             
-            return analysis.dict()
+            return CONTRACT_ANALYSIS_ADAPTER.dump_python(analysis)
             
         except json.JSONDecodeError as e:
             print(f"JSON解析错误: {e}")
@@ -182,13 +213,229 @@ async def analyze_contract(contract_text: str, contract_type: str, context: str,
                     "title": "寻求专业帮助",
                     "content": "由于自动分析失败，强烈建议咨询专业律师或法律顾问，确保合同条款对您有利。",
                     "priority": "高"
-                }]
+                }],
+                # 带 error 字段的降级结果不进入分析缓存，也不写入模板库
+                "error": "Failed to parse AI response"
             }
             
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"合同分析错误: {str(e)}")
         raise Exception(f"合同分析失败: {str(e)}")
 
+class ClauseAnalysis(BaseModel):
+    """只针对部分条款的分析结果"""
+    contract_summary: Optional[ContractSummary] = None
+    change_summary: str = ""
+    risks: List[RiskItem] = []
+    plain_explanations: List[PlainExplanation] = []
+    suggestions: List[Suggestion] = []
+
+CLAUSE_ANALYSIS_ADAPTER = TypeAdapter(ClauseAnalysis)
+
+async def analyze_contract_clauses(
+    clauses: List[Clause],
+    all_clauses: List[Clause],
+    contract_type: str,
+    context: str,
+    api_key: str,
+    previous_summary: Optional[Dict[str, Any]] = None,
+    change_notes: str = "",
+) -> Dict[str, Any]:
+    """
+    只分析指定的条款（修订版中新增或修改的条款、模板库中没有的条款）
+
+    其余条款只以目录形式提供给模型作为上下文，提示词长度与需要分析的条款数成正比。
+
+    Args:
+        clauses: 需要分析的条款
+        all_clauses: 合同全部条款，用于生成条款目录
+        previous_summary: 已有的合同概况；为空时要求模型同时给出合同概况
+        change_notes: 修订说明（如"第3条由……改为……"），帮助模型说明改动的影响
+    """
+    contract_focus = get_contract_focus(contract_type)
+    outline = "\n".join(f"[{clause.clause_id}] {clause.title}" for clause in all_clauses)
+    summary_block = (
+        f"**已有的合同概况：**\n{json.dumps(previous_summary, ensure_ascii=False)}\n"
+        if previous_summary else ""
+    )
+    summary_format = "" if previous_summary else """
+    "contract_summary": {
+        "contract_type": "识别出的具体合同类型",
+        "overall_risk": "整体风险等级（高风险/中风险/低风险）",
+        "key_points": "合同核心要点的简要总结（100字以内）",
+        "parties_involved": ["合同各方当事人"]
+    },"""
+
+    user_prompt = f"""请分析以下{get_contract_type_name(contract_type)}中的部分条款，重点关注{contract_focus}。
+其余条款已经分析过，下面的条款目录仅供理解上下文。
+
+**条款目录：**
+{outline}
+
+{summary_block}{change_notes}
+**需要分析的条款（方括号中为条款编号）：**
+{format_clauses(clauses)}
+
+**用户补充说明：**
+{context if context else "无特别说明"}
+
+**分析要求：**
+1. 只针对上面列出的需要分析的条款，找出潜在风险点，用通俗语言解释，并给出具体建议
+2. 每个风险、解释和建议都在 clause_id 中注明对应的条款编号
+3. 如果提供了修订说明，在 change_summary 中用一两句话说明这些改动对用户的影响
+
+请严格按照以下JSON格式输出分析结果：
+
+{{{summary_format}
+    "change_summary": "改动影响说明（没有修订说明时留空）",
+    "risks": [
+        {{
+            "title": "风险点标题",
+            "description": "风险的具体描述和可能后果",
+            "level": "风险等级（高风险/中风险/低风险）",
+            "clause_reference": "相关条款内容摘要",
+            {CLAUSE_ID_FIELD}
+        }}
+    ],
+    "plain_explanations": [
+        {{
+            "clause_title": "条款标题或主题",
+            "original_text": "原始条款内容（关键部分）",
+            "plain_explanation": "用大白话解释这个条款的真实含义和影响",
+            {CLAUSE_ID_FIELD}
+        }}
+    ],
+    "suggestions": [
+        {{
+            "title": "建议标题",
+            "content": "具体的建议内容和应对策略",
+            "priority": "建议优先级（高/中/低）",
+            {CLAUSE_ID_FIELD}
+        }}
+    ]
+}}
+
+严格按照JSON格式输出，确保格式正确"""
+
+    try:
+        async with open_llm_client(api_key) as client:
+            response = await create_chat_completion(
+                client,
+                model=CONTRACT_MODEL,
+                messages=[
+                    {"role": "system", "content": CONTRACT_SYSTEM_MESSAGE},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=0.3,
+                # 输出长度随条款数增长，上限与完整分析相同
+                max_tokens=min(4000, 800 + 400 * len(clauses))
+            )
+        ai_response = response.choices[0].message.content.strip()
+        return CLAUSE_ANALYSIS_ADAPTER.dump_python(CLAUSE_ANALYSIS_ADAPTER.validate_python(_parse_model_json(ai_response)))
+
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        print(f"条款分析错误: {str(e)}")
+        raise Exception(f"合同分析失败: {str(e)}")
+
+# 修订说明中每个条款原文最多保留的字符数
+MAX_CHANGE_NOTE_CHARS = 300
+
+def _change_notes(changes) -> str:
+    """给模型的修订说明：修改条款的旧版原文、删除的条款"""
+    lines = []
+    for change in changes:
+        if change.status == "modified":
+            lines.append(f"- [{change.new.clause_id}] 修改前：{change.old.text[:MAX_CHANGE_NOTE_CHARS]}")
+        elif change.status == "added":
+            lines.append(f"- [{change.new.clause_id}] 为新增条款")
+        elif change.status == "removed":
+            lines.append(f"- 删除了条款：{change.old.text[:MAX_CHANGE_NOTE_CHARS]}")
+    return "**修订说明（与上一版本相比）：**\n" + "\n".join(lines) + "\n" if lines else ""
+
+async def analyze_contract_revision(
+    clauses: List[Clause],
+    previous_clauses: List[Clause],
+    previous_analysis: Dict[str, Any],
+    contract_type: str,
+    context: str,
+    api_key: str,
+    known: Optional[Dict[str, Dict[str, List[Dict]]]] = None,
+) -> Dict[str, Any]:
+    """
+    增量分析合同修订版：按条款对齐新旧版本，只重新分析新增和修改的条款
+
+    未改动条款的风险、解释和建议从上一版本的分析结果中沿用（条款编号换成新版本的编号），
+    已修改或删除条款的旧条目被丢弃，再与新分析的条目按条款顺序合并。
+    改动后的条款如果在模板条款库（known）中已有，同样直接沿用。
+
+    Returns:
+        {"analysis": 合并后的分析结果, "revision": 条款差异与统计}
+    """
+    changes = diff_clauses(previous_clauses, clauses)
+    id_map = {change.old.clause_id: change.new.clause_id for change in changes if change.status == "unchanged"}
+    changed = [change.new for change in changes if change.status in ("modified", "added")]
+    carried = carry_over_items(previous_analysis, id_map)
+    if known and changed:
+        served, changed = split_known_clauses(changed, known)
+        for key in ANALYSIS_ITEM_KEYS:
+            carried[key].extend(served[key])
+
+    fresh: Dict[str, Any] = {}
+    if changed:
+        fresh = await analyze_contract_clauses(
+            changed, clauses, contract_type, context, api_key,
+            previous_summary=previous_analysis.get("contract_summary"),
+            change_notes=_change_notes(changes),
+        )
+    print(f"合同修订增量分析: {len(changed)}/{len(clauses)} 个条款重新分析")
+
+    analysis = merge_analyses(
+        previous_analysis.get("contract_summary") or {},
+        carried,
+        fresh,
+        [clause.clause_id for clause in clauses],
+    )
+    return {
+        "analysis": analysis,
+        "revision": revision_report(changes, len(changed), fresh.get("change_summary", "")),
+    }
+
+async def analyze_contract_from_template(
+    clauses: List[Clause],
+    match: TemplateMatch,
+    contract_type: str,
+    context: str,
+    api_key: str,
+) -> Dict[str, Any]:
+    """
+    分析与已知模板匹配的合同：条款库中已有的条款沿用预先算好的条目，只分析可变条款和新条款
+
+    所有条款都已知时不调用模型，合同概况和整体性条目取自模板。
+
+    Returns:
+        {"analysis": 合并后的分析结果, "template": 匹配的模板、覆盖率和重新分析的条款数}
+    """
+    served, novel = split_known_clauses(clauses, match.known)
+    template_summary = match.summary.get("contract_summary") or {}
+
+    if novel:
+        fresh = await analyze_contract_clauses(novel, clauses, contract_type, context, api_key)
+        summary = fresh.get("contract_summary") or template_summary
+    else:
+        fresh = {key: match.summary.get(key, []) for key in ANALYSIS_ITEM_KEYS}
+        summary = template_summary
+    print(f"合同模板 #{match.template_id} 命中: {len(novel)}/{len(clauses)} 个条款需要分析")
+
+    analysis = merge_analyses(summary, served, fresh, [clause.clause_id for clause in clauses])
+    return {
+        "analysis": analysis,
+        "template": {**match.to_dict(), "analyzed_clauses": len(novel), "total_clauses": len(clauses)},
+    }
+
 def get_contract_type_name(contract_type: str) -> str:
     """获取合同类型的中文名称"""
     type_mapping = {
@@ -0,0 +1,238 @@
+"""
+合同条款切分与版本对比
+
+谈判过程中用户会反复上传同一份合同的修订版。把合同切分为条款并按条款对齐两个版本后，
+只有新增或修改过的条款需要重新分析，未改动条款的分析结果直接沿用，
+修订版的分析成本与改动量成正比，而不是与合同长度成正比。
+"""
+
+import difflib
+import hashlib
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# 条款标题样式，按优先级排列：合同中出现了"第X条"就只按"第X条"切分，其中的 1. 2. 视为条款内的项
+_CLAUSE_HEADING_PATTERNS = [
+    re.compile(r"^第[一二三四五六七八九十百零〇\d]+条"),
+    re.compile(r"^[一二三四五六七八九十]+[、.．]"),
+    re.compile(r"^\d+[、.．](?!\d)"),
+]
+# 计算哈希时去掉条款编号，插入或删除条款导致的重新编号不算修改
+_NUMBERING_RE = re.compile(r"^(第[一二三四五六七八九十百零〇\d]+条|[一二三四五六七八九十]+[、.．]|\d+[、.．])")
+_PUNCTUATION_RE = re.compile(r"[\s,，.。;；:：、\"'“”‘’()（）\[\]【】]")
+
+# 相似度不低于该值的两个条款视为"修改"，否则视为"删除 + 新增"
+MODIFIED_SIMILARITY = 0.5
+MAX_TITLE_LENGTH = 30
+
+# 风险等级由高到低，用于合并后重新计算整体风险
+RISK_LEVELS = ["高风险", "中风险", "低风险"]
+
+
+@dataclass
+class Clause:
+    """合同中的一个条款"""
+    clause_id: str   # 在本版本中的编号，如 c3
+    title: str
+    text: str
+
+    @property
+    def normalized(self) -> str:
+        text = unicodedata.normalize("NFKC", self.text)
+        text = _NUMBERING_RE.sub("", text.lstrip())
+        return _PUNCTUATION_RE.sub("", text).lower()
+
+    @property
+    def content_hash(self) -> str:
+        return hashlib.sha256(self.normalized.encode("utf-8")).hexdigest()
+
+    def to_dict(self) -> Dict:
+        return {"clause_id": self.clause_id, "title": self.title, "text": self.text}
+
+
+@dataclass
+class ClauseChange:
+    """两个版本之间一个条款的变化"""
+    status: str                  # unchanged / modified / added / removed
+    old: Optional[Clause]
+    new: Optional[Clause]
+    similarity: float = 1.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "status": self.status,
+            "old_clause_id": self.old.clause_id if self.old else None,
+            "new_clause_id": self.new.clause_id if self.new else None,
+            "title": (self.new or self.old).title,
+            "old_text": self.old.text if self.old else "",
+            "new_text": self.new.text if self.new else "",
+            "similarity": round(self.similarity, 2),
+        }
+
+
+def split_clauses(contract_text: str) -> List[Clause]:
+    """
+    把合同切分为条款
+
+    按出现的最高级标题样式切分；没有可识别的标题时按段落切分。标题之前的内容（合同名称、当事人信息等）单独成为第一个条款。
+    """
+    lines = [line.strip() for line in contract_text.splitlines()]
+    pattern = next((p for p in _CLAUSE_HEADING_PATTERNS if any(p.match(line) for line in lines)), None)
+
+    blocks: List[List[str]] = []
+    current: List[str] = []
+    for line in lines:
+        if pattern is None:
+            # 没有条款标题：空行分段
+            if not line:
+                if current:
+                    blocks.append(current)
+                    current = []
+                continue
+        elif pattern.match(line) and current:
+            blocks.append(current)
+            current = []
+        if line:
+            current.append(line)
+    if current:
+        blocks.append(current)
+
+    clauses = []
+    for index, block in enumerate(blocks, start=1):
+        title = block[0][:MAX_TITLE_LENGTH]
+        clauses.append(Clause(clause_id=f"c{index}", title=title, text="\n".join(block)))
+    return clauses
+
+
+def clauses_from_dicts(items: List[Dict]) -> List[Clause]:
+    return [Clause(clause_id=item["clause_id"], title=item["title"], text=item["text"]) for item in items]
+
+
+def _similarity(a: Clause, b: Clause) -> float:
+    matcher = difflib.SequenceMatcher(None, a.normalized, b.normalized, autojunk=False)
+    if matcher.real_quick_ratio() < MODIFIED_SIMILARITY or matcher.quick_ratio() < MODIFIED_SIMILARITY:
+        return 0.0
+    return matcher.ratio()
+
+
+def diff_clauses(old: List[Clause], new: List[Clause]) -> List[ClauseChange]:
+    """
+    按条款对齐两个版本
+
+    先按条款内容哈希做序列对齐，内容完全相同的条款直接配对；
+    剩余不匹配的区间内，再按文本相似度把旧条款和新条款配对为"修改"。
+    """
+    matcher = difflib.SequenceMatcher(
+        None, [c.content_hash for c in old], [c.content_hash for c in new], autojunk=False
+    )
+    changes: List[ClauseChange] = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            changes.extend(ClauseChange("unchanged", old[i], new[j]) for i, j in zip(range(i1, i2), range(j1, j2)))
+            continue
+
+        unmatched_old = list(old[i1:i2])
+        for new_clause in new[j1:j2]:
+            best, best_score = None, MODIFIED_SIMILARITY
+            for old_clause in unmatched_old:
+                score = _similarity(old_clause, new_clause)
+                if score >= best_score:
+                    best, best_score = old_clause, score
+            if best is not None:
+                unmatched_old.remove(best)
+                changes.append(ClauseChange("modified", best, new_clause, best_score))
+            else:
+                changes.append(ClauseChange("added", None, new_clause, 0.0))
+        changes.extend(ClauseChange("removed", old_clause, None, 0.0) for old_clause in unmatched_old)
+    return changes
+
+
+def summarize_changes(changes: List[ClauseChange]) -> Dict[str, int]:
+    counts = {"unchanged": 0, "modified": 0, "added": 0, "removed": 0}
+    for change in changes:
+        counts[change.status] += 1
+    return counts
+
+
+def revision_report(changes: List[ClauseChange], reanalyzed_clauses: int, change_summary: str = "") -> Dict:
+    """返回给前端的修订对比：统计、改动条款（新旧原文）和重新分析的条款数"""
+    return {
+        "stats": summarize_changes(changes),
+        "changes": [change.to_dict() for change in changes if change.status != "unchanged"],
+        "reanalyzed_clauses": reanalyzed_clauses,
+        "change_summary": change_summary,
+    }
+
+
+# ---------- 分析结果合并 ----------
+
+ANALYSIS_ITEM_KEYS = ("risks", "plain_explanations", "suggestions")
+
+
+def carry_over_items(previous: Dict, id_map: Dict[str, str]) -> Dict[str, List[Dict]]:
+    """
+    沿用旧版本中未改动条款的分析条目
+
+    Args:
+        previous: 旧版本的分析结果
+        id_map: 未改动条款的 {旧编号: 新编号}
+
+    条目的 clause_id 指向已修改或删除的条款时丢弃；没有 clause_id 的整体性条目保留。
+    """
+    carried = {}
+    for key in ANALYSIS_ITEM_KEYS:
+        items = []
+        for item in previous.get(key, []) or []:
+            clause_id = item.get("clause_id") or ""
+            if not clause_id:
+                items.append(item)
+            elif clause_id in id_map:
+                items.append({**item, "clause_id": id_map[clause_id]})
+        carried[key] = items
+    return carried
+
+
+def overall_risk(risks: List[Dict], default: str = "低风险") -> str:
+    """取所有风险条目中最高的等级"""
+    levels = [risk.get("level", "") for risk in risks]
+    for level in RISK_LEVELS:
+        if any(level in item for item in levels):
+            return level
+    return default if risks else "低风险"
+
+
+def merge_analyses(summary: Dict, carried: Dict[str, List[Dict]], fresh: Dict, clause_order: List[str]) -> Dict:
+    """
+    合并沿用的条目和新分析的条目，按条款在合同中的顺序排列
+
+    Args:
+        summary: 合同概况（contract_summary）
+        carried: carry_over_items 的结果
+        fresh: 只针对新增/修改条款的分析结果
+        clause_order: 新版本中条款编号的顺序
+
+    新分析失败（带 error 字段）时合并结果同样带上 error，调用方据此不缓存、不作为后续修订的基准
+    """
+    position = {clause_id: index for index, clause_id in enumerate(clause_order)}
+
+    def order(item: Dict) -> int:
+        return position.get(item.get("clause_id") or "", len(position))
+
+    merged = {}
+    for key in ANALYSIS_ITEM_KEYS:
+        fresh_items = list(fresh.get(key, []) or [])
+        carried_items = list(carried.get(key, []))
+        if any(not item.get("clause_id") for item in fresh_items):
+            # 新分析给出了整体性条目时，以新的为准，避免与旧版本的整体性条目重复
+            carried_items = [item for item in carried_items if item.get("clause_id")]
+        items = carried_items + fresh_items
+        merged[key] = sorted(items, key=order)
+
+    merged_summary = dict(summary)
+    merged_summary["overall_risk"] = overall_risk(merged["risks"], summary.get("overall_risk", "低风险"))
+    result = {"contract_summary": merged_summary, **merged}
+    if fresh.get("error"):
+        result["error"] = fresh["error"]
+    return result
@@ -0,0 +1,326 @@
+"""
+合同模板指纹库 - 已知条款直接使用预先算好的分析结果
+
+大多数租房、劳动合同是少数几份标准模板的轻度修改版。条款按规范化后的内容哈希
+（与修订对比相同的 Clause.content_hash，忽略编号、空白和标点）建立两类索引：
+- 条款库：合同类型 + 条款哈希 -> 该条款的风险、解释和建议
+- 模板：同一类型合同中一起出现的一组条款哈希，以及模板的合同概况
+
+新合同先与模板匹配，覆盖率达到 TEMPLATE_MATCH_THRESHOLD 时，条款库中已有的条款直接沿用，
+只有可变条款（当事人、金额、日期等）和新条款交给大模型。
+
+每次完成的分析都会写回条款库：模型给出了条目的条款保存其条目；模型没有评论的条款只记录出现次数，
+不作为"无需提示"的结论，下次仍交给模型分析。出现次数按不同合同（合同文本哈希）计数，同一份合同重复提交不会累加。
+一组条款在至少 TEMPLATE_MIN_SIGHTINGS 份不同合同中出现过才提升为模板（只出现一次的当事人、金额条款不会进入模板）；也可以通过管理接口直接登记标准模板。
+模板数和条款库条目数都有上限，超出时淘汰命中最少、最久未用的记录。
+"""
+
+import datetime
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal, ContractClauseEntry, ContractClauseSighting, ContractTemplate, ContractTemplateClause
+from .contract_clauses import ANALYSIS_ITEM_KEYS, Clause
+
+# 设为 0 关闭模板库（每份合同都完整分析）
+TEMPLATE_STORE_ENABLED = os.getenv("CONTRACT_TEMPLATE_STORE", "1") == "1"
+# 合同条款中属于同一模板的比例达到该值时，才沿用条款库中的结果
+TEMPLATE_MATCH_THRESHOLD = float(os.getenv("TEMPLATE_MATCH_THRESHOLD", "0.6"))
+# 条款太少的合同（无法切分的短文本）匹配不可靠，不参与模板库
+MIN_TEMPLATE_CLAUSES = 3
+# 条款至少在这么多份不同的合同中出现过，才作为模板的组成部分
+TEMPLATE_MIN_SIGHTINGS = int(os.getenv("TEMPLATE_MIN_SIGHTINGS", "3"))
+# 模板数和条款库条目数上限
+TEMPLATE_MAX_COUNT = int(os.getenv("TEMPLATE_MAX_COUNT", "200"))
+CLAUSE_LIBRARY_MAX_ENTRIES = int(os.getenv("CLAUSE_LIBRARY_MAX_ENTRIES", "20000"))
+
+
+@dataclass
+class TemplateMatch:
+    """一份合同与模板库的匹配结果"""
+    template_id: Optional[int] = None
+    coverage: float = 0.0                  # 合同条款中属于该模板的比例
+    summary: Dict = field(default_factory=dict)
+    known: Dict[str, Dict[str, List[Dict]]] = field(default_factory=dict)  # 条款哈希 -> 条款库中的条目
+
+    @property
+    def matched(self) -> bool:
+        return self.template_id is not None and self.coverage >= TEMPLATE_MATCH_THRESHOLD
+
+    def to_dict(self) -> Dict:
+        return {"template_id": self.template_id, "coverage": round(self.coverage, 2)}
+
+
+def _empty_items() -> Dict[str, List[Dict]]:
+    return {key: [] for key in ANALYSIS_ITEM_KEYS}
+
+
+def _has_items(items: Optional[Dict[str, List[Dict]]]) -> bool:
+    return bool(items) and any(items.get(key) for key in ANALYSIS_ITEM_KEYS)
+
+
+def split_known_clauses(
+    clauses: List[Clause], known: Dict[str, Dict[str, List[Dict]]]
+) -> Tuple[Dict[str, List[Dict]], List[Clause]]:
+    """
+    把条款分为条款库中已有的和需要分析的
+
+    Returns:
+        (已知条款的条目（clause_id 换成本合同中的编号）, 需要交给模型的条款)
+    """
+    served = _empty_items()
+    novel = []
+    for clause in clauses:
+        items = known.get(clause.content_hash)
+        if items is None:
+            novel.append(clause)
+            continue
+        for key in ANALYSIS_ITEM_KEYS:
+            served[key].extend({**item, "clause_id": clause.clause_id} for item in items.get(key, []))
+    return served, novel
+
+
+def match_template(contract_type: str, clauses: List[Clause]) -> TemplateMatch:
+    """
+    查找条款重合最多的模板，以及条款库中已有的条款（阻塞调用，应放到线程中执行）
+
+    数据库不可用时返回空结果，按完整分析处理。
+    """
+    if not TEMPLATE_STORE_ENABLED or len(clauses) < MIN_TEMPLATE_CLAUSES:
+        return TemplateMatch()
+
+    hashes = list({clause.content_hash for clause in clauses})
+    db = SessionLocal()
+    try:
+        entries = db.query(ContractClauseEntry).filter(
+            ContractClauseEntry.contract_type == contract_type,
+            ContractClauseEntry.clause_hash.in_(hashes),
+            ContractClauseEntry.items.isnot(None),
+        )
+        # 只有模型给出过条目的条款才算已知；没有条目的条款（包括早期写入的空结果）仍交给模型
+        known = {
+            entry.clause_hash: items
+            for entry in entries
+            if _has_items(items := json.loads(entry.items))
+        }
+        if not known:
+            return TemplateMatch()
+
+        overlap = func.count(ContractTemplateClause.clause_hash)
+        best = (
+            db.query(ContractTemplateClause.template_id, overlap)
+            .join(ContractTemplate, ContractTemplate.id == ContractTemplateClause.template_id)
+            .filter(ContractTemplate.contract_type == contract_type, ContractTemplateClause.clause_hash.in_(hashes))
+            .group_by(ContractTemplateClause.template_id)
+            .order_by(overlap.desc())
+            .first()
+        )
+        if best is None:
+            return TemplateMatch(known=known)
+
+        template_id, count = best
+        template = db.get(ContractTemplate, template_id)
+        return TemplateMatch(
+            template_id=template_id,
+            coverage=count / len(hashes),
+            summary=json.loads(template.summary) if template.summary else {},
+            known=known,
+        )
+    except Exception as e:
+        print(f"合同模板库不可用: {e}")
+        return TemplateMatch()
+    finally:
+        db.close()
+
+
+def learn_from_analysis(
+    contract_type: str, clauses: List[Clause], analysis: Dict, match: TemplateMatch, text_hash: str,
+    name: str = "", register: bool = False,
+) -> Optional[int]:
+    """
+    把一次完成的分析写回模板库（阻塞调用，应放到线程中执行）
+
+    - 模型给出了条目的条款写入条款库；已有的条款保留原条目，只增加出现次数。
+      没有条目的条款只记录出现次数，不作为已知结论
+    - 出现次数达到 TEMPLATE_MIN_SIGHTINGS 之前按不同合同计数（text_hash 为合同文本的 sha256），
+      同一份合同再次分析不会累加；达到之后每次分析累加，只作为淘汰时的热度
+    - 匹配到模板时只增加模板命中次数；否则，出现次数达到 TEMPLATE_MIN_SIGHTINGS 的条款
+      占本合同的比例达到 TEMPLATE_MATCH_THRESHOLD 时，以这些条款新建模板
+    - register=True（管理员登记标准模板）时不要求出现次数，以本合同的全部条款新建模板
+
+    带 error 的结果和没有任何条目带 clause_id 的结果（如解析失败时的兜底结果）不写入。
+
+    Returns:
+        模板编号；未写入或未形成模板时返回 None
+    """
+    if not TEMPLATE_STORE_ENABLED or len(clauses) < MIN_TEMPLATE_CLAUSES or analysis.get("error"):
+        return None
+    if not any(item.get("clause_id") for key in ANALYSIS_ITEM_KEYS for item in analysis.get(key) or []):
+        return None
+
+    # 按条款拆分条目；整体性条目归入模板概况
+    per_clause = {clause.clause_id: _empty_items() for clause in clauses}
+    general = _empty_items()
+    for key in ANALYSIS_ITEM_KEYS:
+        for item in analysis.get(key) or []:
+            clause_id = item.get("clause_id") or ""
+            if not clause_id:
+                general[key].append(item)
+            elif clause_id in per_clause:
+                per_clause[clause_id][key].append({**item, "clause_id": ""})
+
+    by_hash: Dict[str, Tuple[Clause, Dict]] = {}
+    for clause in clauses:
+        by_hash.setdefault(clause.content_hash, (clause, per_clause[clause.clause_id]))
+    hashes = list(by_hash)
+
+    db = SessionLocal()
+    try:
+        existing = {
+            entry.clause_hash: entry
+            for entry in db.query(ContractClauseEntry).filter(
+                ContractClauseEntry.contract_type == contract_type,
+                ContractClauseEntry.clause_hash.in_(hashes),
+            )
+        }
+        seen = {
+            row.clause_hash
+            for row in db.query(ContractClauseSighting.clause_hash).filter(
+                ContractClauseSighting.contract_type == contract_type,
+                ContractClauseSighting.text_hash == text_hash,
+                ContractClauseSighting.clause_hash.in_(hashes),
+            )
+        }
+        sightings = {}
+        reached = []
+        grew = False
+        for clause_hash, (clause, items) in by_hash.items():
+            entry = existing.get(clause_hash)
+            if entry is None:
+                entry = ContractClauseEntry(contract_type=contract_type, clause_hash=clause_hash, title=clause.title, hits=0)
+                db.add(entry)
+                grew = True
+            hits = entry.hits or 0
+            if hits >= TEMPLATE_MIN_SIGHTINGS:
+                hits += 1
+            elif clause_hash not in seen:
+                hits += 1
+                if hits < TEMPLATE_MIN_SIGHTINGS:
+                    db.add(ContractClauseSighting(contract_type=contract_type, clause_hash=clause_hash, text_hash=text_hash))
+                else:
+                    reached.append(clause_hash)
+            entry.hits = hits
+            if _has_items(items) and not (entry.items and _has_items(json.loads(entry.items))):
+                entry.items = json.dumps(items, ensure_ascii=False)
+            sightings[clause_hash] = hits
+        if reached:
+            # 已经在足够多的合同中出现过，不再需要逐份记录
+            db.query(ContractClauseSighting).filter(
+                ContractClauseSighting.contract_type == contract_type,
+                ContractClauseSighting.clause_hash.in_(reached),
+            ).delete(synchronize_session=False)
+
+        template_id = None
+        if match.matched and not register:
+            template = db.get(ContractTemplate, match.template_id)
+            if template is not None:
+                template.hits = (template.hits or 0) + 1
+                template.updated_at = datetime.datetime.utcnow()
+                template_id = template.id
+        else:
+            members = hashes if register else [h for h in hashes if sightings[h] >= TEMPLATE_MIN_SIGHTINGS]
+            if len(members) >= MIN_TEMPLATE_CLAUSES and len(members) / len(hashes) >= TEMPLATE_MATCH_THRESHOLD:
+                contract_summary = dict(analysis.get("contract_summary") or {})
+                if not register:
+                    # 自动形成的模板来自某一份用户合同，不保留其中的当事人
+                    contract_summary.pop("parties_involved", None)
+                template = ContractTemplate(
+                    contract_type=contract_type,
+                    name=name or by_hash[members[0]][0].title,
+                    summary=json.dumps({"contract_summary": contract_summary, **general}, ensure_ascii=False),
+                    clause_count=len(members),
+                    hits=0,
+                )
+                db.add(template)
+                db.flush()
+                db.add_all(ContractTemplateClause(template_id=template.id, clause_hash=h) for h in members)
+                template_id = template.id
+                grew = True
+        db.commit()
+        if grew:
+            _evict_over_limit(db)
+        return template_id
+    except IntegrityError:
+        # 另一个 worker 同时写入了相同的条款，本次不再重复写入
+        db.rollback()
+        return None
+    except Exception as e:
+        db.rollback()
+        print(f"合同模板库写入失败: {e}")
+        return None
+    finally:
+        db.close()
+
+
+def _evict_over_limit(db):
+    """模板数、条款库条目数超过上限时，淘汰命中最少、最早写入的记录"""
+    try:
+        _evict(db)
+    except Exception as e:
+        db.rollback()
+        print(f"合同模板库清理失败: {e}")
+
+
+def _evict(db):
+    excess = db.query(func.count(ContractTemplate.id)).scalar() - TEMPLATE_MAX_COUNT
+    if excess > 0:
+        stale = [
+            row.id for row in db.query(ContractTemplate.id)
+            .order_by(ContractTemplate.hits, ContractTemplate.updated_at)
+            .limit(excess)
+        ]
+        db.query(ContractTemplateClause).filter(ContractTemplateClause.template_id.in_(stale)).delete(synchronize_session=False)
+        db.query(ContractTemplate).filter(ContractTemplate.id.in_(stale)).delete(synchronize_session=False)
+        print(f"模板库超过 {TEMPLATE_MAX_COUNT} 个，淘汰 {len(stale)} 个")
+
+    excess = db.query(func.count()).select_from(ContractClauseEntry).scalar() - CLAUSE_LIBRARY_MAX_ENTRIES
+    if excess > 0:
+        stale = [
+            (row.contract_type, row.clause_hash) for row in db.query(ContractClauseEntry.contract_type, ContractClauseEntry.clause_hash)
+            .order_by(ContractClauseEntry.hits, ContractClauseEntry.created_at)
+            .limit(excess)
+        ]
+        for contract_type, clause_hash in stale:
+            for model in (ContractClauseEntry, ContractClauseSighting):
+                db.query(model).filter(
+                    model.contract_type == contract_type, model.clause_hash == clause_hash
+                ).delete(synchronize_session=False)
+        print(f"条款库超过 {CLAUSE_LIBRARY_MAX_ENTRIES} 条，淘汰 {len(stale)} 条")
+    db.commit()
+
+
+def list_templates(contract_type: Optional[str] = None) -> List[Dict]:
+    """模板列表（按命中次数排序），供管理接口查看"""
+    db = SessionLocal()
+    try:
+        query = db.query(ContractTemplate)
+        if contract_type:
+            query = query.filter(ContractTemplate.contract_type == contract_type)
+        return [
+            {
+                "template_id": template.id,
+                "contract_type": template.contract_type,
+                "name": template.name,
+                "clause_count": template.clause_count,
+                "hits": template.hits,
+                "updated_at": template.updated_at.isoformat() if template.updated_at else None,
+            }
+            for template in query.order_by(ContractTemplate.hits.desc(), ContractTemplate.id)
+        ]
+    finally:
+        db.close()
@@ -0,0 +1,50 @@
+"""
+可用 CPU 数 - 考虑 CPU 亲和性和容器的 cgroup 配额
+
+os.cpu_count() 返回的是宿主机核数，在限制了 CPU 的容器里按它启动 worker 或进程池会严重超配。
+uvicorn worker 数（main）和 PDF 解析进程池大小（pdf_parser）都按这里的结果计算。
+"""
+
+import math
+import os
+from typing import Optional
+
+
+def _read_cgroup_cpu_quota() -> Optional[float]:
+    """容器的 CPU 配额（核数），未限制或无法读取时返回 None"""
+    try:
+        # cgroup v2: "<quota> <period>"，quota 为 max 表示不限制
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1: quota 为 -1 表示不限制
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return quota / period if quota > 0 and period > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus() -> int:
+    """当前进程实际可用的 CPU 数：CPU 亲和性与 cgroup 配额中的较小值"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # 非 Linux 平台
+        cpus = os.cpu_count() or 1
+    quota = _read_cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+def get_worker_count() -> int:
+    """WEB_CONCURRENCY 指定 uvicorn worker 数，auto 表示按可用 CPU 数（考虑容器 CPU 限制）"""
+    workers = os.getenv("WEB_CONCURRENCY", "1").strip().lower()
+    if workers == "auto":
+        return available_cpus()
+    return max(1, int(workers))
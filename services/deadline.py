@@ -0,0 +1,126 @@
+"""
+请求截止时间 - 端点设置整体截止时间，逐级传递到文本提取、OCR 和大模型调用
+
+截止时间存放在 contextvar 中，同一请求内的协程和 to_thread 线程都能读到。
+每个阶段的超时取"阶段上限"和"剩余时间"中的较小值；外部调用失败时按指数退避 + 抖动重试，
+剩余时间不足以完成下一次尝试时立即放弃，保证尾延迟有上限。
+"""
+
+import asyncio
+import contextvars
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# 单个分析请求的整体超时（秒）
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "120"))
+# 外部调用最多尝试次数（含第一次）
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+# 退避基数与上限（秒），第 n 次重试前等待 [0, min(上限, 基数 * 2^n)] 之间的随机时间
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+# 剩余时间少于"退避时间 + 这么多秒"时不再重试
+MIN_ATTEMPT_SECONDS = 1.0
+
+
+class DeadlineExceeded(Exception):
+    """请求（或某个阶段）在截止时间内未完成"""
+
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float] = None):
+    """为当前请求设置截止时间；嵌套时取更早的那个"""
+    deadline = time.monotonic() + (seconds if seconds is not None else REQUEST_TIMEOUT)
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """距截止时间的剩余秒数；未设置截止时间时返回 None"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def stage_timeout(cap: Optional[float], share: float = 1.0) -> Optional[float]:
+    """
+    计算本阶段的超时；既没有上限也没有截止时间时返回 None（不限时）
+
+    Args:
+        cap: 本阶段的超时上限，None 表示只受截止时间约束
+        share: 本阶段最多使用剩余时间的比例，为后续阶段预留时间
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    if left <= 0:
+        raise DeadlineExceeded("请求已超时")
+    return left * share if cap is None else min(cap, left * share)
+
+
+async def run_stage(awaitable: Awaitable[T], stage: str, cap: Optional[float] = None, share: float = 1.0) -> T:
+    """在阶段超时内等待 awaitable，超时抛 DeadlineExceeded"""
+    timeout = stage_timeout(cap, share)
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"{stage}超时（{timeout:.0f} 秒）")
+
+
+def backoff_delay(attempt: int) -> float:
+    """第 attempt 次重试前的等待时间（full jitter，避免大量请求同时重试）"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+async def call_with_retries(
+    fn: Callable[[float], Awaitable[T]],
+    stage: str,
+    timeout: float,
+    is_retryable: Callable[[Exception], bool],
+    attempts: int = None,
+) -> T:
+    """
+    带超时和重试地执行一次外部调用
+
+    Args:
+        fn: 接收本次尝试超时（秒）的协程函数
+        stage: 阶段名称，用于日志和错误信息
+        timeout: 单次尝试的超时上限，实际超时不超过剩余时间
+        is_retryable: 判断异常是否可重试（429、5xx、连接错误等）；超时总是可重试
+        attempts: 最多尝试次数，默认 RETRY_MAX_ATTEMPTS
+    """
+    attempts = attempts or RETRY_MAX_ATTEMPTS
+    for attempt in range(attempts):
+        budget = stage_timeout(timeout)
+        try:
+            return await asyncio.wait_for(fn(budget), budget)
+        except Exception as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            if not timed_out and not is_retryable(e):
+                raise
+
+            left = remaining()
+            if left is not None and left <= 0:
+                raise DeadlineExceeded(f"{stage}超时") from e
+
+            delay = backoff_delay(attempt)
+            if attempt == attempts - 1 or (left is not None and left < delay + MIN_ATTEMPT_SECONDS):
+                # 重试次数用完，或剩余时间已不够再试一次
+                if timed_out:
+                    raise DeadlineExceeded(f"{stage}超时（{budget:.0f} 秒）") from e
+                raise
+
+            print(f"{stage}第 {attempt + 1} 次调用失败，{delay:.1f} 秒后重试: {e!r}")
+            await asyncio.sleep(delay)
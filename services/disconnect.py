@@ -0,0 +1,108 @@
+"""
+客户端断开检测 - 用户关闭页面或负载均衡超时断开后，取消仍在进行的 OCR 和大模型调用
+
+请求体读完之后，ASGI receive 通道上只会再出现 http.disconnect 消息；后台监听任务一旦收到，
+正在执行的阶段（文字提取 / AI 分析）立即被取消：排队中的 OCR 页不再开始，进行中的云端 OCR
+和大模型 HTTP 请求随任务取消而断开连接，分析记录也不再写入数据库。
+与其他请求合并的分析（single-flight）只有在最后一个等待者离开时才会真正取消，见 SingleFlight.do。
+被放弃的请求已经花掉的时间按阶段计入 wasted_work，供调试接口查看（当前 worker）。
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+
+class ClientDisconnected(Exception):
+    """客户端已断开，本次请求的剩余工作已取消"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        super().__init__(f"客户端已断开（{stage}）")
+
+
+class WastedWorkStats:
+    """被放弃的请求在各阶段已经耗费的时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, float]] = {}
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            entry = self._stages.setdefault(stage, {"requests": 0, "seconds": 0.0})
+            entry["requests"] += 1
+            entry["seconds"] += seconds
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stages = {
+                stage: {"requests": int(entry["requests"]), "seconds": round(entry["seconds"], 3)}
+                for stage, entry in self._stages.items()
+            }
+        return {
+            "abandoned_requests": sum(entry["requests"] for entry in stages.values()),
+            "wasted_seconds": round(sum(entry["seconds"] for entry in stages.values()), 3),
+            "by_stage": stages,
+        }
+
+
+class DisconnectGuard:
+    """监听一个请求的客户端断开，并在断开时取消正在执行的阶段"""
+
+    def __init__(self, receive: Callable[[], Awaitable[Dict]]):
+        self._receive = receive
+        self._watcher = None
+        self.started = time.perf_counter()
+        self.disconnected = False
+
+    def start(self):
+        self._watcher = asyncio.ensure_future(self._watch())
+
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+
+    async def _watch(self):
+        try:
+            while True:
+                message = await self._receive()
+                if message["type"] == "http.disconnect":
+                    self.disconnected = True
+                    return
+        except Exception as e:
+            # 监听失败时不影响请求本身，只是不再能提前取消
+            print(f"客户端断开监听失败: {e}")
+
+    def _abandon(self, stage: str) -> ClientDisconnected:
+        elapsed = time.perf_counter() - self.started
+        wasted_work.record(stage, elapsed)
+        print(f"客户端已断开，放弃{stage}（请求已耗时 {elapsed:.1f}s）")
+        return ClientDisconnected(stage)
+
+    def check(self, stage: str):
+        """阶段之间调用：客户端已断开时不再继续（例如不再写数据库）"""
+        if self.disconnected:
+            raise self._abandon(stage)
+
+    async def run(self, awaitable: Awaitable[Any], stage: str) -> Any:
+        """执行一个阶段；客户端在此期间断开时取消它并抛出 ClientDisconnected"""
+        self.check(stage)
+        task = asyncio.ensure_future(awaitable)
+        try:
+            if self._watcher is not None and not self._watcher.done():
+                await asyncio.wait({task, self._watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not task.done() and self.disconnected:
+                task.cancel()
+                # 等取消真正完成（连接已关闭、信号量和服务池名额已归还）再返回
+                await asyncio.wait({task})
+                raise self._abandon(stage)
+            return await task
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+
+
+# 创建全局实例
+wasted_work = WastedWorkStats()
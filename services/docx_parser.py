@@ -0,0 +1,313 @@
+"""
+DOCX 文本提取 - 从 zip 中流式解析 word/document.xml
+
+使用增量 XML 解析，边解压边读取段落，处理完的段落立即释放，不在内存中构建整棵文档树。
+保留段落边界和自动编号（如"第1条"、"1.1"），便于后续按条款切分。
+编号既可能写在段落自身的 numPr 中，也可能来自段落样式（如 Word 内置的"列表编号"样式），两者都会解析。
+"""
+
+import asyncio
+import io
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, Optional, Tuple
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# zip 炸弹防护
+MAX_ZIP_ENTRIES = 2000
+MAX_XML_SIZE = 50 * 1024 * 1024      # 解压后的 XML 上限
+MAX_COMPRESSION_RATIO = 100          # 解压后 / 压缩后
+
+
+class DocxError(Exception):
+    """DOCX 文件无效或超出安全限制"""
+
+
+class _LimitedReader:
+    """限制实际解压字节数（zip 头中声明的大小可能是伪造的）"""
+
+    def __init__(self, stream, limit: int):
+        self._stream = stream
+        self._remaining = limit
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size if size and size > 0 else 64 * 1024)
+        self._remaining -= len(data)
+        if self._remaining < 0:
+            raise DocxError("文档内容过大")
+        return data
+
+
+def _open_member(zf: zipfile.ZipFile, name: str):
+    """打开 zip 中的成员并做大小、压缩比检查；不存在时返回 None"""
+    try:
+        info = zf.getinfo(name)
+    except KeyError:
+        return None
+    if info.file_size > MAX_XML_SIZE:
+        raise DocxError("文档内容过大")
+    if info.compress_size and info.file_size / info.compress_size > MAX_COMPRESSION_RATIO:
+        raise DocxError("文档压缩比异常")
+    return _LimitedReader(zf.open(info), MAX_XML_SIZE)
+
+
+# ---------- 自动编号 ----------
+
+_CHINESE_DIGITS = "零一二三四五六七八九"
+
+
+def _chinese_number(value: int) -> str:
+    if value < 10:
+        return _CHINESE_DIGITS[value]
+    if value < 20:
+        return "十" + (_CHINESE_DIGITS[value % 10] if value % 10 else "")
+    if value < 100:
+        return _CHINESE_DIGITS[value // 10] + "十" + (_CHINESE_DIGITS[value % 10] if value % 10 else "")
+    return str(value)
+
+
+def _roman_number(value: int) -> str:
+    numerals = [(1000, "m"), (900, "cm"), (500, "d"), (400, "cd"), (100, "c"), (90, "xc"),
+                (50, "l"), (40, "xl"), (10, "x"), (9, "ix"), (5, "v"), (4, "iv"), (1, "i")]
+    result = ""
+    for number, numeral in numerals:
+        while value >= number:
+            result += numeral
+            value -= number
+    return result
+
+
+def _format_number(value: int, num_fmt: str) -> str:
+    if num_fmt in ("chineseCounting", "chineseCountingThousand", "ideographTraditional", "japaneseCounting"):
+        return _chinese_number(value)
+    if num_fmt == "lowerLetter":
+        return chr(ord("a") + (value - 1) % 26)
+    if num_fmt == "upperLetter":
+        return chr(ord("A") + (value - 1) % 26)
+    if num_fmt == "lowerRoman":
+        return _roman_number(value)
+    if num_fmt == "upperRoman":
+        return _roman_number(value).upper()
+    return str(value)
+
+
+def _read_numbering(zf: zipfile.ZipFile) -> Tuple[Dict[str, Dict[int, Tuple[str, str, int]]], Dict[str, int]]:
+    """
+    读取 numbering.xml
+
+    Returns:
+        ({numId: {ilvl: (numFmt, lvlText, start)}}, {styleId: ilvl})
+        后者是编号级别上 pStyle 指定的样式：使用该样式的段落属于这一级
+    """
+    stream = _open_member(zf, "word/numbering.xml")
+    if stream is None:
+        return {}, {}
+
+    abstract_levels: Dict[str, Dict[int, Tuple[str, str, int]]] = {}
+    num_to_abstract: Dict[str, str] = {}
+    style_levels: Dict[str, int] = {}
+    for _, elem in ET.iterparse(stream, events=("end",)):
+        if elem.tag == W + "abstractNum":
+            levels = {}
+            for lvl in elem.findall(W + "lvl"):
+                ilvl = int(lvl.get(W + "ilvl", "0"))
+                p_style = lvl.find(W + "pStyle")
+                if p_style is not None:
+                    style_levels[p_style.get(W + "val")] = ilvl
+                num_fmt = lvl.find(W + "numFmt")
+                lvl_text = lvl.find(W + "lvlText")
+                start = lvl.find(W + "start")
+                levels[ilvl] = (
+                    num_fmt.get(W + "val", "decimal") if num_fmt is not None else "decimal",
+                    lvl_text.get(W + "val", "") if lvl_text is not None else "",
+                    int(start.get(W + "val", "1")) if start is not None else 1,
+                )
+            abstract_levels[elem.get(W + "abstractNumId")] = levels
+            elem.clear()
+        elif elem.tag == W + "num":
+            abstract = elem.find(W + "abstractNumId")
+            if abstract is not None:
+                num_to_abstract[elem.get(W + "numId")] = abstract.get(W + "val")
+            elem.clear()
+
+    numbering = {num_id: abstract_levels.get(abstract_id, {}) for num_id, abstract_id in num_to_abstract.items()}
+    return numbering, style_levels
+
+
+def _read_style_numbering(zf: zipfile.ZipFile) -> Dict[str, Tuple[Optional[str], Optional[int]]]:
+    """
+    读取 styles.xml 中段落样式的编号（沿 basedOn 继承）
+
+    Returns:
+        {styleId: (numId, ilvl)}；样式没有指定的项为 None
+    """
+    stream = _open_member(zf, "word/styles.xml")
+    if stream is None:
+        return {}
+
+    own: Dict[str, Tuple[Optional[str], Optional[int]]] = {}
+    based_on: Dict[str, str] = {}
+    for _, elem in ET.iterparse(stream, events=("end",)):
+        if elem.tag != W + "style":
+            continue
+        if elem.get(W + "type") == "paragraph":
+            style_id = elem.get(W + "styleId")
+            parent = elem.find(W + "basedOn")
+            if parent is not None:
+                based_on[style_id] = parent.get(W + "val")
+            num_pr = elem.find(f"{W}pPr/{W}numPr")
+            if num_pr is not None:
+                num_id = num_pr.find(W + "numId")
+                ilvl = num_pr.find(W + "ilvl")
+                own[style_id] = (
+                    num_id.get(W + "val") if num_id is not None else None,
+                    int(ilvl.get(W + "val", "0")) if ilvl is not None else None,
+                )
+        elem.clear()
+
+    resolved = {}
+    for style_id in set(own) | set(based_on):
+        num_id, ilvl = None, None
+        current, seen = style_id, set()
+        # 沿继承链向上查找，子样式的设置优先；防止循环引用
+        while current is not None and current not in seen and (num_id is None or ilvl is None):
+            seen.add(current)
+            style_num, style_lvl = own.get(current, (None, None))
+            num_id = num_id if num_id is not None else style_num
+            ilvl = ilvl if ilvl is not None else style_lvl
+            current = based_on.get(current)
+        if num_id is not None:
+            resolved[style_id] = (num_id, ilvl)
+    return resolved
+
+
+class _NumberingState:
+    """按文档顺序为编号段落生成编号文字"""
+
+    def __init__(self, numbering: Dict[str, Dict[int, Tuple[str, str, int]]]):
+        self._numbering = numbering
+        self._counters: Dict[str, Dict[int, int]] = {}
+
+    def label(self, num_id: str, ilvl: int) -> str:
+        levels = self._numbering.get(num_id)
+        if not levels or num_id == "0":
+            return ""
+        num_fmt, lvl_text, start = levels.get(ilvl, ("decimal", f"%{ilvl + 1}.", 1))
+        if num_fmt == "bullet":
+            return "•"
+        if num_fmt == "none":
+            return lvl_text
+
+        counters = self._counters.setdefault(num_id, {})
+        counters[ilvl] = counters.get(ilvl, start - 1) + 1
+        # 上级编号递增时，下级编号重新开始
+        for deeper in [level for level in counters if level > ilvl]:
+            del counters[deeper]
+
+        label = lvl_text
+        for level in range(ilvl + 1):
+            level_fmt, _, level_start = levels.get(level, ("decimal", "", 1))
+            value = counters.get(level, level_start)
+            label = label.replace(f"%{level + 1}", _format_number(value, level_fmt))
+        return label
+
+
+# ---------- 正文 ----------
+
+def _iter_paragraphs(
+    stream,
+    numbering: Dict,
+    style_numbering: Optional[Dict[str, Tuple[Optional[str], Optional[int]]]] = None,
+    style_levels: Optional[Dict[str, int]] = None,
+) -> Iterator[str]:
+    """增量解析 document.xml，逐段产出文字"""
+    state = _NumberingState(numbering)
+    style_numbering = style_numbering or {}
+    style_levels = style_levels or {}
+    body = None
+    table_depth = 0
+    parts = []
+    num_id, ilvl, style_id = None, None, None
+
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == W + "body":
+                body = elem
+            elif tag == W + "tbl":
+                table_depth += 1
+            elif tag == W + "p":
+                parts = []
+                num_id, ilvl, style_id = None, None, None
+            continue
+
+        if tag == W + "t":
+            parts.append(elem.text or "")
+        elif tag == W + "tab":
+            parts.append("\t")
+        elif tag in (W + "br", W + "cr"):
+            parts.append("\n")
+        elif tag == W + "numId":
+            num_id = elem.get(W + "val")
+        elif tag == W + "ilvl":
+            ilvl = int(elem.get(W + "val", "0"))
+        elif tag == W + "pStyle":
+            style_id = elem.get(W + "val")
+        elif tag == W + "p":
+            text = "".join(parts).strip()
+            # 段落自身的 numPr 优先，缺少的部分取自段落样式
+            if style_id in style_numbering:
+                style_num, style_lvl = style_numbering[style_id]
+                if num_id is None:
+                    num_id = style_num
+                if ilvl is None:
+                    ilvl = style_lvl if style_lvl is not None else style_levels.get(style_id, 0)
+            label = state.label(num_id, ilvl or 0) if num_id is not None else ""
+            if label and text:
+                text = f"{label} {text}"
+            yield text
+            elem.clear()
+        elif tag == W + "tbl":
+            table_depth -= 1
+
+        # 顶层段落/表格处理完后从 body 中移除，保证内存占用与文档长度无关
+        if body is not None and table_depth == 0 and tag in (W + "p", W + "tbl"):
+            body.clear()
+
+
+def extract_text_from_docx_sync(file_content: bytes) -> str:
+    """
+    从 DOCX 中提取文字（阻塞调用，应放到线程中执行）
+    """
+    try:
+        with zipfile.ZipFile(io.BytesIO(file_content)) as zf:
+            if len(zf.infolist()) > MAX_ZIP_ENTRIES:
+                raise DocxError("文档结构异常")
+
+            numbering, style_levels = _read_numbering(zf)
+            style_numbering = _read_style_numbering(zf)
+            stream = _open_member(zf, "word/document.xml")
+            if stream is None:
+                raise DocxError("不是有效的 Word 文档")
+
+            lines = []
+            previous_blank = True
+            for paragraph in _iter_paragraphs(stream, numbering, style_numbering, style_levels):
+                # 保留段落边界，连续空段落只保留一个空行
+                if paragraph:
+                    lines.append(paragraph)
+                    previous_blank = False
+                elif not previous_blank:
+                    lines.append("")
+                    previous_blank = True
+            return "\n".join(lines).strip()
+    except DocxError:
+        raise
+    except (zipfile.BadZipFile, ET.ParseError) as e:
+        raise DocxError(f"Word 文档解析失败: {e}")
+
+
+async def extract_text_from_docx(file_content: bytes) -> str:
+    """从 DOCX 中提取文字，在线程中执行，不阻塞事件循环"""
+    return await asyncio.to_thread(extract_text_from_docx_sync, file_content)
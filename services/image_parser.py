@@ -1,8 +1,15 @@
-import io
-from PIL import Image
+import asyncio
+import os
 import pytesseract
 from typing import Optional
 
+from .deadline import DeadlineExceeded, stage_timeout
+from .image_preprocess import PreparedImage, prepare_image
+from .shared_state import cache_get, cache_set
+
+# Upper bound for one Tesseract run in seconds (never more than the request's remaining time)
+TESSERACT_TIMEOUT = float(os.getenv("TESSERACT_TIMEOUT", "30"))
+
 async def extract_text_from_image(image_content: bytes) -> str:
     """
     Extract text from image using OCR (Optical Character Recognition)
@@ -14,42 +21,70 @@ async def extract_text_from_image(image_content: bytes) -> str:
         Extracted text from the image
     """
     try:
-        # Open image from bytes
-        image = Image.open(io.BytesIO(image_content))
-        
-        # Convert to RGB if necessary (for better OCR results)
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Use pytesseract to extract text
-        # Configure for Chinese and English text recognition
-        custom_config = r'--oem 3 --psm 6 -l chi_sim+eng'
-        
-        try:
-            # Try with Chinese + English
-            text = pytesseract.image_to_string(image, config=custom_config)
-        except:
-            # Fallback to English only if Chinese model is not available
-            text = pytesseract.image_to_string(image, config=r'--oem 3 --psm 6')
-        
-        # Clean up the extracted text
-        text = text.strip()
-        
-        # Remove excessive whitespace and empty lines
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-        cleaned_text = '\n'.join(lines)
-        
-        return cleaned_text
-        
+        # Downscale, fix orientation and binarize before OCR (off the event loop)
+        prepared = await asyncio.to_thread(prepare_image, image_content)
+    except Exception as e:
+        raise Exception(f"OCR text extraction failed: {str(e)}")
+
+    return await extract_text_from_prepared_image(prepared)
+
+async def extract_text_from_prepared_image(prepared: PreparedImage) -> str:
+    """
+    Run Tesseract on an image that already went through prepare_image()
+    """
+    try:
+        # Tesseract runs in a subprocess; don't block the event loop while waiting.
+        # pytesseract kills the subprocess on timeout, so a stuck page can't outlive the request
+        timeout = stage_timeout(TESSERACT_TIMEOUT)
+        return await asyncio.to_thread(_run_tesseract, prepared.binary, timeout)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise Exception(f"OCR text extraction failed: {str(e)}")
 
+def _run_tesseract(image, timeout: float = 0) -> str:
+    """
+    Blocking Tesseract call, executed in a worker thread
+    """
+    # Use pytesseract to extract text
+    # Configure for Chinese and English text recognition
+    custom_config = r'--oem 3 --psm 6 -l chi_sim+eng'
+    
+    try:
+        # Try with Chinese + English
+        text = pytesseract.image_to_string(image, config=custom_config, timeout=timeout)
+    except Exception as e:
+        # pytesseract signals a killed subprocess with RuntimeError('Tesseract process timeout')
+        if str(e) == 'Tesseract process timeout':
+            raise DeadlineExceeded(f"本地OCR超时（{timeout:.0f} 秒）") from e
+        # Fallback to English only if Chinese model is not available
+        text = pytesseract.image_to_string(image, config=r'--oem 3 --psm 6', timeout=timeout)
+    
+    # Clean up the extracted text
+    text = text.strip()
+    
+    # Remove excessive whitespace and empty lines
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    cleaned_text = '\n'.join(lines)
+    
+    return cleaned_text
+
+# Tesseract availability probe is cached across workers (it spawns a subprocess)
+TESSERACT_STATUS_TTL = 300
+
 def is_tesseract_available() -> bool:
     """
-    Check if Tesseract OCR is available on the system
+    Check if Tesseract OCR is available on the system (blocking: call it via asyncio.to_thread)
     """
+    cached = cache_get("ocr:tesseract_available")
+    if cached is not None:
+        return cached
+
     try:
         pytesseract.get_tesseract_version()
-        return True
+        available = True
     except:
-        return False
+        available = False
+
+    cache_set("ocr:tesseract_available", available, ttl=TESSERACT_STATUS_TTL)
+    return available
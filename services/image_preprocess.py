@@ -0,0 +1,122 @@
+"""
+OCR 图片预处理 - 在任何 OCR 之前统一缩放、矫正方向、灰度化
+
+手机拍摄的简历动辄 12MP 以上，而 OCR 只需要约 200 DPI 的分辨率。
+预处理只做一次，结果同时供云端 OCR（紧凑的 JPEG + 预先编码好的 base64）
+和本地 Tesseract（二值化图像）使用。
+"""
+
+import base64
+import io
+import os
+from dataclasses import dataclass
+
+from PIL import Image, ImageOps
+
+# 目标分辨率：按 A4 纸短边 8.27 英寸计算短边像素上限
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "200"))
+PAGE_SHORT_SIDE_INCHES = 8.27
+MAX_SHORT_SIDE = int(PAGE_SHORT_SIDE_INCHES * OCR_TARGET_DPI)
+
+# 发给云端 OCR 的 JPEG 质量
+PAYLOAD_JPEG_QUALITY = 85
+
+
+@dataclass
+class PreparedImage:
+    """预处理后的图片"""
+    binary: Image.Image      # 二值化图像，供 Tesseract 使用
+    payload: bytes           # 紧凑的灰度 JPEG，供所有云端 OCR 共用
+    payload_base64: str      # payload 的 base64，只编码一次
+    original_size: tuple
+    size: tuple
+
+
+def _target_scale(size: tuple) -> float:
+    """短边超过上限时的缩放比例（只缩小不放大）"""
+    short_side = min(size)
+    if short_side <= MAX_SHORT_SIDE:
+        return 1.0
+    return MAX_SHORT_SIDE / short_side
+
+
+def _otsu_threshold(gray: Image.Image) -> int:
+    """Otsu 法求全局二值化阈值"""
+    histogram = gray.histogram()
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+
+    sum_background = 0
+    weight_background = 0
+    best_threshold, best_variance = 127, 0.0
+    for threshold, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += threshold * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = threshold, variance
+    return best_threshold
+
+
+def prepare_image(image_content: bytes) -> PreparedImage:
+    """
+    预处理图片（CPU 密集，调用方应放到线程中执行）
+
+    1. JPEG 使用 draft 模式在解码阶段直接按 1/2、1/4、1/8 缩小并输出灰度
+    2. 按 EXIF 方向矫正
+    3. 缩放到目标 DPI
+    4. 灰度 JPEG 作为云端 OCR 的统一载荷；Otsu 二值化图像供 Tesseract 使用
+    """
+    image = Image.open(io.BytesIO(image_content))
+    original_size = image.size
+    original_format = image.format
+    scale = _target_scale(original_size)
+
+    if original_format == "JPEG":
+        # draft 只会缩小到不小于请求尺寸，剩余部分再由 resize 精确处理
+        image.draft("L", (int(original_size[0] * scale), int(original_size[1] * scale)))
+
+    # EXIF 方向标记（0x0112），1 表示无需旋转
+    oriented = image.getexif().get(0x0112, 1) != 1
+    if oriented:
+        image = ImageOps.exif_transpose(image)
+
+    if image.mode != "L":
+        if image.mode in ("RGBA", "LA", "P"):
+            # 透明背景按白底处理，避免变成黑色
+            image = image.convert("RGBA")
+            background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+            image = Image.alpha_composite(background, image)
+        image = image.convert("L")
+
+    scale = _target_scale(image.size)
+    if scale < 1.0:
+        target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(target, Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=PAYLOAD_JPEG_QUALITY, optimize=True)
+    payload = buffer.getvalue()
+
+    # 原图本来就足够小且无需变换时直接使用原图，避免重新编码反而变大
+    unchanged = image.size == original_size and not oriented
+    if unchanged and original_format in ("JPEG", "PNG") and len(image_content) <= len(payload):
+        payload = image_content
+
+    threshold = _otsu_threshold(image)
+    binary = image.point(lambda value: 255 if value > threshold else 0, mode="1")
+
+    return PreparedImage(
+        binary=binary,
+        payload=payload,
+        payload_base64=base64.b64encode(payload).decode("utf-8"),
+        original_size=original_size,
+        size=image.size,
+    )
@@ -0,0 +1,300 @@
+"""
+JD 近似去重索引 - 字符 shingle MinHash + LSH，持久化在 SQLite
+
+很多用户粘贴的是同一份热门职位描述，只在空白、薪资行或页脚上有差别。
+每份新 JD 先映射到一个规范 JD（canonical JD），规范 JD 编号只用于缓存键和在途请求合并，
+近似重复的 JD 因此复用同一份分析结果缓存。JD 派生的产物（任职要求、关键词、用于提示词的
+精简版 JD）始终从用户自己提交的 JD 提取，并按规范化文本存储，完全相同的 JD 不再重复提取。
+"""
+
+import hashlib
+import heapq
+import json
+import os
+import random
+import re
+import unicodedata
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal, JobDescriptionEntry, JobDescriptionBucket
+
+# 判定为同一份 JD 的 Jaccard 相似度阈值
+JD_DUP_THRESHOLD = float(os.getenv("JD_DUP_THRESHOLD", "0.8"))
+# 精简版 JD 的最大字符数
+JD_CONDENSED_MAX_CHARS = int(os.getenv("JD_CONDENSED_MAX_CHARS", "2000"))
+# 参与 MinHash 的 shingle 数上限（取哈希值最小的若干个），限制超长 JD 的签名计算量
+JD_MAX_SHINGLES = int(os.getenv("JD_MAX_SHINGLES", "512"))
+
+# MinHash 参数：128 个哈希函数分成 16 个 band，每 band 8 行，
+# 相似度约 0.7 以上的 JD 大概率落入同一个桶，再用签名估算的相似度做最终判定
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+LSH_BANDS = 16
+_ROWS_PER_BAND = NUM_PERM // LSH_BANDS
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# 固定种子，保证不同 worker、不同进程重启后签名一致
+_rng = random.Random(20240611)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+
+@dataclass
+class JDProfile:
+    """规范 JD 及其派生产物"""
+    jd_id: str                                   # 规范 JD 编号，记录近似重复关系
+    text_key: str = ""                           # 用户 JD 规范化文本的哈希，用作分析缓存、在途请求合并和改写缓存的键
+    requirements: List[str] = field(default_factory=list)
+    keywords: List[str] = field(default_factory=list)
+    condensed: str = ""
+    duplicate: bool = False                      # 本次 JD 是否命中了已有的规范 JD
+
+
+# ---------- 规范化与 MinHash ----------
+
+def normalize_jd(jd_text: str) -> str:
+    """全角转半角、统一小写、去掉所有空白，用于去重比较"""
+    text = unicodedata.normalize("NFKC", jd_text).lower()
+    return re.sub(r"\s+", "", text)
+
+
+def _shingle_hashes(normalized: str) -> List[int]:
+    """
+    shingle 哈希值，超过 JD_MAX_SHINGLES 时只保留最小的若干个
+
+    按哈希值取最小的 k 个相当于对 shingle 做一致的随机抽样：两份近似重复的 JD 抽中的 shingle
+    大部分相同，抽样后集合的 Jaccard 相似度仍接近原值，签名计算量则与 JD 长度无关。
+    """
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    hashes = {
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+        for s in shingles
+    }
+    if len(hashes) > JD_MAX_SHINGLES:
+        return heapq.nsmallest(JD_MAX_SHINGLES, hashes)
+    return list(hashes)
+
+
+def minhash_signature(normalized: str) -> List[int]:
+    """计算字符 shingle 的 MinHash 签名（纯 CPU 计算，resolve_jd 在线程中调用）"""
+    hashes = _shingle_hashes(normalized)
+    p, mask = _MERSENNE_PRIME, _MAX_HASH
+    return [min([((a * h + b) % p) & mask for h in hashes]) for a, b in _PERMUTATIONS]
+
+
+def estimate_similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """用签名中相同位置相等的比例估算 Jaccard 相似度"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def _band_buckets(signature: List[int]) -> List[str]:
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * _ROWS_PER_BAND:(band + 1) * _ROWS_PER_BAND]
+        digest = hashlib.blake2b(array("I", rows).tobytes(), digest_size=8).hexdigest()
+        buckets.append(f"{band}:{digest}")
+    return buckets
+
+
+# ---------- JD 产物提取 ----------
+
+_BULLET_RE = re.compile(r"^\s*([\-*•●·◆■]|\d+[.、)）]|[(（]\d+[)）]|[一二三四五六七八九十]+[、.])\s*")
+_REQUIREMENT_HEADING_RE = re.compile(r"(任职要求|岗位要求|职位要求|任职资格|任职条件|requirements?|qualifications?)", re.IGNORECASE)
+_SKIP_HEADING_RE = re.compile(r"^(公司介绍|公司简介|关于我们|福利待遇|薪资福利|我们提供|联系方式|工作地点|上班地址)")
+_RESPONSIBILITY_HEADING_RE = re.compile(r"(岗位职责|工作职责|职位描述|工作内容|responsibilities)", re.IGNORECASE)
+# 与能力匹配无关、且经常在重复 JD 之间变化的行
+_NOISE_LINE_RE = re.compile(
+    r"(薪资|薪酬|月薪|年薪|\d+\s*[kK]\s*[-~至]\s*\d+\s*[kK]|\d+\s*[-~至]\s*\d+\s*万|元/月|五险一金|"
+    r"带薪|年终奖|下午茶|团建|联系人|联系电话|邮箱|@|投递|简历请发|扫码|发布于|浏览次数)"
+)
+_REQUIREMENT_HINT_RE = re.compile(r"(熟悉|掌握|精通|了解|经验|学历|本科|硕士|以上|优先|能力)")
+_SKILL_PHRASE_RE = re.compile(r"(?:熟悉|掌握|精通|了解|熟练使用|具备)([^，。；;,.！!？?\n]{2,40})")
+_TECH_TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z0-9+#.\-]*[A-Za-z0-9+#]|[A-Za-z]")
+_KEYWORD_STOPWORDS = {"and", "or", "the", "of", "to", "in", "with", "for", "a", "an", "etc", "is", "on", "jd"}
+MAX_KEYWORDS = 30
+
+
+def _jd_lines(jd_text: str) -> List[str]:
+    lines = []
+    for line in unicodedata.normalize("NFKC", jd_text).splitlines():
+        line = re.sub(r"\s+", " ", line).strip()
+        if line:
+            lines.append(line)
+    return lines
+
+
+def _is_heading(line: str) -> bool:
+    """小节标题：短行，且是已知的小节名、以冒号结尾或带【】"""
+    stripped = line.strip("【】[]#*:： ")
+    if len(stripped) > 12 or _BULLET_RE.match(line):
+        return False
+    return bool(
+        _SKIP_HEADING_RE.match(stripped)
+        or _REQUIREMENT_HEADING_RE.search(stripped)
+        or _RESPONSIBILITY_HEADING_RE.search(stripped)
+        or line.rstrip().endswith((":", "："))
+        or line.lstrip().startswith(("【", "["))
+    )
+
+
+def _extract_keywords(lines: List[str]) -> List[str]:
+    """英文技术词（Python、K8s、C++）+ "熟悉/掌握/精通"后面的中文技能短语"""
+    keywords: List[str] = []
+    seen = set()
+
+    def add(word: str):
+        word = word.strip(" 、/")
+        key = word.lower()
+        if len(word) < 2 and not word.isupper() or key in seen or key in _KEYWORD_STOPWORDS:
+            return
+        seen.add(key)
+        keywords.append(word)
+
+    for line in lines:
+        for token in _TECH_TOKEN_RE.findall(line):
+            add(token)
+        for phrase in _SKILL_PHRASE_RE.findall(line):
+            for part in re.split(r"[、/和及与或等]", phrase):
+                part = part.strip()
+                if 2 <= len(part) <= 12 and not _TECH_TOKEN_RE.fullmatch(part):
+                    add(part)
+    return keywords[:MAX_KEYWORDS]
+
+
+def extract_jd_artifacts(jd_text: str) -> Dict:
+    """
+    提取 JD 派生产物（纯本地规则，不调用大模型）
+
+    Returns:
+        {"requirements": [...], "keywords": [...], "condensed": "..."}
+    """
+    kept: List[str] = []
+    requirements: List[str] = []
+    section = ""  # requirement / skip / 其他
+    for line in _jd_lines(jd_text):
+        if _is_heading(line):
+            if _SKIP_HEADING_RE.match(line.strip("【】[]#*:： ")):
+                section = "skip"
+                continue
+            if _REQUIREMENT_HEADING_RE.search(line):
+                section = "requirement"
+            elif _RESPONSIBILITY_HEADING_RE.search(line):
+                section = "responsibility"
+            if section != "skip":
+                kept.append(line)
+            continue
+        if section == "skip" or _NOISE_LINE_RE.search(line):
+            continue
+        kept.append(line)
+        if section == "requirement":
+            requirements.append(_BULLET_RE.sub("", line))
+
+    # 没有明确的"任职要求"小节时，按关键词挑出要求类的行
+    if not requirements:
+        requirements = [_BULLET_RE.sub("", line) for line in kept if _REQUIREMENT_HINT_RE.search(line)]
+
+    # 去掉重复行（常见于复制粘贴时页面元素重复）
+    condensed_lines = list(dict.fromkeys(kept))
+    condensed = "\n".join(condensed_lines)
+    if len(condensed) > JD_CONDENSED_MAX_CHARS:
+        condensed = condensed[:JD_CONDENSED_MAX_CHARS]
+
+    return {
+        "requirements": requirements,
+        "keywords": _extract_keywords(requirements or condensed_lines),
+        "condensed": condensed,
+    }
+
+
+# ---------- 索引 ----------
+
+def _text_key(text_hash: str) -> str:
+    return f"jd-text-{text_hash[:32]}"
+
+
+def _profile(jd_id: int, text_hash: str, artifacts: str, duplicate: bool) -> JDProfile:
+    return JDProfile(jd_id=f"jd-{jd_id}", text_key=_text_key(text_hash), duplicate=duplicate, **json.loads(artifacts))
+
+
+def _find_duplicate(db, signature: List[int], buckets: List[str]):
+    """在 LSH 桶中找候选规范 JD，返回相似度最高且超过阈值的一条"""
+    candidate_ids = {
+        row.jd_id for row in db.query(JobDescriptionBucket.jd_id).filter(JobDescriptionBucket.bucket.in_(buckets))
+    }
+    if not candidate_ids:
+        return None
+
+    best, best_score = None, JD_DUP_THRESHOLD
+    for entry in db.query(JobDescriptionEntry).filter(JobDescriptionEntry.id.in_(candidate_ids)):
+        score = estimate_similarity(signature, array("Q", entry.signature).tolist())
+        if score >= best_score:
+            best, best_score = entry, score
+    return best
+
+
+def resolve_jd(jd_text: str) -> JDProfile:
+    """
+    把 JD 映射到规范 JD，并返回用户这份 JD 的派生产物（阻塞调用，应放到线程中执行）
+
+    1. 规范化文本完全相同：直接按哈希命中，复用已存储的产物
+    2. 近似重复：MinHash LSH 找到相似度超过 JD_DUP_THRESHOLD 的规范 JD，记录为其变体
+    3. 新 JD：写入索引，成为新的规范 JD
+
+    规范 JD 只决定 jd_id；要求、关键词、精简版 JD 和缓存键（text_key）总是来自用户提交的文本，
+    近似重复的 JD 不会被替换成规范 JD 的内容，也不会共用规范 JD 的缓存结果。
+    数据库不可用时退化为不去重，按文本哈希生成临时编号。
+    """
+    normalized = normalize_jd(jd_text)
+    text_hash = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    db = SessionLocal()
+    try:
+        for _ in range(2):
+            entry = db.query(JobDescriptionEntry).filter(JobDescriptionEntry.text_hash == text_hash).first()
+            if entry is not None:
+                if entry.canonical_id is None:
+                    return _profile(entry.id, text_hash, entry.artifacts, duplicate=True)
+                canonical = db.get(JobDescriptionEntry, entry.canonical_id)
+                if canonical is not None:
+                    return _profile(canonical.id, text_hash, entry.artifacts, duplicate=True)
+                # 规范 JD 已被清理，变体记录作废，按新 JD 重新索引
+                db.delete(entry)
+                db.flush()
+
+            artifacts = json.dumps(extract_jd_artifacts(jd_text), ensure_ascii=False)
+            signature = minhash_signature(normalized)
+            buckets = _band_buckets(signature)
+            canonical = _find_duplicate(db, signature, buckets)
+            try:
+                if canonical is not None:
+                    db.add(JobDescriptionEntry(text_hash=text_hash, canonical_id=canonical.id, artifacts=artifacts))
+                    db.commit()
+                    return _profile(canonical.id, text_hash, artifacts, duplicate=True)
+
+                entry = JobDescriptionEntry(
+                    text_hash=text_hash,
+                    signature=array("Q", signature).tobytes(),
+                    artifacts=artifacts,
+                )
+                db.add(entry)
+                db.flush()
+                db.add_all(JobDescriptionBucket(bucket=bucket, jd_id=entry.id) for bucket in buckets)
+                db.commit()
+                return _profile(entry.id, text_hash, artifacts, duplicate=False)
+            except IntegrityError:
+                # 另一个 worker 刚写入了同一份 JD，重新查一次即可
+                db.rollback()
+        raise RuntimeError("JD 索引写入冲突")
+    except Exception as e:
+        db.rollback()
+        print(f"JD 索引不可用: {e}")
+        return JDProfile(jd_id=f"jd-{text_hash[:16]}", text_key=_text_key(text_hash), **extract_jd_artifacts(jd_text))
+    finally:
+        db.close()
@@ -0,0 +1,31 @@
+"""
+快速 JSON 响应 - 分析结果直接用 orjson 序列化为字节
+
+FastAPI 默认先用 jsonable_encoder 把返回值逐层复制成可序列化的字典，再交给 json.dumps；
+分析结果本身已经是校验过的纯 JSON 数据，两步都是多余的。端点直接返回 FastJSONResponse 时跳过这两步，
+由 orjson 一次完成序列化（输出 UTF-8，中文不转义）。orjson 为可选依赖，未安装时退回标准库 json。
+"""
+
+import json
+from typing import Any
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """序列化为紧凑的 UTF-8 JSON 字节"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """用 orjson 渲染的 JSONResponse（接口与 JSONResponse 相同）"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
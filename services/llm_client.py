@@ -0,0 +1,127 @@
+"""
+大模型客户端 - 服务池成员复用 OpenAI 兼容异步客户端及其连接池，用户自带的 Key 每次请求单独创建
+
+重试由 create_chat_completion 按请求截止时间控制，客户端自身不再重试。
+未指定客户端时使用服务器端的服务池（services.llm_pool），每次尝试重新选择 Key / 端点。
+用户自带的 Key 不进入任何缓存：open_llm_client 为本次请求创建客户端，用完立即关闭其连接池。
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Optional
+
+import openai
+from openai import AsyncOpenAI
+
+from .deadline import call_with_retries
+from .llm_pool import DASHSCOPE_BASE_URL, llm_pool
+
+# 单次大模型调用的超时上限（秒），实际超时不超过请求剩余时间
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "90"))
+# 判断取消是否由本次尝试超时引起时允许的时钟误差（秒）
+TIMEOUT_TOLERANCE = 0.1
+
+
+def _new_client(api_key: str, base_url: str) -> AsyncOpenAI:
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=LLM_TIMEOUT, max_retries=0)
+
+
+@lru_cache(maxsize=None)
+def get_pool_client(api_key: str, base_url: str) -> AsyncOpenAI:
+    """服务池成员的客户端（成员由服务器配置决定，数量固定），同一成员共享 HTTP 连接池"""
+    return _new_client(api_key, base_url)
+
+
+@asynccontextmanager
+async def open_llm_client(api_key: Optional[str]) -> AsyncIterator[Optional[AsyncOpenAI]]:
+    """
+    本次请求使用的客户端
+
+    用户自带 Key 时创建一个只属于本次请求的客户端，退出时关闭（包括请求被取消时）；
+    否则得到 None，由 create_chat_completion 使用服务池。
+    """
+    if not api_key:
+        if not llm_pool.configured:
+            raise ValueError("DashScope API Key is required")
+        yield None
+        return
+
+    client = _new_client(api_key, DASHSCOPE_BASE_URL)
+    try:
+        yield client
+    finally:
+        await client.close()
+
+
+def warm_up_clients():
+    """为服务池中的每个成员提前创建客户端"""
+    for provider in llm_pool.providers:
+        get_pool_client(provider.api_key, provider.base_url)
+
+
+def is_retryable_llm_error(error: Exception) -> bool:
+    """限流（429）、服务端错误（5xx）、连接错误和超时可以重试"""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _is_retryable_pooled_error(error: Exception) -> bool:
+    """服务池中某个 Key 鉴权失败时已被冷却，换一个 Key 重试"""
+    if is_retryable_llm_error(error):
+        return True
+    return (
+        isinstance(error, openai.APIStatusError)
+        and error.status_code in (401, 403)
+        and len(llm_pool.providers) > 1
+    )
+
+
+async def _pooled_chat_completion(timeout: float, kwargs: dict):
+    """
+    从服务池选一个成员完成一次调用，并把结果（含限流响应头）反馈给服务池
+
+    单次尝试超时时 call_with_retries 以取消的方式结束本协程；到达超时时间的取消按超时失败反馈给服务池，
+    让响应慢的成员同样累计失败并冷却，提前的取消（客户端断开）不计入。
+    """
+    loop = asyncio.get_running_loop()
+    attempt_deadline = loop.time() + timeout
+    provider = llm_pool.acquire()
+    client = get_pool_client(provider.api_key, provider.base_url)
+    try:
+        raw = await client.chat.completions.with_raw_response.create(
+            timeout=timeout, **{**kwargs, "model": provider.model_for(kwargs["model"])}
+        )
+    except asyncio.CancelledError as e:
+        timed_out = loop.time() >= attempt_deadline - TIMEOUT_TOLERANCE
+        llm_pool.release(provider, error=asyncio.TimeoutError() if timed_out else e)
+        raise
+    except BaseException as e:
+        llm_pool.release(provider, error=e)
+        raise
+    llm_pool.release(provider, headers=raw.headers)
+    return raw.parse()
+
+
+async def create_chat_completion(client: Optional[AsyncOpenAI], **kwargs):
+    """
+    调用 chat.completions.create，带截止时间感知的超时和抖动重试
+
+    Args:
+        client: 用户自带 Key 的客户端；为 None 时使用服务器端的服务池
+    """
+    if client is not None:
+        return await call_with_retries(
+            lambda timeout: client.chat.completions.create(timeout=timeout, **kwargs),
+            stage="大模型调用",
+            timeout=LLM_TIMEOUT,
+            is_retryable=is_retryable_llm_error,
+        )
+    return await call_with_retries(
+        lambda timeout: _pooled_chat_completion(timeout, kwargs),
+        stage="大模型调用",
+        timeout=LLM_TIMEOUT,
+        is_retryable=_is_retryable_pooled_error,
+    )
@@ -0,0 +1,225 @@
+"""
+大模型服务池 - 把服务器端的调用分散到多个 DashScope API Key / OpenAI 兼容端点
+
+单个 Key 有每秒请求数（QPS）和每分钟 token 数（TPM）上限。池中每个成员（Key + 端点）记录在途请求数、
+限流（429）次数和响应头中的剩余配额；每次调用选择未在冷却中、按权重折算后在途请求最少的成员，
+被限流、配额用尽或连续失败的成员自动冷却一段时间。重试时重新选择成员，被限流的请求会落到其他 Key 上，
+整体吞吐上限随 Key 的数量线性增长。
+
+用户在表单中填写的 API Key 不经过服务池，直接使用该 Key。统计信息按 worker 进程各自维护。
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional
+
+DASHSCOPE_BASE_URL = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+PLACEHOLDER_API_KEY = "sk-your-dashscope-api-key-here"
+
+# 被限流且响应没有 Retry-After 时的冷却时间（秒），连续限流时逐次加倍
+LLM_KEY_COOLDOWN = float(os.getenv("LLM_KEY_COOLDOWN", "10"))
+LLM_KEY_MAX_COOLDOWN = 300.0
+# Key 无效或欠费（401/403）时的冷却时间
+LLM_AUTH_COOLDOWN = float(os.getenv("LLM_AUTH_COOLDOWN", "600"))
+# 连续失败（超时、5xx、连接错误）达到该次数后冷却
+FAILURE_THRESHOLD = 3
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """解析限流响应头中的时长：纯数字（秒）或 "6m0s"、"1.5s"、"20ms" 这样的格式"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts) if parts else None
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+@dataclass
+class Provider:
+    """服务池中的一个成员：一个 API Key + 一个 OpenAI 兼容端点"""
+    name: str
+    api_key: str
+    base_url: str = DASHSCOPE_BASE_URL
+    weight: float = 1.0
+    models: Dict[str, str] = field(default_factory=dict)  # 模型名映射，端点上的模型名与 DashScope 不同时使用
+
+    in_flight: int = 0
+    cooldown_until: float = 0.0
+    cooldown_reason: str = ""
+    consecutive_rate_limits: int = 0
+    consecutive_failures: int = 0
+    requests: int = 0
+    rate_limited: int = 0
+    failures: int = 0
+    remaining_requests: Optional[int] = None
+    remaining_tokens: Optional[int] = None
+
+    def model_for(self, model: str) -> str:
+        return self.models.get(model, model)
+
+    def cool_down(self, seconds: float, reason: str):
+        until = time.monotonic() + seconds
+        if until > self.cooldown_until:
+            self.cooldown_until = until
+            self.cooldown_reason = reason
+            print(f"⚠️ 大模型服务 {self.name} 冷却 {seconds:.0f} 秒: {reason}")
+
+    def stats(self, now: float) -> Dict:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "weight": self.weight,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "failures": self.failures,
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+            "cooldown_seconds": round(max(0.0, self.cooldown_until - now), 1),
+            "cooldown_reason": self.cooldown_reason if self.cooldown_until > now else "",
+        }
+
+
+class ProviderPool:
+    """按权重和在途请求数选择成员，并根据响应自动冷却"""
+
+    def __init__(self, providers: List[Provider]):
+        self.providers = providers
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.providers)
+
+    def acquire(self) -> Provider:
+        """
+        选择一个成员并计入在途请求
+
+        优先选未冷却的成员中"在途请求数 / 权重"最小的，相同时选"累计请求数 / 权重"最小的（空闲时按权重轮流）；
+        所有成员都在冷却时选最早恢复的那个。
+        """
+        if not self.providers:
+            raise ValueError("DashScope API Key is required")
+        now = time.monotonic()
+        candidates = [p for p in self.providers if p.cooldown_until <= now]
+        if candidates:
+            provider = min(candidates, key=lambda p: (p.in_flight / p.weight, p.requests / p.weight))
+        else:
+            provider = min(self.providers, key=lambda p: p.cooldown_until)
+        provider.in_flight += 1
+        provider.requests += 1
+        return provider
+
+    def release(self, provider: Provider, error: Optional[BaseException] = None, headers: Optional[Mapping] = None):
+        """一次调用结束：成功时更新剩余配额，失败时按错误类型累计并决定是否冷却"""
+        provider.in_flight -= 1
+        if error is None:
+            provider.consecutive_rate_limits = 0
+            provider.consecutive_failures = 0
+            if headers is not None:
+                self._update_quota(provider, headers)
+            return
+        if isinstance(error, asyncio.CancelledError):
+            # 请求被取消（客户端断开），不算该成员的问题；超时由调用方以 TimeoutError 反馈
+            return
+
+        status = getattr(error, "status_code", None)
+        response = getattr(error, "response", None)
+        if status == 429:
+            provider.rate_limited += 1
+            provider.consecutive_rate_limits += 1
+            retry_after = None
+            if response is not None:
+                retry_after = _parse_duration(response.headers.get("retry-after"))
+            backoff = LLM_KEY_COOLDOWN * (2 ** (provider.consecutive_rate_limits - 1))
+            provider.cool_down(min(retry_after or backoff, LLM_KEY_MAX_COOLDOWN), "限流（429）")
+        elif status in (401, 403):
+            provider.failures += 1
+            provider.cool_down(LLM_AUTH_COOLDOWN, f"鉴权失败（{status}），请检查 Key 是否有效或欠费")
+        elif status is None or status >= 500:
+            provider.failures += 1
+            provider.consecutive_failures += 1
+            if provider.consecutive_failures >= FAILURE_THRESHOLD:
+                provider.consecutive_failures = 0
+                provider.cool_down(LLM_KEY_COOLDOWN, f"连续 {FAILURE_THRESHOLD} 次调用失败")
+
+    def _update_quota(self, provider: Provider, headers: Mapping):
+        """读取 x-ratelimit-* 响应头；配额用尽时冷却到配额重置"""
+        provider.remaining_requests = _parse_int(headers.get("x-ratelimit-remaining-requests"))
+        provider.remaining_tokens = _parse_int(headers.get("x-ratelimit-remaining-tokens"))
+        for kind, remaining in (("requests", provider.remaining_requests), ("tokens", provider.remaining_tokens)):
+            if remaining == 0:
+                reset = _parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                provider.cool_down(min(reset or LLM_KEY_COOLDOWN, LLM_KEY_MAX_COOLDOWN), f"{kind} 配额用尽")
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "providers": [provider.stats(now) for provider in self.providers],
+            "available": sum(1 for provider in self.providers if provider.cooldown_until <= now),
+        }
+
+
+def _valid_key(api_key: str) -> bool:
+    return bool(api_key) and api_key != PLACEHOLDER_API_KEY
+
+
+def load_providers() -> List[Provider]:
+    """
+    从环境变量读取服务池成员，按以下优先级：
+
+    1. LLM_PROVIDERS：JSON 数组，每项 {"api_key", "base_url", "weight", "name", "models"}，可混合多个 OpenAI 兼容端点
+    2. DASHSCOPE_API_KEYS：逗号分隔的多个 DashScope Key，"Key*2" 表示权重为 2
+    3. DASHSCOPE_API_KEY：单个 Key
+    """
+    providers: List[Provider] = []
+    raw = os.getenv("LLM_PROVIDERS", "").strip()
+    if raw:
+        try:
+            entries = json.loads(raw)
+        except json.JSONDecodeError as e:
+            print(f"⚠️ LLM_PROVIDERS 不是合法的 JSON，已忽略: {e}")
+            entries = []
+        for index, entry in enumerate(entries, start=1):
+            if not _valid_key(entry.get("api_key", "")):
+                continue
+            providers.append(Provider(
+                name=entry.get("name") or f"provider-{index}",
+                api_key=entry["api_key"],
+                base_url=entry.get("base_url") or DASHSCOPE_BASE_URL,
+                weight=max(float(entry.get("weight", 1)), 0.1),
+                models=entry.get("models") or {},
+            ))
+        if providers:
+            return providers
+
+    keys = os.getenv("DASHSCOPE_API_KEYS", "") or os.getenv("DASHSCOPE_API_KEY", "")
+    for index, item in enumerate(filter(None, (part.strip() for part in keys.split(","))), start=1):
+        api_key, _, weight = item.partition("*")
+        if _valid_key(api_key):
+            providers.append(Provider(
+                name=f"dashscope-{index}",
+                api_key=api_key,
+                weight=max(float(weight or 1), 0.1),
+            ))
+    return providers
+
+
+# 创建全局实例
+llm_pool = ProviderPool(load_providers())
@@ -0,0 +1,332 @@
+"""
+数据库维护 - 后台定期执行：按天汇总、清理过期记录、增量 VACUUM 和 ANALYZE
+
+analysis_records 只增不减，单个 SQLite 文件越来越大，查询和备份随之变慢。维护任务每轮依次：
+1. 把已结束的日期汇总到 analysis_daily_stats（记录数、评分分布），只处理上次汇总之后的日期
+2. 配置了保留期（RECORD_RETENTION_DAYS，默认 0 即永久保留，删除需要显式开启）时，分批删除过期数据，
+   每批 RETENTION_BATCH_SIZE 行，批次之间让出写锁：
+   - analysis_records：只删已汇总日期的记录；配置了 RETENTION_ARCHIVE_DIR 时先把这一批写入 gzip NDJSON 归档
+   - contract_analyses：保存着合同全文的条款和分析结果，按同一保留期删除（不归档）
+   - contract_clause_library 中只在少数合同里出现过、没有成为模板的条款条目（可能带有单份合同的具体内容）
+   - contract_clause_sightings 中过期的、或所属条款条目已被删除的出现记录（合同文本哈希）
+3. 删除共享缓存（shared_state）中已过期的条目，包括文字提取缓存和分析结果缓存
+4. incremental_vacuum 归还少量空闲页，PRAGMA optimize 按需更新统计信息（ANALYZE），WAL 检查点
+
+模板表（contract_templates / contract_template_clauses）只包含在多份合同中反复出现的标准条款的哈希，
+大小由 TEMPLATE_MAX_COUNT 限制，不按时间清理；JD 索引保存的是招聘方发布的职位描述，也不清理。
+
+早期创建的数据库需要一次完整 VACUUM 才能开启增量模式；完整 VACUUM 会独占数据库、重写整个文件，
+只在设置 MAINTENANCE_FULL_VACUUM=1 或管理员手动触发（POST /admin/maintenance?full_vacuum=true）时执行。
+
+多 worker 部署时通过共享数据库中的租约保证同一时间只有一个 worker 执行。
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import random
+import time
+import uuid
+from typing import Dict, Optional
+
+from sqlalchemy import case, delete, exists, func, literal_column, or_, select
+
+from database import (
+    SessionLocal, engine, AnalysisDailyStats, AnalysisRecord, ContractAnalysisRecord, ContractClauseEntry,
+    ContractClauseSighting, SharedStateEntry,
+)
+from .contract_templates import TEMPLATE_MIN_SIGHTINGS
+from .record_export import ExportRange, export_records
+from .shared_state import acquire_lease, cache_get, cache_set
+
+# 两轮维护之间的间隔（秒），0 表示不启动后台维护
+MAINTENANCE_INTERVAL = int(os.getenv("MAINTENANCE_INTERVAL", "3600"))
+# 原始记录和合同分析的保留天数，默认 0 表示永久保留（仍然做汇总和 VACUUM）；删除数据需要显式配置
+RECORD_RETENTION_DAYS = int(os.getenv("RECORD_RETENTION_DAYS", "0"))
+# 每批删除的行数，以及批次之间的停顿（秒），让请求中的写操作有机会拿到写锁
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+RETENTION_BATCH_PAUSE = 0.05
+# 归档目录；为空时过期记录直接删除
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "")
+# 每轮最多归还的空闲页数（每页通常 4KB）
+VACUUM_PAGES_PER_RUN = int(os.getenv("VACUUM_PAGES_PER_RUN", "2000"))
+# 设为 1 时后台维护可以执行一次性的完整 VACUUM（早期数据库切换到增量模式）
+MAINTENANCE_FULL_VACUUM = os.getenv("MAINTENANCE_FULL_VACUUM", "0") == "1"
+# 每轮最多删除的批次数，避免积压很多时一轮跑太久，剩下的留给下一轮
+MAX_BATCHES_PER_RUN = 200
+
+SCORE_BUCKETS = 10
+_AUTO_VACUUM_INCREMENTAL = 2
+
+
+# ---------- 按天汇总 ----------
+
+def _day_start(day: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time())
+
+
+def rollup_daily_stats(today: Optional[datetime.date] = None) -> int:
+    """
+    汇总上次汇总之后、今天之前的每一天（UTC），返回汇总的天数
+
+    已结束的日期不会再有新记录，汇总一次即可；清理只会删除已汇总日期的记录。
+    """
+    today = today or datetime.datetime.utcnow().date()
+    with SessionLocal() as db:
+        last_day = db.execute(select(func.max(AnalysisDailyStats.day))).scalar()
+        if last_day:
+            start = _day_start(datetime.date.fromisoformat(last_day) + datetime.timedelta(days=1))
+        else:
+            first = db.execute(select(func.min(AnalysisRecord.created_at))).scalar()
+            if first is None:
+                return 0
+            start = _day_start(first.date())
+        end = _day_start(today)
+        if start >= end:
+            return 0
+
+        day = func.date(AnalysisRecord.created_at)
+        bucket = case(
+            (AnalysisRecord.match_score.is_(None), -1),
+            else_=func.min(func.max(AnalysisRecord.match_score, 0) // 10, SCORE_BUCKETS - 1),
+        )
+        rows = db.execute(
+            select(
+                day, bucket, func.count(),
+                func.sum(AnalysisRecord.match_score),
+                func.min(AnalysisRecord.match_score),
+                func.max(AnalysisRecord.match_score),
+            )
+            .where(AnalysisRecord.created_at >= start, AnalysisRecord.created_at < end)
+            .group_by(day, bucket)
+        ).all()
+
+        stats: Dict[str, AnalysisDailyStats] = {}
+        histograms: Dict[str, list] = {}
+        for row_day, row_bucket, count, score_sum, score_min, score_max in rows:
+            entry = stats.get(row_day)
+            if entry is None:
+                entry = stats[row_day] = AnalysisDailyStats(day=row_day, total=0, scored=0, score_sum=0)
+                histograms[row_day] = [0] * SCORE_BUCKETS
+            entry.total += count
+            if row_bucket >= 0:
+                entry.scored += count
+                entry.score_sum += score_sum or 0
+                entry.score_min = score_min if entry.score_min is None else min(entry.score_min, score_min)
+                entry.score_max = score_max if entry.score_max is None else max(entry.score_max, score_max)
+                histograms[row_day][row_bucket] += count
+
+        # 没有记录的日期也写一行，汇总的起点随之前移
+        current = start.date()
+        while current < today:
+            key = current.isoformat()
+            entry = stats.get(key) or AnalysisDailyStats(day=key, total=0, scored=0, score_sum=0)
+            entry.score_histogram = json.dumps(histograms.get(key, [0] * SCORE_BUCKETS))
+            entry.updated_at = datetime.datetime.utcnow()
+            db.merge(entry)
+            current += datetime.timedelta(days=1)
+        db.commit()
+        return (today - start.date()).days
+
+
+# ---------- 过期记录清理 ----------
+
+def retention_cutoff() -> Optional[datetime.datetime]:
+    """早于该时间的原始记录可以删除：超过保留期，并且所在日期已经汇总"""
+    if RECORD_RETENTION_DAYS <= 0:
+        return None
+    with SessionLocal() as db:
+        last_day = db.execute(select(func.max(AnalysisDailyStats.day))).scalar()
+    if not last_day:
+        return None
+    rolled_up_until = _day_start(datetime.date.fromisoformat(last_day) + datetime.timedelta(days=1))
+    return min(datetime.datetime.utcnow() - datetime.timedelta(days=RECORD_RETENTION_DAYS), rolled_up_until)
+
+
+def purge_batch(cutoff: datetime.datetime) -> int:
+    """
+    删除（并按需归档）一批过期记录，返回删除的行数
+
+    id 最大的一条记录始终保留：SQLite 的 rowid 在表被清空后会从 1 重新分配，
+    新记录的 id 会落在导出游标之前而被增量导出漏掉。
+    """
+    with SessionLocal() as db:
+        newest_id = select(func.max(AnalysisRecord.id)).scalar_subquery()
+        ids = db.execute(
+            select(AnalysisRecord.id)
+            .where(AnalysisRecord.created_at < cutoff, AnalysisRecord.id < newest_id)
+            .order_by(AnalysisRecord.id)
+            .limit(RETENTION_BATCH_SIZE)
+        ).scalars().all()
+        if not ids:
+            return 0
+
+        if RETENTION_ARCHIVE_DIR:
+            # 每批追加一个 gzip 成员，整个文件仍是合法的 gzip
+            os.makedirs(RETENTION_ARCHIVE_DIR, exist_ok=True)
+            path = os.path.join(
+                RETENTION_ARCHIVE_DIR, f"analysis_records-{datetime.datetime.utcnow():%Y%m%d}.ndjson.gz"
+            )
+            with open(path, "ab") as f:
+                for chunk in export_records(ExportRange(since_id=ids[0] - 1, until_id=ids[-1], until=cutoff), compress=True):
+                    f.write(chunk)
+
+        result = db.execute(
+            delete(AnalysisRecord).where(
+                AnalysisRecord.id.between(ids[0], ids[-1]),
+                AnalysisRecord.created_at < cutoff,
+            )
+        )
+        db.commit()
+        return result.rowcount
+
+
+def stored_data_cutoff() -> Optional[datetime.datetime]:
+    """合同分析等不需要汇总的数据：早于该时间的可以删除"""
+    if RECORD_RETENTION_DAYS <= 0:
+        return None
+    return datetime.datetime.utcnow() - datetime.timedelta(days=RECORD_RETENTION_DAYS)
+
+
+def _purge_rows(model, cutoff: datetime.datetime, *conditions) -> int:
+    """删除一批 created_at 早于 cutoff 的行，返回删除的行数"""
+    return _delete_batch(model, model.created_at < cutoff, *conditions)
+
+
+def _delete_batch(model, *conditions) -> int:
+    """按 rowid 删除一批满足条件的行，返回删除的行数"""
+    rowid = literal_column("rowid")
+    batch = (
+        select(rowid).select_from(model)
+        .where(*conditions)
+        .limit(RETENTION_BATCH_SIZE)
+        .scalar_subquery()
+    )
+    with SessionLocal() as db:
+        result = db.execute(delete(model).where(rowid.in_(batch)))
+        db.commit()
+        return result.rowcount
+
+
+def purge_contract_batch(cutoff: datetime.datetime) -> int:
+    """删除一批过期的合同分析记录（含合同条款原文）"""
+    return _purge_rows(ContractAnalysisRecord, cutoff)
+
+
+def purge_clause_entry_batch(cutoff: datetime.datetime) -> int:
+    """删除一批过期且没有在足够多合同中出现过（未成为模板条款）的条款库条目"""
+    return _purge_rows(ContractClauseEntry, cutoff, ContractClauseEntry.hits < TEMPLATE_MIN_SIGHTINGS)
+
+
+def purge_sighting_batch(cutoff: datetime.datetime) -> int:
+    """删除一批过期的、或条款库条目已被删除的条款出现记录"""
+    entry_exists = exists().where(
+        ContractClauseEntry.contract_type == ContractClauseSighting.contract_type,
+        ContractClauseEntry.clause_hash == ContractClauseSighting.clause_hash,
+    )
+    return _delete_batch(ContractClauseSighting, or_(ContractClauseSighting.created_at < cutoff, ~entry_exists))
+
+
+def purge_expired_cache() -> int:
+    """删除共享缓存中已过期的条目（文字提取、分析结果、段落改写缓存等）"""
+    with SessionLocal() as db:
+        result = db.execute(delete(SharedStateEntry).where(SharedStateEntry.expires_at < time.time()))
+        db.commit()
+        return result.rowcount
+
+
+async def _purge_in_batches(purge, cutoff: datetime.datetime) -> int:
+    deleted = 0
+    for _ in range(MAX_BATCHES_PER_RUN):
+        count = await asyncio.to_thread(purge, cutoff)
+        deleted += count
+        if count < RETENTION_BATCH_SIZE:
+            break
+        await asyncio.sleep(RETENTION_BATCH_PAUSE)
+    return deleted
+
+
+# ---------- VACUUM / ANALYZE ----------
+
+def vacuum_and_analyze(full_vacuum: bool = False) -> Dict:
+    """
+    增量 VACUUM、按需 ANALYZE 和 WAL 检查点；返回数据库页数统计
+
+    Args:
+        full_vacuum: 数据库尚未开启增量模式时，允许执行一次完整 VACUUM 切换过去
+    """
+    report = {}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != _AUTO_VACUUM_INCREMENTAL:
+            if full_vacuum:
+                # 早期创建的数据库没有开启增量模式，完整 VACUUM 一次后才生效（只发生一次，期间独占数据库）
+                print("数据库维护: 切换到增量 VACUUM 模式，执行一次完整 VACUUM")
+                conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.exec_driver_sql("VACUUM")
+            else:
+                # 需要管理员确认后再执行（MAINTENANCE_FULL_VACUUM=1 或 full_vacuum=true）
+                report["full_vacuum_pending"] = True
+        freelist_before = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        # incremental_vacuum 每执行一步只归还一页，executescript 会一直执行到结束
+        conn.connection.dbapi_connection.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_RUN});")
+        # optimize 只对统计信息过时的表执行 ANALYZE，analysis_limit 限制每个索引的扫描行数
+        conn.exec_driver_sql("PRAGMA analysis_limit=1000")
+        conn.exec_driver_sql("PRAGMA optimize")
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        report.update({
+            "page_count": conn.exec_driver_sql("PRAGMA page_count").scalar(),
+            "freed_pages": freelist_before - conn.exec_driver_sql("PRAGMA freelist_count").scalar(),
+        })
+        return report
+
+
+# ---------- 调度 ----------
+
+async def run_maintenance(full_vacuum: bool = False) -> Dict:
+    """
+    执行一轮维护，返回本轮报告（同时写入共享缓存，供调试接口查看）
+
+    Args:
+        full_vacuum: 允许执行一次性的完整 VACUUM（管理员手动触发时传入；也可以用 MAINTENANCE_FULL_VACUUM 开启）
+    """
+    started = time.perf_counter()
+    report = {"started_at": datetime.datetime.utcnow().isoformat()}
+    try:
+        report["rolled_up_days"] = await asyncio.to_thread(rollup_daily_stats)
+
+        cutoff = await asyncio.to_thread(retention_cutoff)
+        report["deleted_records"] = await _purge_in_batches(purge_batch, cutoff) if cutoff is not None else 0
+        report["retention_cutoff"] = cutoff.isoformat() if cutoff else None
+
+        cutoff = stored_data_cutoff()
+        if cutoff is not None:
+            report["deleted_contract_analyses"] = await _purge_in_batches(purge_contract_batch, cutoff)
+            report["deleted_clause_entries"] = await _purge_in_batches(purge_clause_entry_batch, cutoff)
+            report["deleted_clause_sightings"] = await _purge_in_batches(purge_sighting_batch, cutoff)
+        report["deleted_cache_entries"] = await asyncio.to_thread(purge_expired_cache)
+
+        report.update(await asyncio.to_thread(vacuum_and_analyze, full_vacuum or MAINTENANCE_FULL_VACUUM))
+    except Exception as e:
+        report["error"] = str(e)
+        print(f"数据库维护失败: {e}")
+    report["duration_ms"] = round((time.perf_counter() - started) * 1000)
+    print(f"数据库维护完成: {report}")
+    cache_set("maintenance:last_report", report)
+    return report
+
+
+def last_report() -> Optional[Dict]:
+    return cache_get("maintenance:last_report")
+
+
+async def maintenance_loop():
+    """后台循环：每隔 MAINTENANCE_INTERVAL 秒抢一次租约，抢到的 worker 执行维护"""
+    owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    # 错开各 worker 的启动时刻，也避开启动时的请求高峰
+    await asyncio.sleep(random.uniform(30, 90))
+    while True:
+        # 租约略短于间隔：持有者下一轮可以续约，其他 worker 在持有者退出后接手
+        if await asyncio.to_thread(acquire_lease, "maintenance", owner, MAINTENANCE_INTERVAL * 0.9):
+            await run_maintenance()
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
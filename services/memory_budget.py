@@ -0,0 +1,217 @@
+"""
+内存预算 - 限制整个进程同时处理的上传文件、解码图片和 base64 载荷占用的内存
+
+每个请求在读取上传文件之前，按文件大小和类型预估处理过程中的峰值内存并预留；
+预算用完时排队等待，等待超时则拒绝（503），避免大量并发大图上传把容器内存撑爆。
+文字提取完成后立即归还预留额度，不必等到大模型分析结束。
+
+预算只按各请求预估的字节数记账，请求路径上不做任何内存追踪；排查内存问题时由管理员通过调试接口
+临时开启 tracemalloc 采样一段时间，取完快照立即关闭。
+"""
+
+import asyncio
+import os
+import tracemalloc
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+# 每个 worker 进程的内存预算（MB）
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", "512"))
+# 预算不足时最多排队等待的秒数，超时返回 503
+MEMORY_WAIT_TIMEOUT = float(os.getenv("MEMORY_WAIT_TIMEOUT", "10"))
+# 调试接口单次 tracemalloc 采样的最长秒数
+TRACEMALLOC_MAX_SECONDS = 60
+TRACEMALLOC_FRAMES = 5
+
+# 处理过程中的峰值内存 ≈ 文件大小 × 系数（原始字节 + 解码后的图片 + 预处理副本 + base64 载荷）
+# PNG/WebP 压缩率高，解码后的位图远大于文件本身；JPEG 以 draft 模式按目标分辨率解码
+MEMORY_FACTORS = {
+    ".jpg": 3, ".jpeg": 3,
+    ".png": 6, ".webp": 8,
+    ".pdf": 4,   # 多进程解析时每个任务各持有一份文件，扫描页还要提取内嵌图片
+    ".docx": 3,
+    ".txt": 3,
+}
+DEFAULT_MEMORY_FACTOR = 4
+# 每个请求的固定开销（提取出的文本、提示词、响应等）
+REQUEST_BASE_BYTES = 1024 * 1024
+
+
+class MemoryBudgetExceeded(Exception):
+    """等待内存预算超时"""
+
+    def __init__(self, requested: int, retry_after: int = 5):
+        self.requested = requested
+        self.retry_after = retry_after
+        super().__init__("服务器繁忙，请稍后重试")
+
+
+def estimate_memory(files: Iterable[Tuple[int, str]]) -> int:
+    """
+    预估处理一组上传文件的峰值内存
+
+    Args:
+        files: [(文件大小, 扩展名), ...]
+    """
+    total = REQUEST_BASE_BYTES
+    for size, ext in files:
+        total += size * MEMORY_FACTORS.get(ext.lower(), DEFAULT_MEMORY_FACTOR)
+    return total
+
+
+class MemoryReservation:
+    """一次预留；可分阶段提前归还"""
+
+    def __init__(self, accountant: "MemoryAccountant", nbytes: int):
+        self._accountant = accountant
+        self.nbytes = nbytes
+
+    def release(self, nbytes: Optional[int] = None):
+        """归还部分（默认全部）预留额度；重复调用是安全的"""
+        amount = self.nbytes if nbytes is None else min(nbytes, self.nbytes)
+        if amount > 0:
+            self.nbytes -= amount
+            self._accountant._release(amount)
+
+
+class MemoryAccountant:
+    """进程内的内存预算"""
+
+    def __init__(self, limit_bytes: int):
+        self.limit = limit_bytes
+        self.in_use = 0
+        self.peak = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._condition = asyncio.Condition()
+
+    async def reserve(self, nbytes: int, timeout: float = None) -> MemoryReservation:
+        """
+        预留 nbytes 字节，预算不足时等待其他请求归还
+
+        单个请求的预估超过总预算时按总预算计算（独占执行），而不是永远等不到。
+        """
+        nbytes = min(nbytes, self.limit)
+        timeout = MEMORY_WAIT_TIMEOUT if timeout is None else timeout
+
+        async with self._condition:
+            if self.in_use + nbytes > self.limit:
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self.in_use + nbytes <= self.limit),
+                        timeout,
+                    )
+                except asyncio.TimeoutError:
+                    self.rejected += 1
+                    raise MemoryBudgetExceeded(nbytes)
+                finally:
+                    self.waiting -= 1
+
+            self.in_use += nbytes
+            self.peak = max(self.peak, self.in_use)
+        return MemoryReservation(self, nbytes)
+
+    def _release(self, nbytes: int):
+        self.in_use -= nbytes
+
+        async def notify():
+            async with self._condition:
+                self._condition.notify_all()
+
+        # 归还可能发生在同步代码中，唤醒等待者交给事件循环
+        if self.waiting:
+            asyncio.get_running_loop().create_task(notify())
+
+    def stats(self) -> Dict:
+        return {
+            "budget_mb": round(self.limit / 1048576, 1),
+            "reserved_mb": round(self.in_use / 1048576, 1),
+            "peak_reserved_mb": round(self.peak / 1048576, 1),
+            "waiting_requests": self.waiting,
+            "rejected_requests": self.rejected,
+        }
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """进程峰值常驻内存；平台不支持时返回 None"""
+    if resource is None:
+        return None
+    # ru_maxrss 在 Linux 上以 KB 为单位
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _rss_mb() -> Optional[float]:
+    """当前常驻内存（Linux）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1048576, 1)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def memory_snapshot() -> Dict:
+    """内存快照：预算使用情况和进程 RSS"""
+    return {
+        **memory_accountant.stats(),
+        "rss_mb": _rss_mb(),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _top_allocations(snapshot: tracemalloc.Snapshot, limit: int) -> List[Dict]:
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    top: List[Dict] = []
+    for stat in snapshot.statistics("lineno")[:limit]:
+        frame = stat.traceback[0]
+        top.append({
+            "location": f"{frame.filename}:{frame.lineno}",
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+        })
+    return top
+
+
+_trace_lock = asyncio.Lock()
+
+
+async def trace_allocations(seconds: float, limit: int = 20) -> Dict:
+    """
+    临时开启 tracemalloc 采样 seconds 秒，返回期间仍存活的分配最多的代码位置，之后立即关闭
+
+    只有调试接口调用；同一时间只允许一次采样。进程启动时已经开启了 tracemalloc
+    （例如设置了 PYTHONTRACEMALLOC）则直接取快照，不改变其开关状态。
+
+    Args:
+        seconds: 采样时长，上限 TRACEMALLOC_MAX_SECONDS
+        limit: 返回的分配位置数量
+    """
+    seconds = max(0.0, min(seconds, TRACEMALLOC_MAX_SECONDS))
+    async with _trace_lock:
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        try:
+            await asyncio.sleep(seconds)
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            if started_here:
+                tracemalloc.stop()
+    return {
+        "trace_seconds": seconds,
+        "traced_mb": round(current / 1048576, 1),
+        "traced_peak_mb": round(peak / 1048576, 1),
+        "top_allocations": _top_allocations(snapshot, limit),
+    }
+
+
+# 创建全局实例
+memory_accountant = MemoryAccountant(MEMORY_BUDGET_MB * 1024 * 1024)
@@ -1,12 +1,145 @@
 from pypdf import PdfReader
+import asyncio
 import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Tuple, Type
 
-async def extract_text_from_pdf(file_content: bytes) -> str:
+from .cpu_limits import available_cpus, get_worker_count
+
+# Pages with fewer characters than this in their text layer are treated as scanned
+PDF_MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", "20"))
+
+def _default_parse_workers() -> int:
+    """Every uvicorn worker owns its pool, so split the usable CPUs (cgroup quota aware) between them"""
+    try:
+        web_workers = get_worker_count()
+    except ValueError:
+        web_workers = 1
+    return max(1, min(4, available_cpus() // web_workers))
+
+# Worker processes for parsing large PDFs (pypdf is pure Python, threads would serialize on the GIL);
+# 1 parses in a thread and never starts a pool
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", str(_default_parse_workers())))
+# PDFs up to this many pages are parsed in a single thread
+PDF_PAGES_PER_TASK = 8
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # The uvicorn worker is multithreaded (to_thread pool, DB and HTTP clients); forking it
+        # can leave children deadlocked on copied locks, so start clean interpreters instead
+        _executor = ProcessPoolExecutor(max_workers=PDF_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+def shutdown_executor():
+    """Stop the PDF worker processes (called on application shutdown)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def _count_pages(file_content: bytes) -> int:
+    return len(PdfReader(io.BytesIO(file_content)).pages)
+
+def _extract_page_range(file_content: bytes, start: int, end: int, want_images: bool) -> List[Tuple[str, List[bytes]]]:
+    """
+    Extract the text layer of pages [start, end); for pages without a usable
+    text layer also return their embedded images so they can be OCR'd
+    """
+    reader = PdfReader(io.BytesIO(file_content))
+    pages = []
+    for page in reader.pages[start:end]:
+        text = page.extract_text() or ""
+        images = []
+        if want_images and len(text.strip()) < PDF_MIN_TEXT_CHARS:
+            try:
+                images = [image.data for image in page.images]
+            except Exception as e:
+                print(f"PDF page image extraction failed: {e}")
+        pages.append((text, images))
+    return pages
+
+async def extract_text_from_pdf(
+    file_content: bytes,
+    ocr: Optional[Callable[[bytes], Awaitable[str]]] = None,
+    fatal_errors: Tuple[Type[BaseException], ...] = (),
+) -> str:
+    """
+    Extract text from a PDF, falling back to OCR page by page for scanned pages
+
+    Args:
+        file_content: Raw PDF bytes
+        ocr: Coroutine function turning image bytes into text. When given, pages
+             without a text layer have their embedded images OCR'd in parallel.
+        fatal_errors: OCR errors that abort the whole PDF (e.g. no OCR service
+             configured, request deadline) instead of falling back to the text layer
+
+    Returns:
+        Text of all pages, text-layer and OCR'd pages merged in page order
+
+    Raises:
+        The first OCR error when it is one of fatal_errors, or when OCR failed and
+        no page produced any text at all
+    """
+    want_images = ocr is not None
     try:
-        reader = PdfReader(io.BytesIO(file_content))
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        page_count = await asyncio.to_thread(_count_pages, file_content)
+        if page_count <= PDF_PAGES_PER_TASK or PDF_PARSE_WORKERS <= 1:
+            chunks = [await asyncio.to_thread(_extract_page_range, file_content, 0, page_count, want_images)]
+        else:
+            # Large documents: one contiguous page range per worker process, so the
+            # PDF bytes are pickled at most PDF_PARSE_WORKERS times
+            tasks = min(PDF_PARSE_WORKERS, -(-page_count // PDF_PAGES_PER_TASK))
+            step = -(-page_count // tasks)
+            ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+            loop = asyncio.get_running_loop()
+            executor = _get_executor()
+            chunks = await asyncio.gather(*(
+                loop.run_in_executor(executor, _extract_page_range, file_content, start, end, want_images)
+                for start, end in ranges
+            ))
+        pages = [page for chunk in chunks for page in chunk]
     except Exception as e:
         raise Exception(f"Error parsing PDF: {str(e)}")
+
+    errors: List[BaseException] = []
+
+    async def page_text(text: str, images: List[bytes]) -> str:
+        if not images:
+            return text
+        # A failed image (OCR error, per-image timeout) must not fail the whole
+        # PDF: the page falls back to its text layer
+        results = await asyncio.gather(*(ocr(image) for image in images), return_exceptions=True)
+        ocr_texts = []
+        for result in results:
+            if isinstance(result, fatal_errors):
+                raise result
+            if isinstance(result, BaseException):
+                print(f"PDF page OCR failed, using text layer: {result}")
+                errors.append(result)
+            else:
+                ocr_texts.append(result)
+        ocr_text = "\n".join(t.strip() for t in ocr_texts if t and t.strip())
+        # Keep whatever text layer there was if OCR found nothing better
+        return ocr_text if len(ocr_text) > len(text.strip()) else text
+
+    tasks = [asyncio.ensure_future(page_text(text, images)) for text, images in pages]
+    try:
+        texts = await asyncio.gather(*tasks)
+    except BaseException:
+        # A fatal error (or cancellation) stops the OCR still running for other pages
+        for task in tasks:
+            task.cancel()
+        raise
+    if errors and not any(page.strip() for page in texts):
+        # Nothing to fall back to: report the OCR failure instead of an empty document
+        raise errors[0]
+
+    text = ""
+    for page in texts:
+        text += page + "\n"
+    return text
@@ -0,0 +1,130 @@
+"""
+分析记录导出 - 把 analysis_records 流式导出为 NDJSON 或 CSV，可选边导出边 gzip 压缩
+
+查询使用服务端游标（stream_results + yield_per）分批取行，逐批编码、压缩后立即输出，
+导出几百万行时内存占用也保持不变。增量导出按游标进行：客户端传入上次的游标，本次导出 id 大于游标的记录，
+并得到新的游标（本次导出范围内的最大 id）。只比较 id 大小，不假设 id 连续——清理删掉的记录留下的空洞不影响导出；
+游标不会回退，表被清空时原样返回。也可以按 created_at 时间范围筛选。
+"""
+
+import csv
+import datetime
+import io
+import json
+import os
+import zlib
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import func, select
+
+from database import SessionLocal, AnalysisRecord
+
+# 每批从数据库取的行数
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# 编码后的数据攒到这么多字节再输出（压缩时也是每块压缩一次）
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+EXPORT_COLUMNS = [
+    AnalysisRecord.id,
+    AnalysisRecord.filename,
+    AnalysisRecord.job_description_snippet,
+    AnalysisRecord.match_score,
+    AnalysisRecord.created_at,
+]
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+
+@dataclass
+class ExportRange:
+    """导出范围：id 在 (since_id, until_id] 之间，created_at 在 [since, until) 之间"""
+    since_id: int = 0
+    until_id: Optional[int] = None
+    since: Optional[datetime.datetime] = None
+    until: Optional[datetime.datetime] = None
+
+
+def export_cursor(since_id: int = 0) -> int:
+    """
+    本次导出的游标：导出 id 在 (since_id, 游标] 之间的记录，下一次把游标作为 since_id
+
+    取导出开始时的最大 id，导出过程中新写入的记录留给下一次；没有更新的记录（包括表为空）时返回 since_id。
+    """
+    db = SessionLocal()
+    try:
+        return max(since_id, db.execute(select(func.max(AnalysisRecord.id))).scalar() or 0)
+    finally:
+        db.close()
+
+
+def iter_records(export_range: ExportRange) -> Iterator[tuple]:
+    """按 id 顺序逐行读取记录，每次只在内存中保留一批"""
+    stmt = select(*EXPORT_COLUMNS).where(AnalysisRecord.id > export_range.since_id)
+    if export_range.until_id is not None:
+        stmt = stmt.where(AnalysisRecord.id <= export_range.until_id)
+    if export_range.since is not None:
+        stmt = stmt.where(AnalysisRecord.created_at >= export_range.since)
+    if export_range.until is not None:
+        stmt = stmt.where(AnalysisRecord.created_at < export_range.until)
+    stmt = stmt.order_by(AnalysisRecord.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    db = SessionLocal()
+    try:
+        for partition in db.execute(stmt).partitions():
+            yield from partition
+    finally:
+        db.close()
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+def _encode(rows: Iterable[tuple], fmt: str) -> Iterator[str]:
+    """把记录编码为文本块（每块约 EXPORT_CHUNK_BYTES）"""
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        write = lambda row: writer.writerow([_value(value) for value in row])
+    else:
+        write = lambda row: buffer.write(
+            json.dumps(dict(zip(EXPORT_FIELDS, map(_value, row))), ensure_ascii=False) + "\n"
+        )
+
+    for row in rows:
+        write(row)
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_records(export_range: ExportRange, fmt: str = "ndjson", compress: bool = False) -> Iterator[bytes]:
+    """
+    导出记录，返回字节块迭代器（同步生成器，可直接交给 StreamingResponse 或写入文件）
+
+    Args:
+        fmt: ndjson 或 csv
+        compress: 是否输出 gzip 格式
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31: gzip 头
+    for text in _encode(iter_records(export_range), fmt):
+        data = text.encode("utf-8")
+        if compressor is None:
+            yield data
+        else:
+            compressed = compressor.compress(data)
+            if compressed:
+                yield compressed
+    if compressor is not None:
+        yield compressor.flush()
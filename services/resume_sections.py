@@ -0,0 +1,119 @@
+"""
+简历分段 - 把简历切分为教育、每段工作/项目经历、技能等段落
+
+用户反复修改简历时，通常只改动其中一两段。按段落计算哈希后，
+未变化段落的改写结果可以直接复用，只有新增或修改过的段落需要交给大模型重写。
+"""
+
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import List
+
+# 段落标题关键词 -> 段落类型
+SECTION_KEYWORDS = [
+    ("education", ["教育经历", "教育背景", "学历", "education"]),
+    ("work", ["工作经历", "工作经验", "实习经历", "实习经验", "职业经历", "任职经历", "work experience", "experience", "employment"]),
+    ("project", ["项目经历", "项目经验", "项目", "projects", "project experience"]),
+    ("skills", ["专业技能", "技能特长", "技能", "技术栈", "skills"]),
+    ("summary", ["自我评价", "个人总结", "个人优势", "summary", "profile"]),
+    ("awards", ["荣誉奖项", "获奖情况", "证书", "awards", "certifications"]),
+]
+
+# 可以改写的段落类型（每段经历单独切分、单独缓存）
+REWRITABLE_KINDS = ("work", "project")
+
+# 标题行最长字符数，超过则视为正文
+MAX_HEADING_LENGTH = 20
+
+# 经历条目的起始行：包含时间区间，如 2020.01-2022.03、2019/3 – 至今、2021年5月~2022年1月
+_DATE = r"(19|20)\d{2}\s*(年|[./\-])\s*\d{0,2}\s*月?"
+_DATE_RANGE_RE = re.compile(_DATE + r"\s*(-|–|—|~|～|至|到)\s*(" + _DATE + r"|至今|现在|今|present|now)", re.IGNORECASE)
+
+_HEADING_DECORATION_RE = re.compile(r"^[\s【\[#*●■◆▶>\-—=|]+|[\s】\]:：*|\-—=]+$")
+
+
+@dataclass
+class ResumeSection:
+    """简历中的一个段落"""
+    section_id: str   # 如 project-2，用于把改写结果对应回段落
+    kind: str         # education / work / project / skills / summary / awards / other
+    title: str
+    text: str
+
+    @property
+    def rewritable(self) -> bool:
+        return self.kind in REWRITABLE_KINDS
+
+    def content_hash(self, *extra: str) -> str:
+        """段落内容哈希（忽略空白差异），extra 用于加入 JD、模型等上下文"""
+        digest = hashlib.sha256(re.sub(r"\s+", " ", self.text).strip().encode("utf-8"))
+        for part in extra:
+            digest.update(b"\x1f")
+            digest.update((part or "").encode("utf-8"))
+        return digest.hexdigest()
+
+
+def _heading_kind(line: str) -> str:
+    """判断一行是否为段落标题，返回段落类型；不是标题返回空字符串"""
+    stripped = _HEADING_DECORATION_RE.sub("", line.strip()).lower()
+    if not stripped or len(stripped) > MAX_HEADING_LENGTH:
+        return ""
+    for kind, keywords in SECTION_KEYWORDS:
+        # 只接受独立成行的标题，如"项目经历"、"项目经历（部分）"；"项目名称：xxx"属于正文
+        if any(stripped == keyword or re.match(re.escape(keyword) + r"\s*[（(]", stripped) for keyword in keywords):
+            return kind
+    return ""
+
+
+def _split_entries(lines: List[str]) -> List[List[str]]:
+    """把经历类段落按时间区间行切分为多段经历"""
+    entries: List[List[str]] = []
+    current: List[str] = []
+    for line in lines:
+        if _DATE_RANGE_RE.search(line) and any(item.strip() for item in current):
+            entries.append(current)
+            current = []
+        current.append(line)
+    if any(item.strip() for item in current):
+        entries.append(current)
+
+    # 第一段之前没有时间行的零散内容并入下一段
+    if len(entries) > 1 and not _DATE_RANGE_RE.search("\n".join(entries[0])):
+        entries[1] = entries[0] + entries[1]
+        entries.pop(0)
+    return entries
+
+
+def segment_resume(resume_text: str) -> List[ResumeSection]:
+    """
+    把简历切分为段落；工作和项目经历中的每段经历单独成段
+
+    无法识别任何标题时返回整份简历作为一个 other 段落。
+    """
+    blocks = []  # [(kind, title, lines)]
+    kind, title, lines = "other", "", []
+    for line in resume_text.splitlines():
+        heading = _heading_kind(line)
+        if heading:
+            if any(item.strip() for item in lines):
+                blocks.append((kind, title, lines))
+            kind, title, lines = heading, line.strip(), []
+        else:
+            lines.append(line)
+    if any(item.strip() for item in lines):
+        blocks.append((kind, title, lines))
+
+    sections: List[ResumeSection] = []
+    counters = {}
+    for kind, title, block_lines in blocks:
+        parts = _split_entries(block_lines) if kind in REWRITABLE_KINDS else [block_lines]
+        for part in parts:
+            counters[kind] = counters.get(kind, 0) + 1
+            sections.append(ResumeSection(
+                section_id=f"{kind}-{counters[kind]}",
+                kind=kind,
+                title=title,
+                text="\n".join(part).strip(),
+            ))
+    return sections
@@ -0,0 +1,54 @@
+"""
+分析接口的响应模型 - 只依赖 pydantic，main 导入时不会触发重量级服务模块的加载
+
+简历分析结果（ResumeAnalysis）由 ai_advisor 在返回前校验；端点的外层响应模型用于 OpenAPI 文档，
+实际响应由 FastJSONResponse 直接序列化，不再重复校验。
+"""
+
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class ProjectRewrite(BaseModel):
+    section_id: str = Field(default="", description="The resume section this rewrite belongs to (e.g. project-1).")
+    original: str = Field(default="", description="The original project description or work experience text.")
+    rewritten: str = Field(default="", description="The rewritten version optimized for the JD.")
+
+
+class HRInsights(BaseModel):
+    strengths: List[str] = Field(default=[], description="The candidate's core strengths from an HR perspective.")
+    concerns: List[str] = Field(default=[], description="Potential concerns an HR reviewer would raise.")
+    interview_focus: List[str] = Field(default=[], description="Areas to probe during the interview.")
+    salary_range_suggestion: str = Field(default="需要更多信息才能给出薪资建议", description="Suggested salary range.")
+
+
+class ResumeAnalysis(BaseModel):
+    match_score: int = Field(description="A score from 0 to 100 indicating how well the resume matches the job description.")
+    missing_keywords: List[str] = Field(default=[], description="A list of important keywords or skills found in the JD but missing from the resume.")
+    improvement_suggestions: List[str] = Field(default=[], description="A list of specific actionable suggestions to improve the resume.")
+    rewritten_projects: List[ProjectRewrite] = Field(default=[], description="A list of project descriptions or work experiences that could be better tailored to the JD.")
+    hr_insights: HRInsights = Field(default_factory=HRInsights, description="HR insights about the candidate.")
+    error: Optional[str] = Field(default=None, description="Set when (part of) the analysis failed; such results are not cached.")
+    raw_response: Optional[str] = Field(default=None, description="The raw model output when it could not be parsed.")
+
+
+class AnalyzeResumeResponse(BaseModel):
+    """/analyze 的响应"""
+    filename: str
+    analysis: ResumeAnalysis
+    db_record_id: int
+
+
+class AnalyzeContractResponse(BaseModel):
+    """/analyze-contract 的响应；analysis 为合同分析结果（结构见 contract_analyzer.ContractAnalysis）"""
+    filename: str
+    contract_type: str
+    analysis: Dict[str, Any]
+    analysis_id: int
+    revision_token: Optional[str] = Field(
+        default=None,
+        description="Pass back as previous_revision_token to diff the next revision against this analysis; null when the analysis failed.",
+    )
+    revision: Optional[Dict[str, Any]] = None
+    template: Optional[Dict[str, Any]] = None
@@ -0,0 +1,115 @@
+"""
+跨进程共享状态 - 多 worker 部署时通过 SQLite 共享缓存和限流计数
+
+每个 uvicorn worker 都是独立进程，进程内的字典无法共享，
+因此缓存、限流计数和 OCR 能力探测结果统一存放在应用的 SQLite 数据库中。
+共享状态只是加速手段：数据库暂时不可用时读取返回未命中，写入静默失败。
+"""
+
+import json
+import random
+import time
+from typing import Any, Optional
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert
+
+from database import SessionLocal, SharedStateEntry, RateLimitCounter
+
+
+def cache_get(key: str) -> Optional[Any]:
+    """读取共享缓存，未命中或已过期返回 None"""
+    try:
+        with SessionLocal() as db:
+            entry = db.get(SharedStateEntry, key)
+            if entry is None:
+                return None
+            if entry.expires_at is not None and entry.expires_at < time.time():
+                return None
+            return json.loads(entry.value)
+    except Exception as e:
+        print(f"共享缓存读取失败: {e}")
+        return None
+
+
+def cache_set(key: str, value: Any, ttl: Optional[float] = None):
+    """写入共享缓存，ttl 为秒数，None 表示不过期"""
+    expires_at = time.time() + ttl if ttl else None
+    stmt = insert(SharedStateEntry).values(
+        key=key,
+        value=json.dumps(value, ensure_ascii=False),
+        expires_at=expires_at,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SharedStateEntry.key],
+        set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+    )
+    try:
+        with SessionLocal() as db:
+            db.execute(stmt)
+            # 顺带清理过期条目，避免表无限增长
+            if random.random() < 0.01:
+                db.execute(delete(SharedStateEntry).where(SharedStateEntry.expires_at < time.time()))
+            db.commit()
+    except Exception as e:
+        print(f"共享缓存写入失败: {e}")
+
+
+def cache_delete(key: str):
+    """删除共享缓存条目"""
+    try:
+        with SessionLocal() as db:
+            db.execute(delete(SharedStateEntry).where(SharedStateEntry.key == key))
+            db.commit()
+    except Exception as e:
+        print(f"共享缓存删除失败: {e}")
+
+
+def hit_rate_limit(key: str, limit: int, window_seconds: int = 60) -> bool:
+    """
+    固定窗口限流计数，所有 worker 共用同一个计数
+
+    Returns:
+        True 表示已超过限额，应拒绝本次请求
+    """
+    window_start = int(time.time()) // window_seconds * window_seconds
+    stmt = insert(RateLimitCounter).values(key=key, window_start=window_start, count=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[RateLimitCounter.key, RateLimitCounter.window_start],
+        set_={"count": RateLimitCounter.count + 1},
+    ).returning(RateLimitCounter.count)
+    try:
+        with SessionLocal() as db:
+            count = db.execute(stmt).scalar_one()
+            # 清理已经结束的窗口
+            if random.random() < 0.01:
+                db.execute(delete(RateLimitCounter).where(RateLimitCounter.window_start < window_start))
+            db.commit()
+        return count > limit
+    except Exception as e:
+        # 限流存储不可用时放行，不影响主流程
+        print(f"限流计数失败: {e}")
+        return False
+
+
+def acquire_lease(name: str, owner: str, ttl: float) -> bool:
+    """
+    抢占一个有时限的租约，多个 worker 中同一时间只有一个执行后台任务
+
+    租约过期前只有持有者自己能续约；数据库不可用时返回 False（本轮不执行）。
+    """
+    now = time.time()
+    stmt = insert(SharedStateEntry).values(key=f"lease:{name}", value=json.dumps(owner), expires_at=now + ttl)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SharedStateEntry.key],
+        set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+        where=(SharedStateEntry.expires_at < now) | (SharedStateEntry.value == stmt.excluded.value),
+    )
+    try:
+        with SessionLocal() as db:
+            acquired = db.execute(stmt).rowcount == 1
+            db.commit()
+        return acquired
+    except Exception as e:
+        print(f"租约获取失败: {e}")
+        return False
@@ -0,0 +1,94 @@
+"""
+在途请求合并（single-flight）- 相同内容的并发分析只调用一次大模型
+
+用户重复点击"分析"或客户端在首个请求未完成时重试，都会产生内容完全相同的请求。
+相同内容哈希的请求会挂到同一个正在执行的调用上，并共享它的结果。
+"""
+
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+def make_flight_key(*parts: str) -> str:
+    """根据请求内容（提取的文本、JD/合同类型、模型等）生成内容哈希"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\x1f")  # 分隔符，避免 ("ab", "c") 与 ("a", "bc") 冲突
+    return digest.hexdigest()
+
+
+def credentials_scope(api_key: Optional[str]) -> str:
+    """
+    调用凭据的标识，作为内容哈希的一部分：用户自带 Key 的请求只与同一个 Key 的请求合并
+    （否则可能拿到别人 Key 的无效 / 额度不足错误，自己的 Key 也不会被使用）；
+    未提供 Key 的请求共用服务器端的服务池
+    """
+    if not api_key:
+        return "server"
+    return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """一次共享调用及其等待者计数"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """进程内的在途请求合并器"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        # 等待者离开时：共享调用随之取消的次数 / 因仍有其他等待者而继续执行的次数
+        self.cancelled = 0
+        self.detached = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行 fn()，若相同 key 的调用正在进行，则等待并复用其结果
+
+        某个等待者被取消（例如客户端断开）时，只要还有其他等待者，共享调用就不会被取消；
+        最后一个等待者离开时才取消共享调用。
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _task: self._forget(key, flight))
+
+        flight.waiters += 1
+        try:
+            # shield: 取消当前等待者不会传递到共享任务
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done():
+                if flight.waiters == 1:
+                    flight.task.cancel()
+                    self.cancelled += 1
+                else:
+                    self.detached += 1
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def in_flight(self, key: str) -> int:
+        """返回某个 key 当前的等待者数量"""
+        flight = self._flights.get(key)
+        return flight.waiters if flight else 0
+
+    def stats(self) -> Dict[str, int]:
+        """在途调用数，以及等待者离开后共享调用被取消 / 继续执行的次数"""
+        return {"in_flight": len(self._flights), "cancelled": self.cancelled, "detached": self.detached}
+
+    def _forget(self, key: str, flight: _Flight):
+        # 只移除自己，避免误删同 key 的新调用
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+# 创建全局实例
+analysis_flight = SingleFlight()
@@ -0,0 +1,95 @@
+"""
+启动加速 - 重量级服务模块按需加载，可选预热，并记录导入耗时
+
+pypdf、PIL、pytesseract、openai、aiohttp 等依赖只在第一次真正用到时才导入，
+冷启动和容器重启不再为用不到的依赖付出代价。
+"""
+
+import asyncio
+import importlib
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+# 需要按需加载的服务模块（预热时会全部加载）
+HEAVY_MODULES = [
+    "services.pdf_parser",
+    "services.image_parser",
+    "services.cloud_ocr",
+    "services.ai_advisor",
+    "services.contract_analyzer",
+    "services.text_extractor",
+]
+
+# 冷启动预算（毫秒），超出时在启动日志中告警
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "1500"))
+
+_import_lock = threading.Lock()
+_import_timings: Dict[str, float] = {}
+_ready_ms: Optional[float] = None
+
+
+def record_timing(name: str, elapsed_ms: float):
+    """记录一项启动耗时"""
+    _import_timings[name] = round(elapsed_ms, 1)
+
+
+def lazy_import(name: str):
+    """导入模块并记录首次导入耗时"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    with _import_lock:
+        module = sys.modules.get(name)
+        if module is None:
+            start = time.perf_counter()
+            module = importlib.import_module(name)
+            record_timing(name, (time.perf_counter() - start) * 1000)
+    return module
+
+
+class LazyModule:
+    """模块代理：第一次访问属性时才真正导入模块"""
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(lazy_import(self._name), attr)
+
+
+def mark_ready(started: float):
+    """应用完成启动时调用，记录从开始导入 main 到可以服务请求的总耗时"""
+    global _ready_ms
+    _ready_ms = round((time.perf_counter() - started) * 1000, 1)
+    if _ready_ms > STARTUP_BUDGET_MS:
+        print(f"⚠️ 启动耗时 {_ready_ms}ms，超出预算 {STARTUP_BUDGET_MS:.0f}ms：{_import_timings}")
+    else:
+        print(f"启动耗时 {_ready_ms}ms")
+
+
+async def warm_up():
+    """
+    预热：提前加载所有重量级模块，并建立 OCR / 大模型的连接池
+    在线程中导入，避免阻塞事件循环
+    """
+    await asyncio.to_thread(lambda: [lazy_import(name) for name in HEAVY_MODULES])
+
+    start = time.perf_counter()
+    await lazy_import("services.cloud_ocr").cloud_ocr.open_session()
+    lazy_import("services.llm_client").warm_up_clients()
+    record_timing("warm_up.connections", (time.perf_counter() - start) * 1000)
+
+
+def startup_report() -> dict:
+    """启动耗时报告：各模块导入耗时（毫秒）及是否超出预算"""
+    return {
+        "ready_ms": _ready_ms,
+        "budget_ms": STARTUP_BUDGET_MS,
+        "over_budget": _ready_ms is not None and _ready_ms > STARTUP_BUDGET_MS,
+        "import_timings_ms": dict(sorted(_import_timings.items(), key=lambda item: -item[1])),
+        "loaded_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+    }
@@ -0,0 +1,148 @@
+"""
+静态资源 - 预压缩 HTML/JS/CSS，按 Accept-Encoding 返回对应版本，带强 ETag 与 304 支持
+
+页面文件在首次请求（或启动预加载）时一次性压缩为 gzip 和 brotli 并保存在内存中，
+之后每次请求只需挑选版本，不再重复压缩；文件修改后按 mtime 自动重新加载。
+"""
+
+import gzip
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只提供 gzip
+    brotli = None
+
+# 可压缩的静态资源类型
+COMPRESSIBLE_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".json": "application/json",
+    ".svg": "image/svg+xml",
+}
+
+# 服务端优先选择的编码顺序
+ENCODING_PREFERENCE = ("br", "gzip", "identity")
+
+# 页面不带版本号，浏览器每次都用 ETag 向服务端确认（命中时只返回 304）
+CACHE_CONTROL = "no-cache"
+
+
+@dataclass
+class Asset:
+    """一个静态资源及其各编码版本"""
+    media_type: str
+    mtime: float
+    variants: Dict[str, bytes]   # 编码 -> 内容
+    etags: Dict[str, str]        # 编码 -> 强 ETag（不同编码的表示必须使用不同 ETag）
+
+
+def _build_asset(path: str, media_type: str) -> Asset:
+    with open(path, "rb") as f:
+        content = f.read()
+
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    variants = {"identity": content}
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(compressed) < len(content):
+        variants["gzip"] = compressed
+    if brotli is not None:
+        compressed = brotli.compress(content, quality=11)
+        if len(compressed) < len(content):
+            variants["br"] = compressed
+
+    etags = {
+        encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+        for encoding in variants
+    }
+    return Asset(media_type=media_type, mtime=os.path.getmtime(path), variants=variants, etags=etags)
+
+
+def _accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """解析 Accept-Encoding，返回 {编码: q 值}"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def choose_encoding(accept_encoding: str, available) -> str:
+    """按客户端 Accept-Encoding 和服务端偏好选择编码"""
+    accepted = _accepted_encodings(accept_encoding or "")
+    for encoding in ENCODING_PREFERENCE:
+        if encoding not in available:
+            continue
+        if encoding == "identity":
+            return encoding
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+class PrecompressedAssets:
+    """预压缩静态资源集合"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._assets: Dict[str, Asset] = {}
+
+    def preload(self):
+        """预先压缩目录下所有可压缩的资源"""
+        for name in os.listdir(self.directory):
+            self.get(name)
+
+    def get(self, name: str) -> Optional[Asset]:
+        """获取资源；文件修改后自动重新压缩"""
+        media_type = COMPRESSIBLE_TYPES.get(os.path.splitext(name)[1].lower())
+        path = os.path.join(self.directory, name)
+        if media_type is None or not os.path.isfile(path):
+            return None
+
+        asset = self._assets.get(name)
+        if asset is None or os.path.getmtime(path) != asset.mtime:
+            asset = _build_asset(path, media_type)
+            self._assets[name] = asset
+        return asset
+
+    def response(self, request: Request, name: str) -> Response:
+        """按 Accept-Encoding 返回资源，If-None-Match 命中时返回 304"""
+        asset = self.get(name)
+        if asset is None:
+            return Response(status_code=404)
+
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""), asset.variants)
+        etag = asset.etags[encoding]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            # 代理重新压缩时可能把 ETag 弱化为 W/"..."，按弱比较处理
+            candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in candidates or etag in candidates:
+                return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(asset.variants[encoding], media_type=asset.media_type, headers=headers)
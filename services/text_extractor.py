@@ -0,0 +1,118 @@
+"""
+文本提取 - 按文件类型分发到 PDF 解析 / 图片 OCR，多页并发识别
+
+一次请求可以上传多张截图，或一个 PDF 加若干图片；扫描版 PDF 中没有文字层的页面会提取内嵌图片再 OCR。
+所有 OCR 任务（图片文件和扫描页）并发执行，受单请求并发上限约束，最后按上传顺序和页序拼接，
+整体耗时约等于最慢的一页。
+每个文件的提取结果按内容哈希缓存（跨 worker 共享），重复上传同一文件无需再次解析或 OCR。
+"""
+
+import asyncio
+import hashlib
+import os
+from typing import Awaitable, Callable, List, Tuple
+
+from .pdf_parser import extract_text_from_pdf
+from .docx_parser import extract_text_from_docx
+from .image_parser import extract_text_from_image, is_tesseract_available
+from .cloud_ocr import extract_text_from_image_cloud, is_cloud_ocr_available, get_ocr_status
+from .shared_state import cache_get, cache_set
+from .deadline import DeadlineExceeded, run_stage
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.webp']
+
+# 单个请求内同时进行 OCR 的页数上限
+OCR_PAGE_CONCURRENCY = int(os.getenv("OCR_PAGE_CONCURRENCY", "4"))
+# 提取结果缓存时间（秒），0 表示不缓存
+EXTRACTION_CACHE_TTL = int(os.getenv("EXTRACTION_CACHE_TTL", "86400"))
+# 文字提取阶段的超时上限（秒）；最多使用请求剩余时间的一半，另一半留给大模型分析
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", "60"))
+EXTRACTION_BUDGET_SHARE = 0.5
+
+
+class OCRUnavailableError(Exception):
+    """没有任何可用的 OCR 服务"""
+
+    def __init__(self, available_services: List[str]):
+        self.available_services = available_services
+        super().__init__("图片文字识别功能不可用")
+
+
+class ImageOCRError(Exception):
+    """图片文字识别失败"""
+
+
+async def ocr_image(image_content: bytes) -> str:
+    """识别单张图片：优先云端 OCR，降级到本地 Tesseract"""
+    if is_cloud_ocr_available():
+        # 使用云端OCR（更准确）
+        return await extract_text_from_image_cloud(image_content)
+    # 可用性探测读写共享缓存（并可能启动子进程），放到线程中执行
+    if await asyncio.to_thread(is_tesseract_available):
+        # 降级到本地Tesseract
+        return await extract_text_from_image(image_content)
+    # 没有任何OCR可用
+    raise OCRUnavailableError((await asyncio.to_thread(get_ocr_status))["available_services"])
+
+
+async def extract_text(content: bytes, file_ext: str, ocr: Callable[[bytes], Awaitable[str]] = ocr_image) -> str:
+    """按扩展名提取单个文件的文字，ocr 用于图片文件和扫描版 PDF 的页面"""
+    if file_ext == '.pdf':
+        return await extract_text_from_pdf(content, ocr=ocr, fatal_errors=(OCRUnavailableError, DeadlineExceeded))
+    if file_ext in IMAGE_EXTENSIONS:
+        return await ocr(content)
+    if file_ext == '.docx':
+        return await extract_text_from_docx(content)
+    if file_ext == '.txt':
+        # 纯文本文件
+        return content.decode('utf-8')
+    raise ValueError(f"不支持的文件格式: {file_ext}")
+
+
+async def extract_text_cached(content: bytes, file_ext: str, ocr: Callable[[bytes], Awaitable[str]] = ocr_image) -> str:
+    """带缓存的单文件提取，缓存键为扩展名 + 文件内容哈希"""
+    if EXTRACTION_CACHE_TTL <= 0:
+        return await extract_text(content, file_ext, ocr=ocr)
+
+    cache_key = f"extract:{file_ext}:{hashlib.sha256(content).hexdigest()}"
+    # 共享缓存是 SQLite 读写，放到线程中执行，遇到写锁等待时不阻塞事件循环
+    cached = await asyncio.to_thread(cache_get, cache_key)
+    if cached is not None:
+        return cached
+
+    text = await extract_text(content, file_ext, ocr=ocr)
+    if text and text.strip():
+        await asyncio.to_thread(cache_set, cache_key, text, EXTRACTION_CACHE_TTL)
+    return text
+
+
+async def extract_text_from_files(files: List[Tuple[bytes, str]], concurrency: int = None) -> str:
+    """
+    并发提取多个文件（页）的文字，按原顺序拼接
+
+    Args:
+        files: [(文件内容, 扩展名), ...]，顺序即页序
+        concurrency: 单请求并发上限，默认 OCR_PAGE_CONCURRENCY
+    """
+    # 并发上限只作用于 OCR 本身：PDF 文件内部的扫描页与图片文件共享同一组名额
+    semaphore = asyncio.Semaphore(concurrency or OCR_PAGE_CONCURRENCY)
+
+    async def limited_ocr(image_content: bytes) -> str:
+        async with semaphore:
+            try:
+                return await ocr_image(image_content)
+            except (OCRUnavailableError, DeadlineExceeded):
+                raise
+            except Exception as e:
+                raise ImageOCRError(str(e))
+
+    # gather 保持传入顺序；任一页失败或超时时取消其余页
+    tasks = [asyncio.ensure_future(extract_text_cached(content, ext, ocr=limited_ocr)) for content, ext in files]
+    try:
+        pages = await run_stage(asyncio.gather(*tasks), "文字提取", EXTRACTION_TIMEOUT, share=EXTRACTION_BUDGET_SHARE)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return "\n\n".join(page.strip() for page in pages if page and page.strip())
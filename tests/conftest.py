@@ -0,0 +1,30 @@
+"""
+测试公共设置：数据库指向临时目录中的 SQLite 文件，不会读写仓库里的 resume_polisher.db
+
+DATABASE_URL 必须在 database 模块第一次导入之前设置，因此放在 conftest 的模块级别。
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_DB_DIR = tempfile.mkdtemp(prefix="resume-polisher-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+os.environ.setdefault("ANALYSIS_CACHE_TTL", "0")
+
+import pytest
+
+from database import Base, engine, init_db
+
+init_db()
+
+
+@pytest.fixture
+def clean_db():
+    """清空所有表，保证用例之间互不影响"""
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    yield
@@ -0,0 +1,101 @@
+from services.contract_clauses import (
+    Clause,
+    carry_over_items,
+    diff_clauses,
+    merge_analyses,
+    overall_risk,
+    split_clauses,
+)
+
+CONTRACT = """房屋租赁合同
+第一条 租金为每月 3000 元，每月 5 日前支付。
+第二条 押金为两个月租金，合同期满后返还。
+第三条 乙方不得转租。
+第四条 争议由房屋所在地法院管辖。"""
+
+
+def test_split_clauses_by_heading():
+    clauses = split_clauses(CONTRACT)
+    assert [clause.clause_id for clause in clauses] == ["c1", "c2", "c3", "c4", "c5"]
+    assert clauses[0].text == "房屋租赁合同"
+    assert clauses[2].title.startswith("第二条")
+
+
+def test_split_clauses_without_headings_uses_paragraphs():
+    clauses = split_clauses("甲方负责维修。\n\n乙方按时付款。\n")
+    assert [clause.text for clause in clauses] == ["甲方负责维修。", "乙方按时付款。"]
+
+
+def test_content_hash_ignores_numbering_whitespace_and_punctuation():
+    a = Clause("c1", "", "第三条 乙方不得转租。")
+    b = Clause("c7", "", "第五条  乙方不得转租")
+    assert a.content_hash == b.content_hash
+
+
+def test_diff_clauses_statuses():
+    old = split_clauses(CONTRACT)
+    new = split_clauses(
+        CONTRACT
+        .replace("每月 3000 元", "每月 3200 元")
+        .replace("第三条 乙方不得转租。\n", "")
+        + "\n第五条 本合同一式两份。"
+    )
+    changes = diff_clauses(old, new)
+    by_status = {}
+    for change in changes:
+        by_status.setdefault(change.status, []).append(change)
+
+    assert len(by_status["unchanged"]) == 3
+    assert [change.old.clause_id for change in by_status["modified"]] == ["c2"]
+    assert [change.old.clause_id for change in by_status["removed"]] == ["c4"]
+    assert [change.new.text for change in by_status["added"]] == ["第五条 本合同一式两份。"]
+
+
+def test_diff_clauses_matches_renumbered_clauses():
+    old = split_clauses("第一条 甲方交付房屋。\n第二条 乙方支付租金。")
+    new = split_clauses("第一条 双方约定如下。\n第二条 甲方交付房屋。\n第三条 乙方支付租金。")
+    unchanged = [(c.old.clause_id, c.new.clause_id) for c in diff_clauses(old, new) if c.status == "unchanged"]
+    assert unchanged == [("c1", "c2"), ("c2", "c3")]
+
+
+def test_carry_over_items_remaps_and_drops_changed_clauses():
+    previous = {
+        "risks": [
+            {"clause_id": "c1", "level": "高风险"},
+            {"clause_id": "c2", "level": "中风险"},
+            {"clause_id": "", "level": "低风险"},
+        ],
+        "plain_explanations": [],
+    }
+    carried = carry_over_items(previous, {"c1": "c3"})
+    assert carried["risks"] == [{"clause_id": "c3", "level": "高风险"}, {"clause_id": "", "level": "低风险"}]
+    assert carried["plain_explanations"] == []
+    assert carried["suggestions"] == []
+
+
+def test_merge_analyses_orders_by_clause_and_recomputes_risk():
+    carried = {"risks": [{"clause_id": "c3", "level": "低风险"}], "plain_explanations": [], "suggestions": []}
+    fresh = {"risks": [{"clause_id": "c1", "level": "高风险"}]}
+    merged = merge_analyses({"overall_risk": "低风险"}, carried, fresh, ["c1", "c2", "c3"])
+    assert [item["clause_id"] for item in merged["risks"]] == ["c1", "c3"]
+    assert merged["contract_summary"]["overall_risk"] == "高风险"
+    assert "error" not in merged
+
+
+def test_merge_analyses_prefers_fresh_general_items():
+    carried = {"risks": [], "plain_explanations": [], "suggestions": [{"clause_id": "", "text": "旧的整体建议"}]}
+    fresh = {"suggestions": [{"clause_id": "", "text": "新的整体建议"}]}
+    merged = merge_analyses({}, carried, fresh, [])
+    assert merged["suggestions"] == [{"clause_id": "", "text": "新的整体建议"}]
+
+
+def test_merge_analyses_carries_fresh_error():
+    carried = {"risks": [{"clause_id": "c1", "level": "低风险"}], "plain_explanations": [], "suggestions": []}
+    merged = merge_analyses({}, carried, {"error": "Failed to parse AI response"}, ["c1"])
+    assert merged["error"] == "Failed to parse AI response"
+    assert merged["risks"] == carried["risks"]
+
+
+def test_overall_risk():
+    assert overall_risk([{"level": "中风险"}, {"level": "低风险"}]) == "中风险"
+    assert overall_risk([], default="高风险") == "低风险"
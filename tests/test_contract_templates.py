@@ -0,0 +1,72 @@
+from database import SessionLocal, ContractClauseEntry, ContractClauseSighting, ContractTemplate
+from services.contract_clauses import split_clauses
+from services.contract_templates import (
+    TEMPLATE_MIN_SIGHTINGS,
+    TemplateMatch,
+    learn_from_analysis,
+    match_template,
+    split_known_clauses,
+)
+
+CONTRACT = "\n".join(f"第{i}条 双方约定的标准条款{i}，未尽事宜另行协商。" for i in range(1, 6))
+
+
+def _analysis(clauses, **extra):
+    return {
+        "contract_summary": {"overall_risk": "中风险", "parties_involved": ["张三", "李四"]},
+        "risks": [{"clause_id": clause.clause_id, "level": "中风险"} for clause in clauses[:2]],
+        "plain_explanations": [{"clause_id": "", "text": "整体说明"}],
+        "suggestions": [],
+        **extra,
+    }
+
+
+def _hits():
+    with SessionLocal() as db:
+        return sorted(entry.hits for entry in db.query(ContractClauseEntry))
+
+
+def test_same_contract_counts_once(clean_db):
+    clauses = split_clauses(CONTRACT)
+    for _ in range(TEMPLATE_MIN_SIGHTINGS + 1):
+        assert learn_from_analysis("rental", clauses, _analysis(clauses), TemplateMatch(), "contract-a") is None
+    assert _hits() == [1] * len(clauses)
+
+
+def test_template_formed_after_distinct_contracts(clean_db):
+    clauses = split_clauses(CONTRACT)
+    template_id = None
+    for index in range(TEMPLATE_MIN_SIGHTINGS):
+        template_id = learn_from_analysis("rental", clauses, _analysis(clauses), TemplateMatch(), f"contract-{index}")
+    assert template_id is not None
+    assert _hits() == [TEMPLATE_MIN_SIGHTINGS] * len(clauses)
+
+    with SessionLocal() as db:
+        # 达到门槛后逐份记录不再需要
+        assert db.query(ContractClauseSighting).count() == 0
+        template = db.get(ContractTemplate, template_id)
+        assert "张三" not in template.summary
+
+    match = match_template("rental", clauses)
+    assert match.template_id == template_id and match.matched
+    served, novel = split_known_clauses(clauses, match.known)
+    # 模型没有评论的条款不算已知，仍交给模型
+    assert [clause.clause_id for clause in novel] == [clause.clause_id for clause in clauses[2:]]
+    assert [item["clause_id"] for item in served["risks"]] == ["c1", "c2"]
+
+
+def test_failed_analysis_is_not_learned(clean_db):
+    clauses = split_clauses(CONTRACT)
+    learn_from_analysis("rental", clauses, _analysis(clauses, error="Failed to parse AI response"), TemplateMatch(), "a")
+    assert _hits() == []
+
+
+def test_register_creates_template_immediately(clean_db):
+    clauses = split_clauses(CONTRACT)
+    template_id = learn_from_analysis(
+        "rental", clauses, _analysis(clauses), TemplateMatch(), "standard", name="标准租赁合同", register=True
+    )
+    with SessionLocal() as db:
+        template = db.get(ContractTemplate, template_id)
+        assert template.name == "标准租赁合同"
+        assert template.clause_count == len(clauses)
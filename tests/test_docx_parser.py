@@ -0,0 +1,83 @@
+import io
+import zipfile
+
+import pytest
+
+from services import docx_parser
+from services.docx_parser import DocxError, extract_text_from_docx_sync
+
+NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+NUMBERING = f"""<w:numbering {NS}>
+<w:abstractNum w:abstractNumId="1">
+  <w:lvl w:ilvl="0"><w:start w:val="1"/><w:numFmt w:val="decimal"/><w:lvlText w:val="第%1条"/></w:lvl>
+  <w:lvl w:ilvl="1"><w:start w:val="1"/><w:numFmt w:val="decimal"/><w:pStyle w:val="ListNumber2"/><w:lvlText w:val="%1.%2"/></w:lvl>
+</w:abstractNum>
+<w:num w:numId="5"><w:abstractNumId w:val="1"/></w:num>
+</w:numbering>"""
+
+STYLES = f"""<w:styles {NS}>
+<w:style w:type="paragraph" w:styleId="ListNumber"><w:pPr><w:numPr><w:numId w:val="5"/></w:numPr></w:pPr></w:style>
+<w:style w:type="paragraph" w:styleId="Clause"><w:basedOn w:val="ListNumber"/></w:style>
+<w:style w:type="paragraph" w:styleId="ListNumber2"><w:pPr><w:numPr><w:numId w:val="5"/></w:numPr></w:pPr></w:style>
+<w:style w:type="character" w:styleId="Strong"/>
+</w:styles>"""
+
+
+def _paragraph(text, ppr=""):
+    return f"<w:p><w:pPr>{ppr}</w:pPr><w:r><w:t>{text}</w:t></w:r></w:p>"
+
+
+def _docx(body, styles=STYLES, numbering=NUMBERING):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("word/document.xml", f"<w:document {NS}><w:body>{body}</w:body></w:document>")
+        if styles:
+            zf.writestr("word/styles.xml", styles)
+        if numbering:
+            zf.writestr("word/numbering.xml", numbering)
+    return buffer.getvalue()
+
+
+def test_paragraphs_and_direct_numbering():
+    num_pr = '<w:numPr><w:ilvl w:val="0"/><w:numId w:val="5"/></w:numPr>'
+    body = _paragraph("租赁合同") + _paragraph("租金", num_pr) + _paragraph("押金", num_pr)
+    assert extract_text_from_docx_sync(_docx(body)) == "租赁合同\n第1条 租金\n第2条 押金"
+
+
+def test_numbering_inherited_from_paragraph_style():
+    body = (
+        _paragraph("付款", '<w:pStyle w:val="ListNumber"/>')
+        + _paragraph("交付", '<w:pStyle w:val="Clause"/>')          # basedOn ListNumber
+        + _paragraph("细则", '<w:pStyle w:val="ListNumber2"/>')     # 级别由 numbering.xml 中的 pStyle 决定
+        + _paragraph("补充", '<w:pStyle w:val="ListNumber"/><w:numPr><w:ilvl w:val="1"/></w:numPr>')
+        + _paragraph("正文")
+    )
+    assert extract_text_from_docx_sync(_docx(body)).split("\n") == [
+        "第1条 付款", "第2条 交付", "2.1 细则", "2.2 补充", "正文",
+    ]
+
+
+def test_style_numbering_ignores_cyclic_based_on():
+    styles = f"""<w:styles {NS}>
+<w:style w:type="paragraph" w:styleId="A"><w:basedOn w:val="B"/></w:style>
+<w:style w:type="paragraph" w:styleId="B"><w:basedOn w:val="A"/></w:style>
+</w:styles>"""
+    body = _paragraph("条款", '<w:pStyle w:val="A"/>')
+    assert extract_text_from_docx_sync(_docx(body, styles=styles)) == "条款"
+
+
+def test_table_cells_are_kept():
+    body = "<w:tbl><w:tr><w:tc>" + _paragraph("单元格") + "</w:tc></w:tr></w:tbl>" + _paragraph("之后")
+    assert extract_text_from_docx_sync(_docx(body, styles=None, numbering=None)).split("\n") == ["单元格", "之后"]
+
+
+def test_invalid_zip_raises_docx_error():
+    with pytest.raises(DocxError):
+        extract_text_from_docx_sync(b"not a zip file")
+
+
+def test_too_many_entries_raises_docx_error(monkeypatch):
+    monkeypatch.setattr(docx_parser, "MAX_ZIP_ENTRIES", 2)
+    with pytest.raises(DocxError):
+        extract_text_from_docx_sync(_docx(_paragraph("x")))
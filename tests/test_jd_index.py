@@ -0,0 +1,49 @@
+from services.jd_index import (
+    JD_DUP_THRESHOLD,
+    estimate_similarity,
+    minhash_signature,
+    normalize_jd,
+    resolve_jd,
+)
+
+JD = """岗位职责
+1. 负责后端服务的设计与开发，参与系统架构评审。
+2. 负责数据库表结构设计和性能优化。
+任职要求
+1. 熟悉 Python、FastAPI 和 SQL，三年以上后端开发经验。
+2. 了解 Redis、消息队列，有高并发系统经验者优先。
+3. 良好的沟通能力和团队协作精神。"""
+
+
+def test_normalize_jd():
+    assert normalize_jd("Ｐython  开发\n工程师") == "python开发工程师"
+
+
+def test_minhash_similarity():
+    sig = minhash_signature(normalize_jd(JD))
+    near = minhash_signature(normalize_jd(JD + "\n薪资：20k-30k"))
+    other = minhash_signature(normalize_jd("招聘会计，负责公司账务处理和税务申报，持有初级会计证书。"))
+    assert estimate_similarity(sig, sig) == 1.0
+    assert estimate_similarity(sig, near) >= JD_DUP_THRESHOLD
+    assert estimate_similarity(sig, other) < 0.2
+
+
+def test_long_jd_signature_is_bounded():
+    long_jd = normalize_jd(JD * 50 + "".join(chr(0x4E00 + i) for i in range(5000)))
+    assert len(minhash_signature(long_jd)) == len(minhash_signature(normalize_jd(JD)))
+
+
+def test_resolve_jd_dedups_but_keys_on_submitted_text(clean_db):
+    first = resolve_jd(JD)
+    assert not first.duplicate
+    assert first.requirements
+
+    same = resolve_jd(JD.replace("\n", "\n  "))
+    assert same.duplicate
+    assert same.text_key == first.text_key
+
+    variant = resolve_jd(JD + "\n薪资：20k-30k，五险一金")
+    assert variant.duplicate
+    assert variant.jd_id == first.jd_id
+    # 近似重复的 JD 不共用缓存键
+    assert variant.text_key != first.text_key
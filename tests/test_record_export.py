@@ -0,0 +1,82 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+
+import pytest
+
+from database import SessionLocal, AnalysisRecord
+from services.record_export import ExportRange, export_cursor, export_records
+
+
+def _add_records(count, created_at=None):
+    with SessionLocal() as db:
+        records = [
+            AnalysisRecord(
+                filename=f"resume-{index}.pdf",
+                job_description_snippet="后端开发",
+                match_score=60 + index,
+                created_at=created_at or datetime.datetime.utcnow(),
+            )
+            for index in range(count)
+        ]
+        db.add_all(records)
+        db.commit()
+        return [record.id for record in records]
+
+
+def _ndjson(chunks):
+    return [json.loads(line) for line in b"".join(chunks).decode("utf-8").splitlines()]
+
+
+def test_cursor_on_empty_table_keeps_since_id(clean_db):
+    assert export_cursor() == 0
+    assert export_cursor(42) == 42
+
+
+def test_incremental_export_by_cursor(clean_db):
+    ids = _add_records(3)
+    cursor = export_cursor()
+    assert cursor == ids[-1]
+    rows = _ndjson(export_records(ExportRange(until_id=cursor)))
+    assert [row["id"] for row in rows] == ids
+    assert rows[0]["filename"] == "resume-0.pdf"
+
+    # 导出游标之后写入的记录留给下一次
+    new_ids = _add_records(2)
+    rows = _ndjson(export_records(ExportRange(since_id=cursor, until_id=export_cursor(cursor))))
+    assert [row["id"] for row in rows] == new_ids
+
+
+def test_cursor_never_moves_back(clean_db):
+    _add_records(2)
+    assert export_cursor(1000) == 1000
+
+
+def test_export_skips_gaps_and_filters_by_time(clean_db):
+    old_ids = _add_records(2, created_at=datetime.datetime(2024, 1, 1))
+    new_ids = _add_records(2, created_at=datetime.datetime(2024, 6, 1))
+    with SessionLocal() as db:
+        db.query(AnalysisRecord).filter(AnalysisRecord.id == old_ids[1]).delete()
+        db.commit()
+
+    rows = _ndjson(export_records(ExportRange()))
+    assert [row["id"] for row in rows] == [old_ids[0]] + new_ids
+
+    rows = _ndjson(export_records(ExportRange(since=datetime.datetime(2024, 3, 1))))
+    assert [row["id"] for row in rows] == new_ids
+    assert rows[0]["created_at"].startswith("2024-06-01")
+
+
+def test_csv_and_gzip(clean_db):
+    ids = _add_records(2)
+    data = gzip.decompress(b"".join(export_records(ExportRange(), fmt="csv", compress=True)))
+    rows = list(csv.reader(io.StringIO(data.decode("utf-8"))))
+    assert rows[0] == ["id", "filename", "job_description_snippet", "match_score", "created_at"]
+    assert [int(row[0]) for row in rows[1:]] == ids
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        list(export_records(ExportRange(), fmt="xml"))
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight, credentials_scope, make_flight_key
+
+
+def test_make_flight_key_separates_parts():
+    assert make_flight_key("ab", "c") != make_flight_key("a", "bc")
+    assert make_flight_key("resume", "text", None) == make_flight_key("resume", "text", "")
+    assert make_flight_key("x") == make_flight_key("x")
+
+
+def test_credentials_scope():
+    assert credentials_scope(None) == "server"
+    assert credentials_scope("") == "server"
+    scope = credentials_scope("sk-abc")
+    assert scope.startswith("key:") and "sk-abc" not in scope
+    assert scope != credentials_scope("sk-abd")
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"ok": True}
+
+    async def main():
+        return await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert calls == [1]
+    assert all(result is results[0] for result in results)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_errors_are_shared_and_not_remembered():
+    flight = SingleFlight()
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0)
+        raise ValueError("boom")
+
+    async def main():
+        results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        with pytest.raises(ValueError):
+            await flight.do("k", fail)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_shared_call_survives_while_other_waiters_remain():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("k", work))
+        second = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "done"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(main())
+    assert flight.detached == 1
+    assert flight.cancelled == 0
+
+
+def test_last_waiter_leaving_cancels_shared_call():
+    flight = SingleFlight()
+    finished = []
+
+    async def work():
+        await asyncio.sleep(1)
+        finished.append(1)
+
+    async def main():
+        waiter = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert flight.cancelled == 1
+    assert finished == []
+    assert flight.stats()["in_flight"] == 0